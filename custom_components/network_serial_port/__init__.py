@@ -7,14 +7,26 @@ from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers import device_registry
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.typing import ConfigType
 
 from .coordinator import NetworkSerialPortCoordinator
-from .network_serial_process import NetworkSerialPortConfiguration, NetworkSerialProcess
+from .engines import create_engine
+from .network_serial_process import NetworkSerialPortConfiguration
+from .services import async_setup_services
 
-from .const import DOMAIN
+from .const import DATA_STATISTICS, DOMAIN
 
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.BINARY_SENSOR]
 
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the services, they are available for all config entries."""
+    async_setup_services(hass)
+    return True
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Network serial port from a config entry."""
@@ -23,18 +35,29 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     async def on_process_lost():
         if not hass.is_stopping:
+            hass.data.setdefault(DATA_STATISTICS, {})[
+                entry.entry_id
+            ] = network_serial_process.statistics
             await hass.config_entries.async_reload(entry.entry_id)
 
-    network_serial_process = NetworkSerialProcess(
-        NetworkSerialPortConfiguration.from_dict(dict(entry.data)),
+    network_serial_process = create_engine(
+        NetworkSerialPortConfiguration.from_dict({**entry.data, **entry.options}),
+        entry.entry_id,
+        # private directory for the control socket of the worker pool
+        hass.config.path(DOMAIN, "worker_pool"),
         on_process_lost=on_process_lost,
     )
 
+    # Continue the counters of a restarted bridge, sensors are TOTAL_INCREASING
+    if previous := hass.data.get(DATA_STATISTICS, {}).get(entry.entry_id):
+        network_serial_process.statistics.continue_from(previous)
+
     if not await network_serial_process.start():
         raise ConfigEntryNotReady(
             translation_domain=DOMAIN,
             translation_key="failed_to_start_process"
         )
+    hass.data.get(DATA_STATISTICS, {}).pop(entry.entry_id, None)
 
     coordinator = NetworkSerialPortCoordinator(hass, network_serial_process)
     hass.data[DOMAIN][entry.entry_id] = coordinator
@@ -50,20 +73,31 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
-    def on_connection_change():
-        coordinator.async_set_updated_data(network_serial_process)
+    network_serial_process.on_connection_change = coordinator.async_schedule_update
+    network_serial_process.on_statistics_update = coordinator.async_schedule_update
 
-    network_serial_process.on_connection_change = on_connection_change
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
 
     return True
 
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed options to the running bridge, reload when that is not possible."""
+    coordinator: NetworkSerialPortCoordinator = hass.data[DOMAIN][entry.entry_id]
+    configuration = NetworkSerialPortConfiguration.from_dict(
+        {**entry.data, **entry.options}
+    )
+    if not await coordinator.api.reconfigure(configuration):
+        await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
         coordinator: NetworkSerialPortCoordinator = hass.data[DOMAIN].pop(
             entry.entry_id
         )
+        await coordinator.async_shutdown()
         await coordinator.api.stop()
 
     return unload_ok
@@ -0,0 +1,473 @@
+"""Serial <-> TCP bridge running on an asyncio event loop.
+
+This is the in-process counterpart of tcp_serial_redirect.py. Instead of a
+separate interpreter with a reader thread per port it registers the (non
+blocking) serial file descriptor with the event loop and serves clients with
+an asyncio server.
+
+The module intentionally has no Home Assistant or package relative imports so
+it can also be loaded stand-alone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import io
+import logging
+import os
+import socket
+from typing import Any, Callable
+
+import serial  # type: ignore
+
+_LOGGER = logging.getLogger(__name__)
+
+READ_SIZE = 4096
+
+# Pause reading from the TCP client when this many bytes are waiting to be
+# written to the serial port, resume when it drained below the low mark.
+SERIAL_WRITE_HIGH_WATER = 64 * 1024
+SERIAL_WRITE_LOW_WATER = 16 * 1024
+
+# Stop reading the serial port when this many bytes are waiting to be sent to
+# the TCP client, so a stalled client does not grow the memory without bound.
+# What the device still sends stays in the driver until it drained below the
+# low mark.
+CLIENT_WRITE_HIGH_WATER = 64 * 1024
+CLIENT_WRITE_LOW_WATER = 16 * 1024
+
+# What a new client does while another one is connected, same values as
+# tcp_serial_redirect.py
+TAKEOVER_WAIT = "wait"
+TAKEOVER_NEWEST = "newest"
+TAKEOVER_REJECT = "reject"
+
+# Record directions of capture.py
+CAPTURE_SERIAL_TO_NET = 0
+CAPTURE_NET_TO_SERIAL = 1
+
+
+class _ClientProtocol(asyncio.Protocol):
+    def __init__(self, bridge: SerialBridge) -> None:
+        self._bridge = bridge
+        self.transport: asyncio.Transport | None = None
+        self.peer: str = ""
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        transport.set_write_buffer_limits(
+            high=CLIENT_WRITE_HIGH_WATER, low=CLIENT_WRITE_LOW_WATER
+        )
+        peername = transport.get_extra_info("peername")
+        self.peer = peername[0] if peername else ""
+        self._bridge._client_connected(self)
+
+    def pause_writing(self) -> None:
+        if self is self._bridge._client:
+            self._bridge._pause_serial()
+
+    def resume_writing(self) -> None:
+        if self is self._bridge._client:
+            self._bridge._resume_serial()
+
+    def data_received(self, data: bytes) -> None:
+        if self._bridge.low_latency:
+            set_quickack(self.transport)
+        self._bridge._write_serial(data)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._bridge._client_disconnected(self)
+
+
+class SerialBridge:
+    """Forward data between a serial port and a single TCP client.
+
+    Like tcp_serial_redirect.py only one client is served at a time, other
+    clients that connect are kept waiting (not read from) until the active
+    client disconnects. With the newest takeover policy a new client
+    disconnects the active one instead, with reject it is disconnected.
+    While the client does not keep up the serial port is not read.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        localport: int,
+        *,
+        baudrate: int = 115200,
+        bytesize: int = 8,
+        parity: str = serial.PARITY_NONE,
+        stopbits: float = 1,
+        rtscts: bool = False,
+        xonxoff: bool = False,
+        rts: int | None = None,
+        dtr: bool | None = None,
+        low_latency: bool = False,
+        takeover: str = TAKEOVER_WAIT,
+        keepalive_idle: int = 1,
+        user_timeout: int = 0,
+        on_client_connected: Callable[[str], None] | None = None,
+        on_client_disconnected: Callable[[], None] | None = None,
+        on_serial_lost: Callable[[Exception | None], None] | None = None,
+        resolve_url: Callable[[str], str] | None = None,
+    ) -> None:
+        self._url = url
+        # e.g. resolves hwgrep:// from a cache, called in the executor
+        self._resolve_url = resolve_url
+        self._localport = localport
+        self._serial_settings = {
+            "baudrate": baudrate,
+            "bytesize": bytesize,
+            "parity": parity,
+            "stopbits": stopbits,
+            "rtscts": rtscts,
+            "xonxoff": xonxoff,
+        }
+        self._rts = rts
+        self._dtr = dtr
+        self.low_latency = low_latency
+        self.takeover = takeover
+        self.keepalive_idle = keepalive_idle
+        self.user_timeout = user_timeout
+        # CaptureRing from capture.py while capturing the traffic
+        self.capture: Any = None
+
+        self.on_client_connected = on_client_connected
+        self.on_client_disconnected = on_client_disconnected
+        self.on_serial_lost = on_serial_lost
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._serial: serial.Serial | None = None
+        self._fd: int | None = None
+        self._server: asyncio.Server | None = None
+        self._client: _ClientProtocol | None = None
+        self._waiting_clients: deque[_ClientProtocol] = deque()
+        self._serial_write_buffer = bytearray()
+        # not read while the client does not keep up
+        self._serial_paused = False
+        # kept, so the task is not garbage collected before it is done
+        self._stop_task: asyncio.Task | None = None
+
+        self.bytes_from_serial = 0
+        self.chunks_from_serial = 0
+        self.bytes_to_serial = 0
+        self.chunks_to_serial = 0
+        self.connects = 0
+        self.takeovers = 0
+        self.rejects = 0
+        self.high_water = 0
+        self.flow_pauses = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._fd is not None and self._server is not None
+
+    def statistics(self) -> dict[str, int]:
+        """Traffic totals, same keys as the tcp_serial_redirect.py statistics event."""
+        return {
+            "serial_to_net_bytes": self.bytes_from_serial,
+            "serial_to_net_chunks": self.chunks_from_serial,
+            "net_to_serial_bytes": self.bytes_to_serial,
+            "net_to_serial_chunks": self.chunks_to_serial,
+            "high_water": self.high_water,
+            "connects": self.connects,
+            "takeovers": self.takeovers,
+            "rejects": self.rejects,
+            "flow_pauses": self.flow_pauses,
+        }
+
+    async def start(self) -> None:
+        """Open the serial port and start listening.
+
+        Raises serial.SerialException or OSError when the serial port can not
+        be opened or the TCP port can not be bound.
+        """
+        self._loop = asyncio.get_running_loop()
+        ser = await self._loop.run_in_executor(None, self._open_serial)
+        self._serial = ser
+
+        try:
+            fd = ser.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            await self._loop.run_in_executor(None, ser.close)
+            raise serial.SerialException(
+                f"{self._url} has no file descriptor, use the process engine instead"
+            )
+        self._fd = fd
+        os.set_blocking(fd, False)
+        self._loop.add_reader(fd, self._serial_readable)
+
+        try:
+            self._server = await self._listen(self._localport)
+        except OSError:
+            await self._close_serial()
+            raise
+
+        _LOGGER.debug("Waiting for connection on %s", self._localport)
+
+    async def reconfigure(self, settings: dict[str, Any]) -> None:
+        """Apply changed settings while running, clients stay connected.
+
+        Serial settings are applied to the open port, when localport changed
+        the server moves to the new port. Raises OSError when the new port can
+        not be bound, the old port is kept then.
+        """
+        assert self._loop is not None and self._serial is not None
+        localport = settings.get("localport", self._localport)
+        if localport != self._localport:
+            server = await self._listen(localport)
+            if self._server is not None:
+                # Only stops listening, connected clients are kept
+                self._server.close()
+            self._server = server
+            self._localport = localport
+            _LOGGER.debug("Waiting for connection on %s", self._localport)
+
+        for key in self._serial_settings:
+            if key in settings:
+                self._serial_settings[key] = settings[key]
+        self._rts = settings.get("rts", self._rts)
+        self._dtr = settings.get("dtr", self._dtr)
+        await self._loop.run_in_executor(None, self._apply_serial_settings, self._serial)
+
+    async def _listen(self, port: int) -> asyncio.Server:
+        assert self._loop is not None
+        return await self._loop.create_server(
+            lambda: _ClientProtocol(self),
+            host="",
+            port=port,
+            family=socket.AF_INET,
+            reuse_address=True,
+        )
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+        for protocol in (self._client, *self._waiting_clients):
+            if protocol is not None and protocol.transport is not None:
+                protocol.transport.abort()
+        self._client = None
+        self._waiting_clients.clear()
+
+        await self._close_serial()
+
+    def _open_serial(self) -> serial.Serial:
+        url = self._resolve_url(self._url) if self._resolve_url else self._url
+        ser = serial.serial_for_url(url, do_not_open=True)
+        self._apply_serial_settings(ser)
+        ser.open()
+        if self.low_latency:
+            try:
+                # sets ASYNC_LOW_LATENCY on Linux, only available for real ports
+                ser.set_low_latency_mode(True)
+            except (AttributeError, NotImplementedError, ValueError, OSError) as e:
+                _LOGGER.warning("Low latency mode not supported by %s: %s", self._url, e)
+        return ser
+
+    def _apply_serial_settings(self, ser: serial.Serial) -> None:
+        ser.apply_settings(self._serial_settings)
+        if self._rts is not None:
+            ser.rts = self._rts
+        if self._dtr is not None:
+            ser.dtr = self._dtr
+
+    async def _close_serial(self) -> None:
+        assert self._loop is not None
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._loop.remove_writer(self._fd)
+            self._fd = None
+        self._serial_write_buffer.clear()
+        if self._serial is not None:
+            ser, self._serial = self._serial, None
+            await self._loop.run_in_executor(None, ser.close)
+
+    def _serial_lost(self, exc: Exception | None) -> None:
+        if self._fd is None:
+            return
+        _LOGGER.debug("Serial port lost: %s", exc)
+        assert self._loop is not None
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self._fd = None
+        self._stop_task = self._loop.create_task(self.stop())
+        if self.on_serial_lost:
+            self.on_serial_lost(exc)
+
+    def _serial_readable(self) -> None:
+        assert self._fd is not None
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._serial_lost(e)
+            return
+
+        if not data:
+            # A tty returns EOF on hangup, e.g. USB adapter unplugged
+            self._serial_lost(None)
+            return
+
+        self.bytes_from_serial += len(data)
+        self.chunks_from_serial += 1
+        if self.capture is not None:
+            self.capture.write(CAPTURE_SERIAL_TO_NET, data)
+        if self._client is not None and self._client.transport is not None:
+            self._client.transport.write(data)
+            buffered = self._client.transport.get_write_buffer_size()
+            if buffered > self.high_water:
+                self.high_water = buffered
+
+    def _pause_serial(self) -> None:
+        if self._fd is None or self._serial_paused:
+            return
+        assert self._loop is not None
+        _LOGGER.debug("Client does not keep up, pausing the serial port")
+        self._serial_paused = True
+        self.flow_pauses += 1
+        self._loop.remove_reader(self._fd)
+
+    def _resume_serial(self) -> None:
+        if not self._serial_paused:
+            return
+        self._serial_paused = False
+        if self._fd is not None:
+            assert self._loop is not None
+            self._loop.add_reader(self._fd, self._serial_readable)
+
+    def _write_serial(self, data: bytes) -> None:
+        if self._fd is None:
+            return
+
+        self.bytes_to_serial += len(data)
+        self.chunks_to_serial += 1
+        if self.capture is not None:
+            self.capture.write(CAPTURE_NET_TO_SERIAL, data)
+        if not self._serial_write_buffer:
+            try:
+                written = os.write(self._fd, data)
+            except (BlockingIOError, InterruptedError):
+                written = 0
+            except OSError as e:
+                self._serial_lost(e)
+                return
+            if written == len(data):
+                return
+            data = data[written:]
+            assert self._loop is not None
+            self._loop.add_writer(self._fd, self._serial_writable)
+
+        self._serial_write_buffer += data
+        if len(self._serial_write_buffer) > SERIAL_WRITE_HIGH_WATER and self._client:
+            assert self._client.transport is not None
+            self._client.transport.pause_reading()
+
+    def _serial_writable(self) -> None:
+        assert self._fd is not None and self._loop is not None
+        try:
+            written = os.write(self._fd, self._serial_write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._serial_lost(e)
+            return
+
+        del self._serial_write_buffer[:written]
+        if not self._serial_write_buffer:
+            self._loop.remove_writer(self._fd)
+        if len(self._serial_write_buffer) < SERIAL_WRITE_LOW_WATER and self._client:
+            assert self._client.transport is not None
+            self._client.transport.resume_reading()
+
+    def _client_connected(self, protocol: _ClientProtocol) -> None:
+        assert protocol.transport is not None
+        sock = protocol.transport.get_extra_info("socket")
+        if sock is not None:
+            configure_client_socket(sock, self.keepalive_idle, self.user_timeout)
+            if self.low_latency:
+                set_quickack(protocol.transport)
+
+        if self._client is not None and self.takeover == TAKEOVER_REJECT:
+            _LOGGER.debug("Client %s rejected, port in use", protocol.peer)
+            self.rejects += 1
+            protocol.transport.abort()
+            return
+
+        if self._client is not None and self.takeover == TAKEOVER_NEWEST:
+            _LOGGER.debug("Client %s takes over from %s", protocol.peer, self._client.peer)
+            self.takeovers += 1
+            # Activated first when the previous client is gone
+            protocol.transport.pause_reading()
+            self._waiting_clients.appendleft(protocol)
+            assert self._client.transport is not None
+            self._client.transport.abort()
+            return
+
+        if self._client is not None:
+            _LOGGER.debug("Client %s waiting, port in use", protocol.peer)
+            protocol.transport.pause_reading()
+            self._waiting_clients.append(protocol)
+            return
+
+        self._activate_client(protocol)
+
+    def _activate_client(self, protocol: _ClientProtocol) -> None:
+        assert protocol.transport is not None
+        _LOGGER.debug("Connected by %s", protocol.peer)
+        self._client = protocol
+        self.connects += 1
+        protocol.transport.resume_reading()
+        if self.on_client_connected:
+            self.on_client_connected(protocol.peer)
+
+    def _client_disconnected(self, protocol: _ClientProtocol) -> None:
+        if protocol is not self._client:
+            if protocol in self._waiting_clients:
+                self._waiting_clients.remove(protocol)
+            return
+
+        _LOGGER.debug("Disconnected")
+        self._client = None
+        self._resume_serial()
+        self._serial_write_buffer.clear()
+        if self._fd is not None and self._loop is not None:
+            self._loop.remove_writer(self._fd)
+        if self.on_client_disconnected:
+            self.on_client_disconnected()
+
+        if self._waiting_clients:
+            self._activate_client(self._waiting_clients.popleft())
+
+
+def configure_client_socket(
+    sock: socket.socket, keepalive_idle: int = 1, user_timeout: int = 0
+) -> None:
+    """Apply the same socket options as tcp_serial_redirect.py."""
+    # More quickly detect bad clients who quit without closing the
+    # connection: After keepalive_idle seconds of idle, start sending TCP
+    # keep-alive packets every 1 second. If 3 consecutive keep-alive packets
+    # fail, assume the client is gone and close the connection.
+    if keepalive_idle > 0:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, keepalive_idle)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 1)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except AttributeError:
+            pass  # not available on windows
+    if user_timeout > 0 and hasattr(socket, "TCP_USER_TIMEOUT"):
+        # Also close when sent data is not acknowledged, keep-alive does not
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, user_timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def set_quickack(transport: asyncio.BaseTransport | None) -> None:
+    """Acknowledge received data immediately, Linux resets this after reads."""
+    if transport is None or not hasattr(socket, "TCP_QUICKACK"):
+        return
+    if (sock := transport.get_extra_info("socket")) is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
@@ -11,12 +11,12 @@ from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .coordinator import NetworkSerialPortCoordinator
 from .const import DOMAIN
-from .network_serial_process import NetworkSerialProcess
+from .engines import NetworkSerialEngine
 
 
 @dataclass(frozen=True, kw_only=True)
 class NetworkSerialPortEntityBinarySensorDescription(BinarySensorEntityDescription):
-    is_on: Callable[[NetworkSerialProcess], bool] = None  # type: ignore[assignment]
+    is_on: Callable[[NetworkSerialEngine], bool] = None  # type: ignore[assignment]
 
 
 ENTITY_DESCRIPTIONS = [
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""\
+Traffic capture into a fixed size, memory mapped ring file, and an exporter
+to pcap or a plain text hexdump.
+
+No package relative imports, tcp_serial_redirect.py imports it as a sibling
+module.
+
+File layout: a header followed by the data area. The data area holds
+records (timestamp, direction, length, data) back to back. When a record
+does not fit before the end of the data area the rest is padding and
+writing continues at the start, overwriting the oldest records.
+
+Export a capture with:
+
+    python3 capture.py network_serial_port.capture --format pcap -o out.pcap
+"""
+
+import argparse
+import datetime
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b'NSPC'
+VERSION = 1
+
+# magic, version, data area size, head (next write), tail (oldest record), used bytes
+HEADER = struct.Struct('<4sIIIII')
+HEADER_SIZE = 32
+# timestamp, direction, length
+RECORD = struct.Struct('<dB3xI')
+
+DIRECTION_SERIAL_TO_NET = 0
+DIRECTION_NET_TO_SERIAL = 1
+# marks the padding at the end of the data area
+DIRECTION_WRAP = 0xff
+
+DIRECTION_NAMES = {
+    DIRECTION_SERIAL_TO_NET: 'serial->net',
+    DIRECTION_NET_TO_SERIAL: 'net->serial',
+}
+
+DEFAULT_CAPTURE_SIZE = 1024 * 1024
+
+# pcap: LINKTYPE_USER0, every packet starts with the direction byte
+PCAP_HEADER = struct.Struct('<IHHiIII')
+PCAP_RECORD = struct.Struct('<IIII')
+PCAP_LINKTYPE_USER0 = 147
+
+
+class CaptureRing(object):
+    """\
+    Writes timestamped, direction tagged chunks to a memory mapped file of
+    fixed size. Nothing is allocated per chunk, the data is copied straight
+    into the mapping. Thread safe.
+    """
+
+    def __init__(self, path, size=DEFAULT_CAPTURE_SIZE):
+        if size < RECORD.size * 2:
+            raise ValueError('capture size too small')
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        # None when closed
+        self._mmap: mmap.mmap | None = None
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o640)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + size)
+            buffer = mmap.mmap(fd, HEADER_SIZE + size)
+        finally:
+            os.close(fd)
+        self._mmap = buffer
+        self._head = 0
+        self._tail = 0
+        self._used = 0
+        self._store_header(buffer)
+
+    def write(self, direction, data):
+        """Add a record, the oldest records are overwritten when full"""
+        length = min(len(data), self.size - RECORD.size)
+        needed = RECORD.size + length
+        with self._lock:
+            buffer = self._mmap
+            if buffer is None:
+                return
+            if self._head + needed > self.size:
+                # the rest of the data area is padding, continue at the start
+                padding = self.size - self._head
+                self._make_room(buffer, padding)
+                if padding >= RECORD.size:
+                    RECORD.pack_into(buffer, HEADER_SIZE + self._head, 0, DIRECTION_WRAP, 0)
+                self._used += padding
+                self._head = 0
+            self._make_room(buffer, needed)
+            start = HEADER_SIZE + self._head
+            RECORD.pack_into(buffer, start, time.time(), direction, length)
+            buffer[start + RECORD.size:start + needed] = data[:length]
+            self._head = (self._head + needed) % self.size
+            self._used += needed
+            self._store_header(buffer)
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+                self._mmap.close()
+                self._mmap = None
+
+    def _make_room(self, buffer, needed):
+        # drop the oldest records until needed bytes are free after head
+        while self.size - self._used < needed:
+            if self.size - self._tail < RECORD.size:
+                dropped = self.size - self._tail
+            else:
+                _, direction, length = RECORD.unpack_from(buffer, HEADER_SIZE + self._tail)
+                if direction == DIRECTION_WRAP:
+                    dropped = self.size - self._tail
+                else:
+                    dropped = RECORD.size + length
+            self._tail = (self._tail + dropped) % self.size
+            self._used -= dropped
+
+    def _store_header(self, buffer):
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, self.size, self._head, self._tail, self._used)
+
+
+def read_records(path):
+    """Returns the (timestamp, direction, data) records of a capture file, oldest first"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    magic, version, size, head, tail, used = HEADER.unpack_from(content)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not a capture file'.format(path))
+    records = []
+    position = tail
+    while used > 0:
+        if size - position < RECORD.size:
+            used -= size - position
+            position = 0
+            continue
+        timestamp, direction, length = RECORD.unpack_from(content, HEADER_SIZE + position)
+        if direction == DIRECTION_WRAP:
+            used -= size - position
+            position = 0
+            continue
+        start = HEADER_SIZE + position + RECORD.size
+        records.append((timestamp, direction, content[start:start + length]))
+        used -= RECORD.size + length
+        position = (position + RECORD.size + length) % size
+    return records
+
+
+def export_pcap(records, output):
+    """\
+    Write records as pcap with link type USER0. The first byte of every
+    packet is the direction, 0 serial->net and 1 net->serial.
+    """
+    output.write(PCAP_HEADER.pack(0xa1b2c3d4, 2, 4, 0, 0, 65535, PCAP_LINKTYPE_USER0))
+    for timestamp, direction, data in records:
+        seconds = int(timestamp)
+        output.write(PCAP_RECORD.pack(
+            seconds, int((timestamp - seconds) * 1e6), len(data) + 1, len(data) + 1))
+        output.write(bytes([direction]))
+        output.write(data)
+
+
+def export_hexdump(records, output):
+    """Write records as text, a line with time and direction followed by the hexdump"""
+    for timestamp, direction, data in records:
+        output.write('{} {} {} bytes\n'.format(
+            datetime.datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='microseconds'),
+            DIRECTION_NAMES.get(direction, direction),
+            len(data)))
+        for offset in range(0, len(data), 16):
+            line = data[offset:offset + 16]
+            output.write('  {:04x}  {:<48} {}\n'.format(
+                offset,
+                ' '.join('{:02x}'.format(b) for b in line),
+                ''.join(chr(b) if 32 <= b < 127 else '.' for b in line)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export a network serial port capture file.')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument(
+        '--format',
+        choices=['pcap', 'hexdump'],
+        default='hexdump',
+        help='output format, default: %(default)s')
+    parser.add_argument(
+        '-o', '--output',
+        help='output file, default: standard output')
+    args = parser.parse_args()
+
+    records = read_records(args.capture)
+    if args.format == 'pcap':
+        if args.output:
+            with open(args.output, 'wb') as output:
+                export_pcap(records, output)
+        else:
+            export_pcap(records, sys.stdout.buffer)
+    elif args.output:
+        with open(args.output, 'w') as output:
+            export_hexdump(records, output)
+    else:
+        export_hexdump(records, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,49 +2,263 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import Any
 
 import voluptuous as vol  # type: ignore
 
 from homeassistant import config_entries
-from homeassistant.core import HomeAssistant
-from homeassistant.config_entries import ConfigFlowResult
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.config_entries import ConfigEntry, ConfigFlowResult, OptionsFlow
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.selector import (
+    SelectOptionDict,
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
+)
 
-from .network_serial_process import (
-    NetworkSerialPortConfiguration,
-    NetworkSerialProcess,
+from .discovery import comports, hwgrep_url
+from .network_serial_process import NetworkSerialPortConfiguration
+from .probe import (
+    SERIAL_PROBE_TIMEOUT,
+    probe_client,
+    probe_clients,
+    probe_compress,
+    probe_metrics_port,
+    probe_on_demand,
+    probe_serial,
+    probe_slow_client_policy,
+    probe_tcp_port,
+    probe_unix_socket,
 )
 
-from .const import CONF_BAUDRATE, CONF_SERIAL_URL, CONF_TCP_PORT, DOMAIN
+from .const import (
+    CONF_BAUDRATE,
+    CONF_CLIENT,
+    CONF_CLIENT_QUEUE_SIZE,
+    CONF_COALESCE_SIZE,
+    CONF_COALESCE_WINDOW,
+    CONF_COMPRESS,
+    CONF_COMPRESS_FLUSH,
+    CONF_ENGINE,
+    CONF_FLOW_CONTROL,
+    CONF_FRAMING,
+    CONF_IDLE_CLOSE,
+    CONF_KEEPALIVE_IDLE,
+    CONF_LOW_LATENCY,
+    CONF_MAX_CLIENTS,
+    CONF_METRICS_PORT,
+    CONF_ON_DEMAND,
+    CONF_RECV_SIZE,
+    CONF_SERIAL_URL,
+    CONF_SLOW_CLIENT_POLICY,
+    CONF_SPLICE,
+    CONF_TAKEOVER,
+    CONF_TCP_PORT,
+    CONF_UNIX_SOCKET,
+    CONF_UNIX_SOCKET_MODE,
+    CONF_USER_TIMEOUT,
+    CONF_WRITE_MODE,
+    DOMAIN,
+    ENGINE_ASYNCIO,
+    ENGINE_PROCESS,
+    ENGINE_WORKER_POOL,
+    FLOW_CONTROL_NONE,
+    FLOW_CONTROL_RTSCTS,
+    FLOW_CONTROL_XONXOFF,
+    FRAMING_COBS,
+    FRAMING_CRLF,
+    FRAMING_LF,
+    FRAMING_NONE,
+    FRAMING_SILENCE,
+    FRAMING_SLIP,
+    SLOW_CLIENT_BLOCK,
+    SLOW_CLIENT_DISCONNECT,
+    SLOW_CLIENT_DROP_OLDEST,
+    TAKEOVER_NEWEST,
+    TAKEOVER_REJECT,
+    TAKEOVER_WAIT,
+    WRITE_MODE_IMMEDIATE,
+    WRITE_MODE_THROUGHPUT,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
-STEP_USER_DATA_SCHEMA = vol.Schema(
+# Everything but the serial port can be changed later through the options
+OPTIONS_SCHEMA = vol.Schema(
     {
-        vol.Required(CONF_SERIAL_URL): str,
         vol.Required(CONF_BAUDRATE): int,
         vol.Required(CONF_TCP_PORT): int,
+        vol.Optional(CONF_CLIENT, default=""): str,
+        vol.Optional(CONF_UNIX_SOCKET, default=""): str,
+        vol.Optional(CONF_UNIX_SOCKET_MODE, default="660"): vol.Match(r"^[0-7]{3,4}$"),
+        vol.Optional(CONF_ENGINE, default=ENGINE_PROCESS): vol.In(
+            [ENGINE_PROCESS, ENGINE_ASYNCIO, ENGINE_WORKER_POOL]
+        ),
+        vol.Optional(CONF_FLOW_CONTROL, default=FLOW_CONTROL_NONE): vol.In(
+            [FLOW_CONTROL_NONE, FLOW_CONTROL_RTSCTS, FLOW_CONTROL_XONXOFF]
+        ),
+        vol.Optional(CONF_MAX_CLIENTS, default=1): vol.All(int, vol.Range(min=1)),
+        vol.Optional(CONF_SLOW_CLIENT_POLICY, default=SLOW_CLIENT_DROP_OLDEST): vol.In(
+            [SLOW_CLIENT_DROP_OLDEST, SLOW_CLIENT_DISCONNECT, SLOW_CLIENT_BLOCK]
+        ),
+        vol.Optional(CONF_CLIENT_QUEUE_SIZE, default=65536): vol.All(
+            int, vol.Range(min=1024)
+        ),
+        vol.Optional(CONF_TAKEOVER, default=TAKEOVER_WAIT): vol.In(
+            [TAKEOVER_WAIT, TAKEOVER_NEWEST, TAKEOVER_REJECT]
+        ),
+        vol.Optional(CONF_KEEPALIVE_IDLE, default=1): vol.All(
+            int, vol.Range(min=0, max=7200)
+        ),
+        vol.Optional(CONF_USER_TIMEOUT, default=0): vol.All(
+            int, vol.Range(min=0, max=600000)
+        ),
+        vol.Optional(CONF_WRITE_MODE, default=WRITE_MODE_IMMEDIATE): vol.In(
+            [WRITE_MODE_IMMEDIATE, WRITE_MODE_THROUGHPUT]
+        ),
+        vol.Optional(CONF_RECV_SIZE, default=1024): vol.All(
+            int, vol.Range(min=1, max=65536)
+        ),
+        vol.Optional(CONF_COALESCE_SIZE, default=4096): vol.All(
+            int, vol.Range(min=1, max=65536)
+        ),
+        vol.Optional(CONF_COALESCE_WINDOW, default=2): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=1000)
+        ),
+        vol.Optional(CONF_LOW_LATENCY, default=False): bool,
+        vol.Optional(CONF_SPLICE, default=False): bool,
+        vol.Optional(CONF_FRAMING, default=FRAMING_NONE): vol.In(
+            [
+                FRAMING_NONE,
+                FRAMING_SILENCE,
+                FRAMING_LF,
+                FRAMING_CRLF,
+                FRAMING_SLIP,
+                FRAMING_COBS,
+            ]
+        ),
+        vol.Optional(CONF_METRICS_PORT, default=0): vol.All(
+            int, vol.Range(min=0, max=65535)
+        ),
+        vol.Optional(CONF_ON_DEMAND, default=False): bool,
+        vol.Optional(CONF_IDLE_CLOSE, default=30): vol.All(
+            int, vol.Range(min=0, max=86400)
+        ),
+        vol.Optional(CONF_COMPRESS, default=False): bool,
+        vol.Optional(CONF_COMPRESS_FLUSH, default=10): vol.All(
+            int, vol.Range(min=0, max=1000)
+        ),
     }
 )
 
+STEP_USER_DATA_SCHEMA = vol.Schema({vol.Required(CONF_SERIAL_URL): str}).extend(
+    OPTIONS_SCHEMA.schema
+)
+
+
+def serial_port_options() -> list[SelectOptionDict]:
+    """Detected serial ports, with a URL that still works when the device name changes."""
+    ports = comports()
+    return [
+        SelectOptionDict(
+            value=hwgrep_url(port, ports), label=f"{port.device} - {port.description}"
+        )
+        for port in ports
+    ]
+
+
+def user_data_schema(options: list[SelectOptionDict]) -> vol.Schema:
+    """Offer the detected ports, any other path or URL can still be entered."""
+    if not options:
+        return STEP_USER_DATA_SCHEMA
+    return vol.Schema(
+        {
+            vol.Required(CONF_SERIAL_URL): SelectSelector(
+                SelectSelectorConfig(
+                    options=options,
+                    custom_value=True,
+                    mode=SelectSelectorMode.DROPDOWN,
+                )
+            )
+        }
+    ).extend(OPTIONS_SCHEMA.schema)
 
-async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str, Any]:
+
+async def validate_input(
+    hass: HomeAssistant, data: dict[str, Any], current: dict[str, Any] | None = None
+) -> dict[str, Any]:
     """Validate the user input allows us to connect.
 
     Data has the keys from STEP_USER_DATA_SCHEMA with values provided by the user.
+    Current are the settings of the running bridge when changing the options,
+    the serial port and sockets it holds are not reported as in use.
     """
-    # validate the data can be used to set up a connection.
+    # validate the data can be used to set up a connection, checks the serial
+    # port and TCP port in parallel instead of starting a bridge.
+    configuration = NetworkSerialPortConfiguration.from_dict(data)
+    serial_probe = None
+    if current is None:
+        serial_probe = hass.async_add_executor_job(probe_serial, configuration)
+
+    def held(key: str) -> bool:
+        """The running bridge already uses this setting."""
+        return current is not None and current.get(key) == data.get(key)
+
+    def probe_settings() -> dict[str, str]:
+        """Bind and connect like the bridge would, runs in the executor."""
+        errors: dict[str, str] = {}
+        if configuration.client:
+            # Connects out instead of listening, so the TCP port is not used
+            if error := probe_client(configuration):
+                errors[CONF_CLIENT] = error
+        else:
+            if configuration.unix_socket and (
+                error := probe_unix_socket(configuration)
+            ):
+                if not (error == "unix_socket_path_in_use" and held(CONF_UNIX_SOCKET)):
+                    errors[CONF_UNIX_SOCKET] = error
+            if data[CONF_TCP_PORT] == 0:
+                # Only listens on the Unix domain socket
+                if not configuration.unix_socket:
+                    errors[CONF_TCP_PORT] = "tcp_port_required"
+            elif error := probe_tcp_port(data[CONF_TCP_PORT]):
+                if not (error == "tcp_port_in_use" and held(CONF_TCP_PORT)):
+                    errors[CONF_TCP_PORT] = error
+        if configuration.metrics_port and (error := probe_metrics_port(configuration)):
+            if not (error == "tcp_port_in_use" and held(CONF_METRICS_PORT)):
+                errors[CONF_METRICS_PORT] = error
+        if configuration.max_clients != 1 and (error := probe_clients(configuration)):
+            errors[CONF_MAX_CLIENTS] = error
+        if configuration.slow_client_policy != SLOW_CLIENT_DROP_OLDEST and (
+            error := probe_slow_client_policy(configuration)
+        ):
+            errors[CONF_SLOW_CLIENT_POLICY] = error
+        if configuration.on_demand and (error := probe_on_demand(configuration)):
+            errors[CONF_ON_DEMAND] = error
+        if configuration.compress and (error := probe_compress(configuration)):
+            errors[CONF_COMPRESS] = error
+        return errors
 
-    network_serial_process = NetworkSerialProcess(
-        NetworkSerialPortConfiguration.from_dict(data)
-    )
-    if not await network_serial_process.start():
-        raise CannotConnect
-    await network_serial_process.stop()
+    # the sockets are bound and connected in the executor, not on the event loop
+    errors = await hass.async_add_executor_job(probe_settings)
+    try:
+        if serial_probe is not None and (
+            error := await asyncio.wait_for(serial_probe, SERIAL_PROBE_TIMEOUT)
+        ):
+            errors[CONF_SERIAL_URL] = error
+    except asyncio.TimeoutError:
+        errors[CONF_SERIAL_URL] = "serial_timeout"
+    if errors:
+        raise CannotConnect(errors)
 
     # Return info that you want to store in the config entry.
+    if configuration.client:
+        return {"title": f"{data['serial_url']} to {configuration.client}"}
+    if data[CONF_TCP_PORT] == 0:
+        return {"title": f"{data['serial_url']} @ {configuration.unix_socket}"}
     return {"title": f"{data['serial_url']} @ port {data['tcp_port']}"}
 
 
@@ -61,8 +275,8 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         if user_input is not None:
             try:
                 info = await validate_input(self.hass, user_input)
-            except CannotConnect:
-                errors["base"] = "cannot_connect"
+            except CannotConnect as e:
+                errors = e.errors
             # except InvalidAuth:
             #     errors["base"] = "invalid_auth"
             except Exception:  # pylint: disable=broad-except
@@ -71,10 +285,47 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             else:
                 return self.async_create_entry(title=info["title"], data=user_input)
 
+        # Cached, only enumerated again when serial devices were added or removed
+        options = await self.hass.async_add_executor_job(serial_port_options)
         return self.async_show_form(
             step_id="user",
             data_schema=self.add_suggested_values_to_schema(
-                STEP_USER_DATA_SCHEMA, user_input
+                user_data_schema(options), user_input
+            ),
+            errors=errors,
+        )
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry: ConfigEntry) -> OptionsFlow:
+        """Get the options flow for this handler."""
+        return OptionsFlowHandler()
+
+
+class OptionsFlowHandler(OptionsFlow):
+    """Handle options, applied to the running bridge by the update listener."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Manage the options."""
+        errors: dict[str, str] = {}
+        current = {**self.config_entry.data, **self.config_entry.options}
+        if user_input is not None:
+            try:
+                await validate_input(self.hass, {**current, **user_input}, current)
+            except CannotConnect as e:
+                errors = e.errors
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unexpected exception")
+                errors["base"] = "unknown"
+            else:
+                return self.async_create_entry(data=user_input)
+
+        return self.async_show_form(
+            step_id="init",
+            data_schema=self.add_suggested_values_to_schema(
+                OPTIONS_SCHEMA, user_input or current
             ),
             errors=errors,
         )
@@ -83,6 +334,11 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 class CannotConnect(HomeAssistantError):
     """Error to indicate we cannot connect."""
 
+    def __init__(self, errors: dict[str, str] | None = None) -> None:
+        """Errors per field, defaults to a generic error."""
+        super().__init__()
+        self.errors = errors or {"base": "cannot_connect"}
+
 
 class InvalidAuth(HomeAssistantError):
     """Error to indicate there is invalid auth."""
@@ -3,9 +3,68 @@
 import logging
 
 DOMAIN = "network_serial_port"
+# Statistics of bridges that are restarted, per config entry id, so the
+# counters of the new bridge continue from their totals
+DATA_STATISTICS = f"{DOMAIN}_statistics"
 
 LOGGER = logging.getLogger(__package__)
 
+# Minimum time in seconds between entity state updates
+MIN_UPDATE_INTERVAL = 5
+
 CONF_SERIAL_URL = "serial_url"
 CONF_BAUDRATE = "baudrate"
 CONF_TCP_PORT = "tcp_port"
+CONF_UNIX_SOCKET = "unix_socket"
+CONF_UNIX_SOCKET_MODE = "unix_socket_mode"
+CONF_CLIENT = "client"
+CONF_ENGINE = "engine"
+CONF_MAX_CLIENTS = "max_clients"
+CONF_SLOW_CLIENT_POLICY = "slow_client_policy"
+CONF_CLIENT_QUEUE_SIZE = "client_queue_size"
+CONF_WRITE_MODE = "write_mode"
+CONF_RECV_SIZE = "recv_size"
+CONF_COALESCE_SIZE = "coalesce_size"
+CONF_COALESCE_WINDOW = "coalesce_window"
+CONF_LOW_LATENCY = "low_latency"
+CONF_SPLICE = "splice"
+CONF_FRAMING = "framing"
+CONF_METRICS_PORT = "metrics_port"
+CONF_COMPRESS = "compress"
+CONF_COMPRESS_FLUSH = "compress_flush"
+CONF_FLOW_CONTROL = "flow_control"
+CONF_TAKEOVER = "takeover"
+CONF_KEEPALIVE_IDLE = "keepalive_idle"
+CONF_USER_TIMEOUT = "user_timeout"
+CONF_ON_DEMAND = "on_demand"
+CONF_IDLE_CLOSE = "idle_close"
+
+ENGINE_PROCESS = "process"
+ENGINE_ASYNCIO = "asyncio"
+ENGINE_WORKER_POOL = "worker_pool"
+
+SLOW_CLIENT_DROP_OLDEST = "drop-oldest"
+SLOW_CLIENT_DISCONNECT = "disconnect"
+SLOW_CLIENT_BLOCK = "block"
+
+TAKEOVER_WAIT = "wait"
+TAKEOVER_NEWEST = "newest"
+TAKEOVER_REJECT = "reject"
+
+FLOW_CONTROL_NONE = "none"
+FLOW_CONTROL_RTSCTS = "rtscts"
+FLOW_CONTROL_XONXOFF = "xonxoff"
+
+WRITE_MODE_IMMEDIATE = "immediate"
+WRITE_MODE_THROUGHPUT = "throughput"
+
+# Same values as framing.py, which can not import this package
+FRAMING_NONE = "none"
+FRAMING_SILENCE = "silence"
+FRAMING_LF = "lf"
+FRAMING_CRLF = "crlf"
+FRAMING_SLIP = "slip"
+FRAMING_COBS = "cobs"
+
+# Default size of the capture ring file in bytes, same as capture.py
+DEFAULT_CAPTURE_SIZE = 1024 * 1024
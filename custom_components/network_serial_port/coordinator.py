@@ -1,17 +1,21 @@
 """Coordinator for the Network Serial Port integration."""
 
+import time
+
+from homeassistant.core import CALLBACK_TYPE, callback
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
 )
 
-from .const import LOGGER
-from .network_serial_process import NetworkSerialProcess
+from .const import LOGGER, MIN_UPDATE_INTERVAL
+from .engines import NetworkSerialEngine
 
 
-class NetworkSerialPortCoordinator(DataUpdateCoordinator[NetworkSerialProcess]):
+class NetworkSerialPortCoordinator(DataUpdateCoordinator[NetworkSerialEngine]):
     """My custom coordinator."""
 
-    def __init__(self, hass, api: NetworkSerialProcess):
+    def __init__(self, hass, api: NetworkSerialEngine):
         """Initialize my coordinator."""
         super().__init__(
             hass,
@@ -21,3 +25,39 @@ class NetworkSerialPortCoordinator(DataUpdateCoordinator[NetworkSerialProcess]):
         )
         self.api = api
         self.data = api  # Can just read data directly from API
+        self._last_update = 0.0
+        self._unsub_update: CALLBACK_TYPE | None = None
+
+    @callback
+    def async_schedule_update(self) -> None:
+        """Push the API state to the entities at most once per MIN_UPDATE_INTERVAL.
+
+        An update outside the interval is pushed immediately, updates within
+        the interval are combined into one update at the end of it. This keeps
+        a flapping client or high rate statistics from flooding the state machine.
+        """
+        if self._unsub_update is not None:
+            return
+        delay = self._last_update + MIN_UPDATE_INTERVAL - time.monotonic()
+        if delay <= 0:
+            self._async_push_update()
+        else:
+            self._unsub_update = async_call_later(
+                self.hass, delay, self._async_delayed_update
+            )
+
+    @callback
+    def _async_delayed_update(self, _now) -> None:
+        self._unsub_update = None
+        self._async_push_update()
+
+    @callback
+    def _async_push_update(self) -> None:
+        self._last_update = time.monotonic()
+        self.async_set_updated_data(self.api)
+
+    async def async_shutdown(self) -> None:
+        if self._unsub_update is not None:
+            self._unsub_update()
+            self._unsub_update = None
+        await super().async_shutdown()
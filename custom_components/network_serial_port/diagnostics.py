@@ -0,0 +1,37 @@
+"""Diagnostics support for the Network serial port integration."""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import NetworkSerialPortCoordinator
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Settings, state and the last profile of the bridge."""
+    coordinator: NetworkSerialPortCoordinator = hass.data[DOMAIN][entry.entry_id]
+    api = coordinator.api
+    statistics = {
+        key: value
+        for key, value in asdict(api.statistics).items()
+        if not key.startswith("_")
+    }
+    return {
+        "data": dict(entry.data),
+        "options": dict(entry.options),
+        "engine": type(api).__name__,
+        "running": api.is_running,
+        "connected_clients": api.connected_clients,
+        # Only reported by the process engine
+        "io_path": getattr(api, "io_path", None),
+        "statistics": statistics,
+        # Results of the last network_serial_port.profile call
+        "profile": api.last_profile,
+    }
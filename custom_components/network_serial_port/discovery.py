@@ -0,0 +1,147 @@
+"""\
+Cached enumeration of the serial ports with serial.tools.list_ports, and
+resolving hwgrep:// URLs from that cache.
+
+Enumerating reads several sysfs attributes of every tty, and pyserial's
+hwgrep:// handler enumerates on every open. The cache is kept until a serial
+device comes, goes or moves, which is noticed from the entries (and link
+targets) of /sys/class/tty and /dev/serial/by-id. Listing these is cheap
+compared to the enumeration. Where they do not exist the cache expires after
+CACHE_TTL seconds.
+
+No package relative imports, tcp_serial_redirect.py and worker_pool.py
+import it as a sibling module.
+"""
+
+import os
+import re
+import threading
+import time
+
+import serial  # type: ignore
+import serial.tools.list_ports  # type: ignore
+
+HWGREP_PREFIX = 'hwgrep://'
+
+# directories whose entries change when a serial device is added or removed
+WATCHED_DIRECTORIES = ('/sys/class/tty', '/dev/serial/by-id')
+
+# seconds the enumeration is kept when the directories are not available
+CACHE_TTL = 30.0
+
+
+def _directory_signature(directory):
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                # the target of /sys/class/tty/ttyUSB0 contains the USB path
+                target = os.readlink(entry.path) if entry.is_symlink() else ''
+            except EnvironmentError:
+                target = ''
+            entries.append((entry.name, target))
+    return frozenset(entries)
+
+
+class PortDiscovery(object):
+    """Serial ports like serial.tools.list_ports, enumerated again only after a change. Thread safe."""
+
+    def __init__(self, watched=WATCHED_DIRECTORIES, ttl=CACHE_TTL):
+        self.watched = watched
+        self.ttl = ttl
+        # number of enumerations, the rest was served from the cache
+        self.scans = 0
+        self._lock = threading.Lock()
+        self._ports = None
+        self._signature = None
+        self._scanned_at = 0.0
+
+    def _current_signature(self):
+        """State of the watched directories, None when none of them exists"""
+        signature = []
+        found = False
+        for directory in self.watched:
+            try:
+                signature.append(_directory_signature(directory))
+                found = True
+            except EnvironmentError:
+                # e.g. /dev/serial/by-id without any USB adapter
+                signature.append(None)
+        return tuple(signature) if found else None
+
+    def comports(self):
+        """The ports sorted by device name, like list_ports.comports()"""
+        with self._lock:
+            signature = self._current_signature()
+            now = time.monotonic()
+            if (self._ports is None or signature != self._signature
+                    or (signature is None and now - self._scanned_at > self.ttl)):
+                self._ports = sorted(serial.tools.list_ports.comports())
+                self._signature = signature
+                self._scanned_at = now
+                self.scans += 1
+            return list(self._ports)
+
+    def grep(self, regexp):
+        """The ports matching regexp in device name, description or hardware ID, like list_ports.grep()"""
+        r = re.compile(regexp, re.I)
+        return [port for port in self.comports()
+                if r.search(port.device) or r.search(port.description) or r.search(port.hwid)]
+
+    def resolve_url(self, url):
+        """\
+        The device of a hwgrep:// URL, other URLs are returned as they are.
+        Supports the n=<N> option of pyserial. With other options (e.g.
+        skip_busy, which opens the ports) the URL is left to pyserial.
+        Raises serial.SerialException when no port matches.
+        """
+        if not url.lower().startswith(HWGREP_PREFIX):
+            return url
+        args = url[len(HWGREP_PREFIX):].split('&')
+        regexp = args.pop(0)
+        n = 1
+        for arg in args:
+            option, _, value = arg.partition('=')
+            if option != 'n':
+                return url
+            n = int(value)
+            if n < 1:
+                raise ValueError('option "n" expects a positive integer: {!r}'.format(value))
+        ports = self.grep(regexp)
+        if len(ports) < n:
+            raise serial.SerialException('no ports found matching regexp {!r}'.format(url))
+        return ports[n - 1].device
+
+
+def hwgrep_url(port, ports):
+    """\
+    A URL that finds port again when its device name changes: hwgrep:// with
+    the USB serial number, or else with the USB location (the physical port
+    of the adapter). Only patterns matching no other of ports are used, the
+    device name is returned when there is none.
+    """
+    candidates = []
+    if port.serial_number:
+        candidates.append('SER=' + re.escape(port.serial_number))
+    if port.location:
+        candidates.append('LOCATION=' + re.escape(port.location) + '$')
+    for pattern in candidates:
+        if '&' in pattern:
+            # separates the options in the URL
+            continue
+        r = re.compile(pattern, re.I)
+        if [other.device for other in ports if r.search(other.hwid)] == [port.device]:
+            return HWGREP_PREFIX + pattern
+    return port.device
+
+
+# shared by all users in this process
+_discovery = PortDiscovery()
+
+
+def comports():
+    return _discovery.comports()
+
+
+def resolve_url(url):
+    return _discovery.resolve_url(url)
@@ -0,0 +1,38 @@
+"""Selection of the engine that runs the serial <-> TCP bridge."""
+
+from typing import Any, Callable, Coroutine
+
+from .const import ENGINE_ASYNCIO, ENGINE_WORKER_POOL
+from .network_serial_asyncio import NetworkSerialAsyncio
+from .network_serial_pool import NetworkSerialPool
+from .network_serial_process import NetworkSerialPortConfiguration, NetworkSerialProcess
+
+NetworkSerialEngine = NetworkSerialProcess | NetworkSerialAsyncio | NetworkSerialPool
+
+
+def create_engine(
+    configuration: NetworkSerialPortConfiguration,
+    port_id: str,
+    runtime_dir: str,
+    on_connection_change: Callable[[], None] | None = None,
+    on_process_lost: Callable[[], Coroutine[Any, Any, None]] | None = None,
+) -> NetworkSerialEngine:
+    if configuration.engine == ENGINE_ASYNCIO:
+        return NetworkSerialAsyncio(
+            configuration,
+            on_connection_change=on_connection_change,
+            on_process_lost=on_process_lost,
+        )
+    if configuration.engine == ENGINE_WORKER_POOL:
+        return NetworkSerialPool(
+            configuration,
+            port_id,
+            runtime_dir,
+            on_connection_change=on_connection_change,
+            on_process_lost=on_process_lost,
+        )
+    return NetworkSerialProcess(
+        configuration,
+        on_connection_change=on_connection_change,
+        on_process_lost=on_process_lost,
+    )
@@ -0,0 +1,119 @@
+"""Split serial data into frames, so every frame is sent with one TCP write.
+
+No package relative imports, tcp_serial_redirect.py imports it as a sibling
+module.
+
+Framers only decide where a frame ends, the data itself is forwarded
+unchanged (SLIP and COBS frames stay encoded).
+"""
+
+import time
+
+FRAMING_NONE = 'none'
+FRAMING_SILENCE = 'silence'
+FRAMING_LF = 'lf'
+FRAMING_CRLF = 'crlf'
+FRAMING_SLIP = 'slip'
+FRAMING_COBS = 'cobs'
+
+FRAMINGS = [FRAMING_NONE, FRAMING_SILENCE, FRAMING_LF, FRAMING_CRLF, FRAMING_SLIP, FRAMING_COBS]
+
+# a frame is sent anyway when it grows this large without an end
+MAX_FRAME_SIZE = 4096
+
+
+def silence_interval(baudrate, bytesize=8, parity='N', stopbits=1):
+    """\
+    Silence that ends a frame: 3.5 character times like Modbus RTU. Above
+    19200 baud Modbus uses a fixed 1.75 ms instead.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    bits = 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+    return 3.5 * bits / baudrate
+
+
+class SilenceFramer(object):
+    """A frame ends when no data was received for interval seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = bytearray()
+        self._received_at = 0.0
+
+    def feed(self, data):
+        """Add received data, returns the completed frames"""
+        self._pending += data
+        self._received_at = time.monotonic()
+        if len(self._pending) >= MAX_FRAME_SIZE:
+            return [self.flush()]
+        return []
+
+    def timeout(self):
+        """Seconds until flush() has to be called, None when nothing is pending"""
+        if not self._pending:
+            return None
+        return max(self._received_at + self.interval - time.monotonic(), 0)
+
+    def flush(self):
+        frame = bytes(self._pending)
+        self._pending.clear()
+        return frame
+
+
+class DelimiterFramer(object):
+    """\
+    A frame ends with the delimiter, which is included in the frame. With
+    skip_empty, delimiters without data in front of them (e.g. the optional
+    END that starts a SLIP frame) are sent together with the next frame.
+    Without, an empty line is a frame of its own.
+    """
+
+    def __init__(self, delimiter, skip_empty=False):
+        self.delimiter = delimiter
+        self.skip_empty = skip_empty
+        self._pending = bytearray()
+
+    def feed(self, data):
+        """Add received data, returns the completed frames"""
+        # only search the new data (and a partial delimiter before it)
+        start = max(len(self._pending) - len(self.delimiter) + 1, 0)
+        self._pending += data
+        frames = []
+        while True:
+            end = self._pending.find(self.delimiter, start)
+            if end < 0:
+                break
+            end += len(self.delimiter)
+            if not self.skip_empty or self._pending[:end].replace(self.delimiter, b''):
+                frames.append(bytes(self._pending[:end]))
+                del self._pending[:end]
+                start = 0
+            else:
+                start = end
+        if len(self._pending) >= MAX_FRAME_SIZE:
+            frames.append(self.flush())
+        return frames
+
+    def timeout(self):
+        return None
+
+    def flush(self):
+        frame = bytes(self._pending)
+        self._pending.clear()
+        return frame
+
+
+def create_framer(framing, baudrate=9600, bytesize=8, parity='N', stopbits=1):
+    """Framer for one of FRAMINGS, None for FRAMING_NONE"""
+    if framing == FRAMING_SILENCE:
+        return SilenceFramer(silence_interval(baudrate, bytesize, parity, stopbits))
+    if framing == FRAMING_LF:
+        return DelimiterFramer(b'\n')
+    if framing == FRAMING_CRLF:
+        return DelimiterFramer(b'\r\n')
+    if framing == FRAMING_SLIP:
+        return DelimiterFramer(b'\xc0', skip_empty=True)
+    if framing == FRAMING_COBS:
+        return DelimiterFramer(b'\x00', skip_empty=True)
+    return None
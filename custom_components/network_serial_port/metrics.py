@@ -0,0 +1,147 @@
+"""\
+Prometheus metrics of the bridge: fixed bucket histograms that are cheap
+enough for the data path, the text exposition format (Prometheus 0.0.4 and
+OpenMetrics 1.0) and a small HTTP server answering GET /metrics.
+
+No package relative imports, tcp_serial_redirect.py imports it as a sibling
+module.
+"""
+
+import bisect
+import collections
+import http.server
+import socketserver
+import threading
+
+# chunk sizes in bytes
+SIZE_BUCKETS = (1, 4, 16, 64, 256, 1024, 4096, 16384, 65536)
+# latencies in seconds, from 100 us to 1 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# samples is a list of (labels dict, value), the value of a histogram sample
+# is a Histogram. Counter names end in _total.
+MetricFamily = collections.namedtuple('MetricFamily', 'name type help samples')
+
+
+class Histogram(object):
+    """\
+    Counts observations per bucket. observe() is a bisect and two additions,
+    there is no lock: concurrent updates may very rarely lose an observation,
+    which does not matter for monitoring but keeps the data path fast.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # the last one counts the values above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Returns the (upper bound, count of values <= bound) pairs, the last bound is +Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), list(self.counts)):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()) + '}'
+
+
+def render(families, openmetrics=False):
+    """Text exposition of the metric families"""
+    lines = []
+    for family in families:
+        name = family.name
+        if openmetrics and family.type == COUNTER and name.endswith('_total'):
+            # OpenMetrics names the family without the suffix
+            name = name[:-len('_total')]
+        lines.append('# HELP {} {}'.format(name, family.help))
+        lines.append('# TYPE {} {}'.format(name, family.type))
+        for labels, value in family.samples:
+            if family.type != HISTOGRAM:
+                lines.append('{}{} {}'.format(family.name, _format_labels(labels), _format_value(value)))
+                continue
+            buckets = value.cumulative()
+            for bound, count in buckets:
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(dict(labels, le=_format_value(float(bound)))), count))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), _format_value(value.sum)))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), buckets[-1][1]))
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+        server = self.server
+        assert isinstance(server, _MetricsServer)
+        body = render(server.collect(), openmetrics).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scraped every few seconds, nothing worth logging
+        pass
+
+
+class _MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, sock, collect):
+        # the socket created by the base class is replaced right away
+        self.address_family = sock.family
+        http.server.HTTPServer.__init__(self, sock.getsockname(), _MetricsHandler, bind_and_activate=False)
+        self.socket.close()
+        # already bound and listening
+        self.socket = sock
+        self.collect = collect
+
+
+def serve(sock, collect):
+    """\
+    Answer GET /metrics on the listening socket (TCP or Unix domain) in a
+    daemon thread. collect() returns the metric families and is called for
+    every request. Returns the server, shutdown() stops it.
+    """
+    server = _MetricsServer(sock, collect)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
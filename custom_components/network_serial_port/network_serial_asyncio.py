@@ -0,0 +1,163 @@
+import asyncio
+from typing import Any, Callable, Coroutine
+
+from .asyncio_bridge import SerialBridge
+from .capture import CaptureRing
+from .const import DEFAULT_CAPTURE_SIZE, LOGGER
+from .discovery import resolve_url
+from .network_serial_process import (
+    NetworkSerialPortConfiguration,
+    NetworkSerialStatistics,
+)
+
+import serial  # type: ignore
+
+
+class NetworkSerialAsyncio:
+    """Runs the serial <-> TCP bridge on the Home Assistant event loop.
+
+    Same interface as NetworkSerialProcess, but no subprocess is started.
+    """
+
+    def __init__(
+        self,
+        configuration: NetworkSerialPortConfiguration,
+        on_connection_change: Callable[[], None] | None = None,
+        on_process_lost: Callable[[], Coroutine[Any, Any, None]] | None = None,
+    ) -> None:
+        self._configuration = configuration
+        self.connected_client: str | None = None
+        self.on_connection_change = on_connection_change
+        self._on_process_lost = on_process_lost
+        self.statistics = NetworkSerialStatistics()
+        self.on_statistics_update: Callable[[], None] | None = None
+        self._statistics_task: asyncio.Task | None = None
+        # kept, so the task is not garbage collected before it is done
+        self._process_lost_task: asyncio.Task | None = None
+        # Profiling is not supported, see NetworkSerialProcess.profile
+        self.last_profile: dict[str, Any] | None = None
+        self._bridge = SerialBridge(
+            configuration.url,
+            configuration.localport or 7777,
+            baudrate=configuration.baudrate,
+            bytesize=configuration.bytesize,
+            parity=configuration.parity,
+            stopbits=configuration.stopbits,
+            rtscts=configuration.rtscts,
+            xonxoff=configuration.xonxoff,
+            rts=configuration.rts,
+            dtr=configuration.dtr,
+            low_latency=configuration.low_latency,
+            takeover=configuration.takeover,
+            keepalive_idle=configuration.keepalive_idle,
+            user_timeout=configuration.user_timeout,
+            on_client_connected=self._on_client_connected,
+            on_client_disconnected=self._on_client_disconnected,
+            on_serial_lost=self._on_serial_lost,
+            resolve_url=resolve_url,
+        )
+
+    @property
+    def connected_clients(self) -> list[str]:
+        return [self.connected_client] if self.connected_client else []
+
+    @property
+    def is_running(self) -> bool:
+        return self._bridge.is_running
+
+    async def start(self) -> bool:
+        try:
+            await self._bridge.start()
+        except serial.SerialException as e:
+            LOGGER.error(
+                f"Could not open serial port, check your configuration and if the port is available: {e}"
+            )
+            return False
+        except OSError as e:
+            LOGGER.error(f"Could not listen on TCP port: {e}")
+            return False
+
+        LOGGER.info("Ready to accept connections")
+        self._statistics_task = asyncio.create_task(
+            self._update_statistics(), name="Serial bridge statistics"
+        )
+        return True
+
+    async def stop(self):
+        # Clear the callback because stopping on purpose
+        self._on_process_lost = None
+        if self._statistics_task is not None:
+            self._statistics_task.cancel()
+        await self._bridge.stop()
+        await self.capture(None)
+
+    async def reconfigure(self, configuration: NetworkSerialPortConfiguration) -> bool:
+        """Apply changed settings to the running bridge, clients stay connected.
+
+        Returns False when the change needs a restart or could not be applied.
+        """
+        changes = self._configuration.live_changes(configuration)
+        if changes is None or not self.is_running:
+            return False
+
+        try:
+            await self._bridge.reconfigure(changes)
+        except (ValueError, serial.SerialException, OSError) as e:
+            LOGGER.error(f"Could not apply configuration: {e}")
+            return False
+
+        self._configuration = configuration
+        return True
+
+    async def capture(self, path: str | None, size: int = DEFAULT_CAPTURE_SIZE) -> bool:
+        """Capture the traffic to a ring file at path, stops capturing when path is None.
+
+        Returns False when the capture could not be started.
+        """
+        loop = asyncio.get_running_loop()
+        if (ring := self._bridge.capture) is not None:
+            # Closed first, the new capture may truncate the same file
+            self._bridge.capture = None
+            await loop.run_in_executor(None, ring.close)
+        if path is None:
+            return True
+
+        try:
+            self._bridge.capture = await loop.run_in_executor(
+                None, CaptureRing, path, size
+            )
+        except (ValueError, OSError) as e:
+            LOGGER.error(f"Could not start capture: {e}")
+            return False
+        return True
+
+    async def profile(self, duration: float) -> dict[str, Any] | None:
+        """Profiling is only supported by the process engine."""
+        LOGGER.error("Profiling is not supported by the asyncio engine")
+        return None
+
+    async def _update_statistics(self):
+        while True:
+            await asyncio.sleep(self._configuration.stats_interval)
+            self.statistics.update(self._bridge.statistics())
+            if self.on_statistics_update:
+                self.on_statistics_update()
+
+    def _on_client_connected(self, client_ip: str):
+        self.connected_client = client_ip
+        self._signal_connection_change()
+
+    def _on_client_disconnected(self):
+        self.connected_client = None
+        self._signal_connection_change()
+
+    def _on_serial_lost(self, exc: Exception | None):
+        LOGGER.error(f"Serial port lost: {exc}")
+        if self._on_process_lost:
+            self._process_lost_task = asyncio.create_task(
+                self._on_process_lost(), name="Serial bridge lost"
+            )
+
+    def _signal_connection_change(self):
+        if self.on_connection_change:
+            self.on_connection_change()
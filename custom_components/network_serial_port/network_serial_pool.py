@@ -0,0 +1,243 @@
+import asyncio
+import json
+import os
+import pathlib
+import sys
+from typing import Any, Awaitable, Callable
+
+from .const import DEFAULT_CAPTURE_SIZE, LOGGER
+from .network_serial_process import (
+    NetworkSerialPortConfiguration,
+    NetworkSerialStatistics,
+)
+
+# in the private runtime directory, so no other user can connect or take the path
+CONTROL_SOCKET_NAME = "control.sock"
+
+# one daemon is started for all ports that are set up at the same time
+_START_LOCK = asyncio.Lock()
+
+
+class NetworkSerialPool:
+    """Registers the port with the shared worker pool (see worker_pool.py).
+
+    Same interface as NetworkSerialProcess. The worker pool daemon is started
+    when it is not running yet and exits by itself when no ports are left.
+    The port is registered as port_id, the config entry id, which stays the
+    same when the TCP port is changed while running. The control socket of
+    the daemon is in runtime_dir, which is created only accessible by us.
+    """
+
+    def __init__(
+        self,
+        configuration: NetworkSerialPortConfiguration,
+        port_id: str,
+        runtime_dir: str,
+        on_connection_change: Callable[[], None] | None = None,
+        on_process_lost: Callable[[], Awaitable[None]] | None = None,
+    ) -> None:
+        self._configuration = configuration
+        self._id = port_id
+        self._runtime_dir = runtime_dir
+        self._control_socket = os.path.join(runtime_dir, CONTROL_SOCKET_NAME)
+        self.connected_client: str | None = None
+        self.on_connection_change = on_connection_change
+        self._on_process_lost = on_process_lost
+        self.statistics = NetworkSerialStatistics()
+        self.on_statistics_update: Callable[[], None] | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._configured: asyncio.Future[bool] | None = None
+        # Profiling is not supported, see NetworkSerialProcess.profile
+        self.last_profile: dict[str, Any] | None = None
+
+    @property
+    def connected_clients(self) -> list[str]:
+        return [self.connected_client] if self.connected_client else []
+
+    @property
+    def is_running(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def start(self) -> bool:
+        try:
+            reader, self._writer = await self._connect()
+        except OSError as e:
+            LOGGER.error(f"Could not connect to worker pool: {e}")
+            return False
+
+        settings = {
+            "url": self._configuration.url,
+            "localport": self._configuration.localport,
+            "baudrate": self._configuration.baudrate,
+            "bytesize": self._configuration.bytesize,
+            "parity": self._configuration.parity,
+            "stopbits": self._configuration.stopbits,
+            "rtscts": self._configuration.rtscts,
+            "xonxoff": self._configuration.xonxoff,
+            "rts": self._configuration.rts,
+            "dtr": self._configuration.dtr,
+            "low_latency": self._configuration.low_latency,
+            "takeover": self._configuration.takeover,
+            "keepalive_idle": self._configuration.keepalive_idle,
+            "user_timeout": self._configuration.user_timeout,
+        }
+        self._send({"command": "register", "id": self._id, "settings": settings})
+
+        try:
+            result = await asyncio.wait_for(reader.readline(), timeout=15.0)
+            message = json.loads(result)
+        except (asyncio.TimeoutError, json.JSONDecodeError, ConnectionError) as e:
+            LOGGER.error(f"No registration result from worker pool: {e}")
+            self._writer.close()
+            return False
+
+        if not message["success"]:
+            LOGGER.error(
+                f"Could not open serial port, check your configuration and if the port is available: {message['error']}"
+            )
+            self._writer.close()
+            return False
+
+        LOGGER.info("Ready to accept connections")
+        self._reader_task = asyncio.create_task(
+            self._read_events(reader), name="Worker pool event reader"
+        )
+        return True
+
+    async def stop(self):
+        # Clear the callback because stopping on purpose
+        self._on_process_lost = None
+
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None and not self._writer.is_closing():
+            self._send({"command": "unregister", "id": self._id})
+            self._writer.close()
+            await self._writer.wait_closed()
+
+    async def reconfigure(self, configuration: NetworkSerialPortConfiguration) -> bool:
+        """Apply changed settings to the running bridge, clients stay connected.
+
+        Returns False when the change needs a restart or could not be applied.
+        """
+        changes = self._configuration.live_changes(configuration)
+        if changes is None or not self.is_running:
+            return False
+
+        if changes:
+            self._configured = asyncio.get_running_loop().create_future()
+            self._send({"command": "configure", "id": self._id, "settings": changes})
+            try:
+                if not await asyncio.wait_for(self._configured, timeout=15.0):
+                    return False
+            except asyncio.TimeoutError:
+                LOGGER.error("Timeout waiting for worker pool to apply configuration")
+                return False
+            finally:
+                self._configured = None
+
+        self._configuration = configuration
+        return True
+
+    async def capture(self, path: str | None, size: int = DEFAULT_CAPTURE_SIZE) -> bool:
+        """Capturing is not supported by the worker pool."""
+        LOGGER.error("Capturing traffic is not supported by the worker_pool engine")
+        return False
+
+    async def profile(self, duration: float) -> dict[str, Any] | None:
+        """Profiling is only supported by the process engine."""
+        LOGGER.error("Profiling is not supported by the worker_pool engine")
+        return None
+
+    async def _connect(
+        self,
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        try:
+            return await asyncio.open_unix_connection(self._control_socket)
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+
+        async with _START_LOCK:
+            # started by another port while waiting for the lock
+            try:
+                return await asyncio.open_unix_connection(self._control_socket)
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+
+            LOGGER.debug("Starting worker pool")
+            await asyncio.get_running_loop().run_in_executor(
+                None, _make_private_dir, self._runtime_dir
+            )
+            path = pathlib.Path(__file__).parent.resolve()
+            await asyncio.create_subprocess_exec(
+                sys.executable,
+                f"{path}/worker_pool.py",
+                "--control-socket",
+                self._control_socket,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                start_new_session=True,
+            )
+
+            for _ in range(50):
+                await asyncio.sleep(0.1)
+                try:
+                    return await asyncio.open_unix_connection(self._control_socket)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    pass
+        raise ConnectionRefusedError("Timeout waiting for worker pool to start")
+
+    def _send(self, message: dict):
+        assert self._writer is not None
+        self._writer.write(json.dumps(message).encode() + b"\n")
+
+    async def _read_events(self, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                self._handle_event(json.loads(line))
+        except asyncio.CancelledError:
+            return
+        except (ConnectionError, json.JSONDecodeError) as e:
+            LOGGER.error(f"Worker pool connection error: {e}")
+
+        LOGGER.debug("Worker pool connection lost")
+        if self._writer is not None:
+            self._writer.close()
+        if self._on_process_lost:
+            await self._on_process_lost()
+
+    def _handle_event(self, message: dict):
+        if message["event"] == "connected":
+            self.connected_client = message["client"]
+            self._signal_connection_change()
+        elif message["event"] == "disconnected":
+            self.connected_client = None
+            self._signal_connection_change()
+        elif message["event"] == "moved":
+            # The new worker counts from 0
+            self.statistics.continue_from(self.statistics)
+        elif message["event"] == "statistics":
+            self.statistics.update(message["statistics"])
+            if self.on_statistics_update:
+                self.on_statistics_update()
+        elif message["event"] == "configured":
+            if not message["success"]:
+                LOGGER.error(f"Could not apply configuration: {message['error']}")
+            if self._configured is not None and not self._configured.done():
+                self._configured.set_result(message["success"])
+        elif message["event"] == "serial_lost":
+            LOGGER.error(f"Serial port lost: {message['error']}")
+            if self._writer is not None:
+                self._writer.close()
+
+    def _signal_connection_change(self):
+        if self.on_connection_change:
+            self.on_connection_change()
+
+
+def _make_private_dir(path: str) -> None:
+    """Create path only accessible by the current user."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # exist_ok does not fix the mode of an existing directory
+    os.chmod(path, 0o700)
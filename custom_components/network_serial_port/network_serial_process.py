@@ -1,14 +1,70 @@
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
+import json
+import logging
+import os
 import pathlib
-import re
-from typing import Awaitable, Callable
+import struct
+import sys
+import time
+from typing import Any, Awaitable, Callable
 
-from .const import CONF_BAUDRATE, CONF_SERIAL_URL, CONF_TCP_PORT, LOGGER
+from .const import (
+    CONF_BAUDRATE,
+    CONF_CLIENT,
+    CONF_CLIENT_QUEUE_SIZE,
+    CONF_COALESCE_SIZE,
+    CONF_COALESCE_WINDOW,
+    CONF_COMPRESS,
+    CONF_COMPRESS_FLUSH,
+    CONF_ENGINE,
+    CONF_FLOW_CONTROL,
+    CONF_FRAMING,
+    CONF_IDLE_CLOSE,
+    CONF_KEEPALIVE_IDLE,
+    CONF_LOW_LATENCY,
+    CONF_MAX_CLIENTS,
+    CONF_METRICS_PORT,
+    CONF_ON_DEMAND,
+    CONF_RECV_SIZE,
+    CONF_SERIAL_URL,
+    CONF_SLOW_CLIENT_POLICY,
+    CONF_SPLICE,
+    CONF_TAKEOVER,
+    CONF_TCP_PORT,
+    CONF_UNIX_SOCKET,
+    CONF_UNIX_SOCKET_MODE,
+    CONF_USER_TIMEOUT,
+    CONF_WRITE_MODE,
+    DEFAULT_CAPTURE_SIZE,
+    ENGINE_PROCESS,
+    FLOW_CONTROL_RTSCTS,
+    FLOW_CONTROL_XONXOFF,
+    FRAMING_NONE,
+    LOGGER,
+    SLOW_CLIENT_DROP_OLDEST,
+    TAKEOVER_WAIT,
+    WRITE_MODE_IMMEDIATE,
+)
 
 import serial  # type: ignore
 
 
+# Settings that can be changed without restarting the bridge, serial settings
+# are applied to the open port and the listener is moved to the new port.
+LIVE_SETTINGS = (
+    "baudrate",
+    "bytesize",
+    "parity",
+    "stopbits",
+    "rtscts",
+    "xonxoff",
+    "rts",
+    "dtr",
+    "localport",
+)
+
+
 @dataclass
 class NetworkSerialPortConfiguration:
     url: str
@@ -22,6 +78,56 @@ class NetworkSerialPortConfiguration:
     dtr: bool | None = None
     localport: int | None = None
     client: str = ""
+    engine: str = ENGINE_PROCESS
+    max_clients: int = 1
+    client_queue_size: int = 65536
+    slow_client_policy: str = SLOW_CLIENT_DROP_OLDEST
+    # What a new client does when max_clients are connected
+    takeover: str = TAKEOVER_WAIT
+    # Dead peer detection, keep-alive after seconds idle (0 disables) and
+    # TCP_USER_TIMEOUT in ms for unacknowledged data (0 is the system default)
+    keepalive_idle: int = 1
+    user_timeout: int = 0
+    stats_interval: float = 10
+    write_mode: str = WRITE_MODE_IMMEDIATE
+    recv_size: int = 1024
+    coalesce_size: int = 4096
+    coalesce_window: float = 2
+    low_latency: bool = False
+    splice: bool = False
+    framing: str = FRAMING_NONE
+    # Also listen on this Unix domain socket, localport 0 only listens on it
+    unix_socket: str = ""
+    unix_socket_mode: str = "660"
+    # Prometheus metrics over HTTP on this port, 0 disables
+    metrics_port: int = 0
+    # Only keep the serial port open while a client is connected, closed
+    # after idle_close seconds without client
+    on_demand: bool = False
+    idle_close: int = 30
+    # Client mode sends and receives a zlib stream, flushed after ms idle
+    compress: bool = False
+    compress_flush: int = 10
+
+    def live_changes(
+        self, configuration: "NetworkSerialPortConfiguration"
+    ) -> dict[str, Any] | None:
+        """Settings that differ and can be applied to a running bridge.
+
+        Returns None when a setting changed that needs a restart.
+        """
+        changes = {}
+        for f in fields(self):
+            value = getattr(configuration, f.name)
+            if value == getattr(self, f.name):
+                continue
+            if f.name not in LIVE_SETTINGS:
+                return None
+            if f.name == "localport" and 0 in (value, self.localport):
+                # Starts or stops listening on TCP
+                return None
+            changes[f.name] = value
+        return changes
 
     @staticmethod
     def from_dict(data: dict):
@@ -29,12 +135,112 @@ class NetworkSerialPortConfiguration:
             data[CONF_SERIAL_URL],
             baudrate=data[CONF_BAUDRATE],
             localport=data[CONF_TCP_PORT],
+            client=data.get(CONF_CLIENT, ""),
+            engine=data.get(CONF_ENGINE, ENGINE_PROCESS),
+            rtscts=data.get(CONF_FLOW_CONTROL) == FLOW_CONTROL_RTSCTS,
+            xonxoff=data.get(CONF_FLOW_CONTROL) == FLOW_CONTROL_XONXOFF,
+            max_clients=data.get(CONF_MAX_CLIENTS, 1),
+            client_queue_size=data.get(CONF_CLIENT_QUEUE_SIZE, 65536),
+            slow_client_policy=data.get(
+                CONF_SLOW_CLIENT_POLICY, SLOW_CLIENT_DROP_OLDEST
+            ),
+            takeover=data.get(CONF_TAKEOVER, TAKEOVER_WAIT),
+            keepalive_idle=data.get(CONF_KEEPALIVE_IDLE, 1),
+            user_timeout=data.get(CONF_USER_TIMEOUT, 0),
+            write_mode=data.get(CONF_WRITE_MODE, WRITE_MODE_IMMEDIATE),
+            recv_size=data.get(CONF_RECV_SIZE, 1024),
+            coalesce_size=data.get(CONF_COALESCE_SIZE, 4096),
+            coalesce_window=data.get(CONF_COALESCE_WINDOW, 2),
+            low_latency=data.get(CONF_LOW_LATENCY, False),
+            splice=data.get(CONF_SPLICE, False),
+            framing=data.get(CONF_FRAMING, FRAMING_NONE),
+            unix_socket=data.get(CONF_UNIX_SOCKET, ""),
+            unix_socket_mode=data.get(CONF_UNIX_SOCKET_MODE, "660"),
+            metrics_port=data.get(CONF_METRICS_PORT, 0),
+            on_demand=data.get(CONF_ON_DEMAND, False),
+            idle_close=data.get(CONF_IDLE_CLOSE, 30),
+            compress=data.get(CONF_COMPRESS, False),
+            compress_flush=data.get(CONF_COMPRESS_FLUSH, 10),
         )
 
 
-class NetworkSerialProcess:
-    _connected_regex = re.compile(r"Connected by \('(?P<client_ip>[^']*)',")
+@dataclass
+class NetworkSerialStatistics:
+    """Traffic totals as reported by the engines, byte_rate is derived."""
+
+    serial_to_net_bytes: int = 0
+    serial_to_net_chunks: int = 0
+    net_to_serial_bytes: int = 0
+    net_to_serial_chunks: int = 0
+    high_water: int = 0
+    connects: int = 0
+    takeovers: int = 0
+    rejects: int = 0
+    reconnects: int = 0
+    reconnect_latency_ms: float = 0.0
+    reconnect_latency_max_ms: float = 0.0
+    serial_recoveries: int = 0
+    serial_recover_ms: float = 0.0
+    serial_recover_max_ms: float = 0.0
+    # On demand, opening the closed serial port for a client
+    serial_opens: int = 0
+    serial_open_ms: float = 0.0
+    serial_open_max_ms: float = 0.0
+    # Both directions of compressed connections, before and after compression
+    uncompressed_bytes: int = 0
+    compressed_bytes: int = 0
+    # Times the device was paused because the clients could not keep up, and
+    # times the device paused the clients with CTS
+    flow_pauses: int = 0
+    flow_paused_ms: float = 0.0
+    cts_pauses: int = 0
+    byte_rate: float = 0.0
+    _updated_at: float = field(default=0.0, repr=False)
+    # Totals before the engine counted from 0 again, see continue_from
+    _base: dict[str, float] = field(default_factory=dict, repr=False)
 
+    # Fields that only increase, exposed as TOTAL_INCREASING sensors
+    COUNTERS = (
+        "serial_to_net_bytes",
+        "serial_to_net_chunks",
+        "net_to_serial_bytes",
+        "net_to_serial_chunks",
+        "connects",
+        "takeovers",
+        "rejects",
+        "reconnects",
+        "serial_recoveries",
+        "serial_opens",
+        "uncompressed_bytes",
+        "compressed_bytes",
+        "flow_pauses",
+        "flow_paused_ms",
+        "cts_pauses",
+    )
+
+    def continue_from(self, previous: "NetworkSerialStatistics") -> None:
+        """Count on from the totals of previous.
+
+        For when the engine counts from 0 again, e.g. after the port moved to
+        another worker or the bridge was restarted. previous can be self.
+        """
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(previous, name))
+        self._base = {name: getattr(previous, name) for name in self.COUNTERS}
+
+    def update(self, values: dict[str, Any]) -> None:
+        now = time.monotonic()
+        previous_total = self.serial_to_net_bytes + self.net_to_serial_bytes
+        for f in fields(self):
+            if f.name in values:
+                setattr(self, f.name, self._base.get(f.name, 0) + values[f.name])
+        total = self.serial_to_net_bytes + self.net_to_serial_bytes
+        if self._updated_at and now > self._updated_at:
+            self.byte_rate = max(total - previous_total, 0) / (now - self._updated_at)
+        self._updated_at = now
+
+
+class NetworkSerialProcess:
     def __init__(
         self,
         configuration: NetworkSerialPortConfiguration,
@@ -43,10 +249,30 @@ class NetworkSerialProcess:
     ) -> None:
         self._configuration = configuration
         self.connected_client: str | None = None
+        self._clients: dict[tuple[str, int], str] = {}
+        self.statistics = NetworkSerialStatistics()
+        self.on_statistics_update: Callable[[], None] | None = None
         self.on_connection_change = on_connection_change
         self._on_process_lost = on_process_lost
         self._started_event = asyncio.Event()
         self._start_success = False
+        self._configured: asyncio.Future[bool] | None = None
+        self._capture_started: asyncio.Future[bool] | None = None
+        self._profiled: asyncio.Future[dict[str, Any] | None] | None = None
+        # Results of the last profile, for the diagnostics
+        self.last_profile: dict[str, Any] | None = None
+        # How data is moved in each direction, see tcp_serial_redirect.py
+        self.io_path: dict[str, str] = {}
+        self._process: asyncio.subprocess.Process | None = None
+
+    @property
+    def connected_clients(self) -> list[str]:
+        return list(self._clients.values())
+
+    @property
+    def pid(self) -> int | None:
+        """Process id of the bridge, None when it was not started."""
+        return self._process.pid if self._process else None
 
     @property
     def is_running(self) -> bool:
@@ -56,24 +282,79 @@ class NetworkSerialProcess:
         self._started_event.clear()
         self._start_success = False
 
+        # State is reported as events on a separate pipe, see EventChannel
+        event_fd, child_event_fd = os.pipe()
+
+        # Settings are passed as a single JSON object, the script then skips
+        # argparse which shortens the startup
+        settings = {
+            "SERIALPORT": self._configuration.url,
+            "BAUDRATE": self._configuration.baudrate,
+            "bytesize": self._configuration.bytesize,
+            "parity": self._configuration.parity,
+            "stopbits": self._configuration.stopbits,
+            "rtscts": self._configuration.rtscts,
+            "xonxoff": self._configuration.xonxoff,
+            "rts": self._configuration.rts,
+            "dtr": self._configuration.dtr,
+            "localport": self._configuration.localport,
+            "unix_socket": self._configuration.unix_socket or None,
+            "unix_socket_mode": int(self._configuration.unix_socket_mode, 8),
+            "client": self._configuration.client,
+            "max_clients": self._configuration.max_clients,
+            "client_queue_size": self._configuration.client_queue_size,
+            "slow_client_policy": self._configuration.slow_client_policy,
+            "takeover": self._configuration.takeover,
+            "keepalive_idle": self._configuration.keepalive_idle,
+            "user_timeout": self._configuration.user_timeout,
+            "stats_interval": self._configuration.stats_interval,
+            "write_mode": self._configuration.write_mode,
+            "recv_size": self._configuration.recv_size,
+            "coalesce_size": self._configuration.coalesce_size,
+            "coalesce_window": self._configuration.coalesce_window,
+            "low_latency": self._configuration.low_latency,
+            "splice": self._configuration.splice,
+            "framing": self._configuration.framing,
+            "metrics_port": self._configuration.metrics_port,
+            "on_demand": self._configuration.on_demand,
+            "idle_close": self._configuration.idle_close,
+            "compress": self._configuration.compress,
+            "compress_flush": self._configuration.compress_flush,
+            # Human readable output is only needed when debugging
+            "quiet": not LOGGER.isEnabledFor(logging.DEBUG),
+            "event_fd": child_event_fd,
+            "stdin_commands": True,
+        }
         path = pathlib.Path(__file__).parent.resolve()
-        args = [
-            "python3",
-            f"{path}/tcp_serial_redirect.py",
-            self._configuration.url,
-            str(self._configuration.baudrate),
-            f"-P {self._configuration.localport}",
-        ]
-
-        self._process = await asyncio.create_subprocess_exec(
-            *args, stderr=asyncio.subprocess.PIPE
+        try:
+            # Same interpreter as Home Assistant, so pyserial is available
+            self._process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                f"{path}/tcp_serial_redirect.py",
+                "--config-json",
+                json.dumps(settings),
+                stdin=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                pass_fds=(child_event_fd,),
+            )
+        finally:
+            os.close(child_event_fd)
+
+        event_reader = asyncio.StreamReader()
+        await asyncio.get_running_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(event_reader),
+            os.fdopen(event_fd, "rb", buffering=0),
         )
+
         self._process_wait_task = asyncio.create_task(
             self._wait_for_process_exit(), name="TCP Serial Redirect process waiter"
         )
         self._reader_task = asyncio.create_task(
             self._process_stderr_output(), name="TCP Serial Redirect stderr reader"
         )
+        self._event_task = asyncio.create_task(
+            self._process_events(event_reader), name="TCP Serial Redirect event reader"
+        )
 
         # Make sure the process is started properly
         try:
@@ -90,6 +371,8 @@ class NetworkSerialProcess:
     async def stop(self):
         # Clear the callback because stopping on purpose
         self._on_process_lost = None
+        if self._process is None:
+            return
 
         try:
             self._process.terminate()
@@ -97,21 +380,90 @@ class NetworkSerialProcess:
         except ProcessLookupError:
             LOGGER.debug("Process was already terminated or not found")
 
+    async def reconfigure(self, configuration: NetworkSerialPortConfiguration) -> bool:
+        """Apply changed settings to the running process, clients stay connected.
+
+        Returns False when the change needs a restart or could not be applied.
+        """
+        changes = self._configuration.live_changes(configuration)
+        if changes is None or not self.is_running:
+            return False
+
+        if changes:
+            assert self._process is not None and self._process.stdin is not None
+            self._configured = asyncio.get_running_loop().create_future()
+            command = {"command": "configure", "settings": changes}
+            self._process.stdin.write(json.dumps(command).encode() + b"\n")
+            try:
+                if not await asyncio.wait_for(self._configured, timeout=5.0):
+                    return False
+            except asyncio.TimeoutError:
+                LOGGER.error("Timeout waiting for process to apply configuration")
+                return False
+            finally:
+                self._configured = None
+
+        self._configuration = configuration
+        return True
+
+    async def capture(self, path: str | None, size: int = DEFAULT_CAPTURE_SIZE) -> bool:
+        """Capture the traffic to a ring file at path, stops capturing when path is None.
+
+        Returns False when the capture could not be started.
+        """
+        if not self.is_running:
+            return False
+
+        assert self._process is not None and self._process.stdin is not None
+        self._capture_started = asyncio.get_running_loop().create_future()
+        command = {"command": "capture", "path": path, "size": size}
+        self._process.stdin.write(json.dumps(command).encode() + b"\n")
+        try:
+            return await asyncio.wait_for(self._capture_started, timeout=5.0)
+        except asyncio.TimeoutError:
+            LOGGER.error("Timeout waiting for process to start the capture")
+            return False
+        finally:
+            self._capture_started = None
+
+    async def profile(self, duration: float) -> dict[str, Any] | None:
+        """Instrument the hot paths of the bridge for duration seconds.
+
+        Returns the results, or None when profiling failed or is already running.
+        """
+        if not self.is_running or self._profiled is not None:
+            return None
+
+        assert self._process is not None and self._process.stdin is not None
+        self._profiled = asyncio.get_running_loop().create_future()
+        command = {"command": "profile", "duration": duration}
+        self._process.stdin.write(json.dumps(command).encode() + b"\n")
+        try:
+            results = await asyncio.wait_for(self._profiled, timeout=duration + 5.0)
+        except asyncio.TimeoutError:
+            LOGGER.error("Timeout waiting for the profile results")
+            return None
+        finally:
+            self._profiled = None
+        if results is not None:
+            self.last_profile = results
+        return results
+
     async def _wait_for_process_exit(self):
+        assert self._process is not None
         await self._process.wait()
         LOGGER.debug("Process exited")
         if self._start_success and self._on_process_lost:
             await self._on_process_lost()
 
     async def _process_stderr_output(self):
-        assert self._process.stderr is not None
+        assert self._process is not None and self._process.stderr is not None
 
         while True:
             try:
                 line = await self._process.stderr.readline()
                 if line.endswith(b"\n"):
                     LOGGER.debug(line)
-                    self._handle_line(line)
                 else:
                     LOGGER.debug("EOF detected")
                     return
@@ -124,29 +476,92 @@ class NetworkSerialProcess:
                 LOGGER.exception(e)
                 return
 
-    def _handle_line(self, input: bytes):
-        line = input.decode("utf-8")
+    async def _process_events(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                (length,) = struct.unpack(">I", await reader.readexactly(4))
+                event = json.loads(await reader.readexactly(length))
+            except asyncio.IncompleteReadError:
+                LOGGER.debug("Event channel closed")
+                return
+            except asyncio.CancelledError:
+                return
+            except Exception as e:
+                LOGGER.exception(e)
+                return
+            self._handle_event(event)
 
-        # Checks related to process start
-        if line.startswith("Could not open serial port"):
-            LOGGER.error("Could not open serial port, check your configuration and if the port is available.")
-            self._start_success = False
-            self._started_event.set()
-        elif line.startswith("Waiting for connection on"):
-            LOGGER.info("Ready to accept connections")
+    def _handle_event(self, event: dict[str, Any]):
+        kind = event["event"]
+        if kind == "started":
+            self.io_path = event["io_path"]
+            LOGGER.info(f"Ready to accept connections, I/O path: {self.io_path}")
             self._start_success = True
             self._started_event.set()
-        # Checks related to client connection state
-        elif line.startswith("Disconnected"):
-            self.connected_client = None
-            self._signal_connection_change()
-        elif m := self._connected_regex.match(line):
-            self.connected_client = m.group("client_ip")
-            self._signal_connection_change()
-        # Detect exceptions in the process
-        elif line.startswith("Exception in thread"):
-            LOGGER.error("Exception in tcp_serial_redirect.py, stopping process")
-            self._process.terminate()
+        elif kind == "error":
+            LOGGER.error(event["message"])
+            if not self._started_event.is_set():
+                self._start_success = False
+                self._started_event.set()
+            elif event["fatal"]:
+                LOGGER.error("Fatal error in tcp_serial_redirect.py, stopping process")
+                if self._process is not None:
+                    self._process.terminate()
+        elif kind == "serial_lost":
+            # Reopened by the process, clients stay connected
+            LOGGER.warning(f"Serial port lost, reopening: {event['message']}")
+        elif kind == "serial_recovered":
+            LOGGER.warning(f"Serial port reopened after {event['recover_ms']:.0f} ms")
+        elif kind == "serial_closed":
+            LOGGER.debug("Serial port closed, no clients")
+        elif kind == "serial_opened":
+            LOGGER.debug(f"Serial port opened in {event['open_ms']:.0f} ms")
+        elif kind == "io_path":
+            self.io_path = {key: event[key] for key in ("serial_to_net", "net_to_serial")}
+            LOGGER.warning(f"I/O path changed: {self.io_path}")
+        elif kind == "configured":
+            if not event["success"]:
+                LOGGER.error(f"Could not apply configuration: {event['message']}")
+            if self._configured is not None and not self._configured.done():
+                self._configured.set_result(event["success"])
+        elif kind == "capture":
+            if not event["success"]:
+                LOGGER.error(f"Could not start capture: {event['message']}")
+            if self._capture_started is not None and not self._capture_started.done():
+                self._capture_started.set_result(event["success"])
+        elif kind == "profile":
+            if event["success"]:
+                LOGGER.warning(f"Profile of {self._configuration.url}:\n{event['report']}")
+            else:
+                LOGGER.error(f"Could not profile: {event['message']}")
+            if self._profiled is not None and not self._profiled.done():
+                self._profiled.set_result(event.get("results"))
+        # Client connection state
+        elif kind == "connected":
+            self._clients[(event["client"], event["port"])] = event["client"]
+            self._update_connected_client()
+        elif kind == "rejected":
+            LOGGER.info(
+                f"Client {event['client']}:{event['port']} rejected, all clients connected"
+            )
+        elif kind == "disconnected":
+            self._clients.pop((event["client"], event["port"]), None)
+            LOGGER.info(
+                f"Client {event['client']}:{event['port']} disconnected, statistics: {event['statistics']}"
+            )
+            self._update_connected_client()
+        elif kind == "statistics":
+            LOGGER.debug(f"Statistics: {event}")
+            self.statistics.update(event)
+            if self.on_statistics_update:
+                self.on_statistics_update()
+
+    def _update_connected_client(self):
+        # With multiple clients report the most recently connected one
+        self.connected_client = (
+            list(self._clients.values())[-1] if self._clients else None
+        )
+        self._signal_connection_change()
 
     def _signal_connection_change(self):
         if self.on_connection_change:
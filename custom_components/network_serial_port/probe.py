@@ -0,0 +1,159 @@
+"""Quick checks of the settings for the config flow, without starting a bridge."""
+
+import errno
+import io
+import os
+import socket
+import stat
+
+from .const import ENGINE_PROCESS, SLOW_CLIENT_BLOCK
+from .discovery import resolve_url
+from .network_serial_process import NetworkSerialPortConfiguration
+
+import serial  # type: ignore
+
+# Maximum time to wait for the serial port to open, e.g. rfc2217:// or
+# socket:// connect over the network
+SERIAL_PROBE_TIMEOUT = 3.0
+
+SERIAL_ERRORS = {
+    errno.ENOENT: "serial_not_found",
+    errno.ENODEV: "serial_not_found",
+    errno.EACCES: "serial_permission_denied",
+    errno.EBUSY: "serial_busy",
+}
+
+TCP_PORT_ERRORS = {
+    errno.EADDRINUSE: "tcp_port_in_use",
+    errno.EACCES: "tcp_port_permission_denied",
+}
+
+UNIX_SOCKET_ERRORS = {
+    errno.ENOENT: "unix_socket_directory_not_found",
+    errno.EACCES: "unix_socket_permission_denied",
+}
+
+
+def probe_serial(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Open and close the serial port, returns the error reason if it failed."""
+    try:
+        # hwgrep:// from the cached enumeration, like the bridge does
+        ser = serial.serial_for_url(resolve_url(configuration.url), do_not_open=True)
+    except ValueError:
+        # Unknown URL handler
+        return "invalid_serial_url"
+    except serial.SerialException:
+        # No port matches the hwgrep:// pattern
+        return "serial_not_found"
+    try:
+        ser.baudrate = configuration.baudrate
+        ser.open()
+    except ValueError:
+        return "invalid_baudrate"
+    except serial.SerialException as e:
+        return SERIAL_ERRORS.get(e.errno, "cannot_open_serial")
+
+    try:
+        if configuration.engine != ENGINE_PROCESS:
+            # The other engines register the file descriptor with an event loop
+            try:
+                ser.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                return "no_file_descriptor"
+    finally:
+        ser.close()
+    return None
+
+
+def probe_client(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Check the client mode settings, the server does not need to be reachable."""
+    host, _, port = configuration.client.rpartition(":")
+    if not host or not port.isdigit() or not 0 < int(port) < 65536:
+        return "invalid_client"
+    if configuration.engine != ENGINE_PROCESS:
+        return "client_needs_process_engine"
+    return None
+
+
+def probe_tcp_port(port: int) -> str | None:
+    """Bind the TCP port like the bridge does, returns the error reason if it failed."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(("", port))
+    except OverflowError:
+        return "invalid_tcp_port"
+    except OSError as e:
+        if e.errno is None:
+            return "cannot_bind_tcp_port"
+        return TCP_PORT_ERRORS.get(e.errno, "cannot_bind_tcp_port")
+    finally:
+        sock.close()
+    return None
+
+
+def probe_metrics_port(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Check the metrics endpoint can be served on the port."""
+    if configuration.engine != ENGINE_PROCESS:
+        return "metrics_needs_process_engine"
+    if not configuration.client and configuration.metrics_port == configuration.localport:
+        return "tcp_port_in_use"
+    return probe_tcp_port(configuration.metrics_port)
+
+
+def probe_on_demand(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Check the serial port can be opened on demand."""
+    if configuration.engine != ENGINE_PROCESS:
+        return "on_demand_needs_process_engine"
+    return None
+
+
+def probe_clients(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Check several clients or a slow client policy can be used, the other engines serve one client."""
+    if configuration.engine != ENGINE_PROCESS:
+        return "clients_need_process_engine"
+    return None
+
+
+def probe_slow_client_policy(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Check the slow client policy can be used, waiting for one client with block would stall the others."""
+    if error := probe_clients(configuration):
+        return error
+    if configuration.slow_client_policy == SLOW_CLIENT_BLOCK and configuration.max_clients != 1:
+        return "block_needs_one_client"
+    return None
+
+
+def probe_compress(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Compression needs the far end of the connection to decompress, see network_serial_tunnel.py."""
+    if not configuration.client:
+        return "compress_needs_client"
+    return None
+
+
+def probe_unix_socket(configuration: NetworkSerialPortConfiguration) -> str | None:
+    """Check the Unix domain socket can be created, without creating it."""
+    path = configuration.unix_socket
+    if configuration.engine != ENGINE_PROCESS:
+        return "unix_socket_needs_process_engine"
+    if not os.path.isabs(path):
+        return "invalid_unix_socket"
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        return UNIX_SOCKET_ERRORS[errno.ENOENT]
+    if not os.access(directory, os.W_OK | os.X_OK):
+        return UNIX_SOCKET_ERRORS[errno.EACCES]
+    if not os.path.exists(path):
+        return None
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+        return "unix_socket_path_in_use"
+
+    # A socket left behind is replaced, one that accepts connections is in use
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+    return "unix_socket_path_in_use"
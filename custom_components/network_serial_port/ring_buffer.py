@@ -0,0 +1,78 @@
+"""Bounded byte buffer used between the serial reader and the socket writers.
+
+No package relative imports, tcp_serial_redirect.py imports it as a sibling
+module.
+"""
+
+
+class ByteRingBuffer(object):
+    """\
+    Fixed size byte FIFO backed by a preallocated bytearray.
+
+    When more data is written than fits, the oldest data is overwritten.
+    Dropped bytes are counted and the highest fill level is remembered, so
+    the size can be tuned. Not thread safe, callers need to lock.
+    """
+
+    def __init__(self, size):
+        if size <= 0:
+            raise ValueError('size must be positive')
+        self.size = size
+        self._buffer = bytearray(size)
+        self._start = 0
+        self._length = 0
+        self.overflow_bytes = 0
+        self.overflow_count = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def free(self):
+        return self.size - self._length
+
+    def write(self, data):
+        """Append data, overwriting the oldest data when full. Returns the number of dropped bytes"""
+        length = len(data)
+        dropped = 0
+        if length > self.size:
+            # only the newest data fits
+            dropped = self._length + length - self.size
+            data = memoryview(data)[length - self.size:]
+            length = self.size
+            self._start = 0
+            self._length = 0
+        elif length > self.free:
+            dropped = length - self.free
+            self._start = (self._start + dropped) % self.size
+            self._length -= dropped
+
+        end = (self._start + self._length) % self.size
+        first = min(length, self.size - end)
+        self._buffer[end:end + first] = data[:first]
+        if first < length:
+            self._buffer[:length - first] = data[first:]
+        self._length += length
+
+        if dropped:
+            self.overflow_bytes += dropped
+            self.overflow_count += 1
+        if self._length > self.high_water:
+            self.high_water = self._length
+        return dropped
+
+    def read(self, max_size):
+        """Remove and return up to max_size bytes from the start of the buffer"""
+        length = min(max_size, self._length)
+        first = min(length, self.size - self._start)
+        data = bytes(self._buffer[self._start:self._start + first])
+        if first < length:
+            data += self._buffer[:length - first]
+        self._start = (self._start + length) % self.size
+        self._length -= length
+        return data
+
+    def clear(self):
+        self._start = 0
+        self._length = 0
@@ -3,20 +3,28 @@ from typing import Callable
 
 
 from homeassistant.components.sensor import (
+    SensorDeviceClass,
     SensorEntity,
     SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.const import (
+    EntityCategory,
+    UnitOfDataRate,
+    UnitOfInformation,
+    UnitOfTime,
 )
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .coordinator import NetworkSerialPortCoordinator
 from .const import DOMAIN
-from .network_serial_process import NetworkSerialProcess
+from .engines import NetworkSerialEngine
 
 
 @dataclass(frozen=True, kw_only=True)
 class NetworkSerialPortEntitySensorDescription(SensorEntityDescription):
-    get_value: Callable[[NetworkSerialProcess], str] = None  # type: ignore[assignment]
+    get_value: Callable[[NetworkSerialEngine], str | int | float] = None  # type: ignore[assignment]
 
 
 ENTITY_DESCRIPTIONS = [
@@ -25,6 +33,134 @@ ENTITY_DESCRIPTIONS = [
         icon="mdi:lan-connect",  # type: ignore
         get_value=lambda api: api.connected_client if api.connected_client else "",
     ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="serial_to_net_bytes",  # type: ignore
+        device_class=SensorDeviceClass.DATA_SIZE,  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        native_unit_of_measurement=UnitOfInformation.BYTES,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        get_value=lambda api: api.statistics.serial_to_net_bytes,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="serial_to_net_chunks",  # type: ignore
+        icon="mdi:download",  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.serial_to_net_chunks,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="net_to_serial_bytes",  # type: ignore
+        device_class=SensorDeviceClass.DATA_SIZE,  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        native_unit_of_measurement=UnitOfInformation.BYTES,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        get_value=lambda api: api.statistics.net_to_serial_bytes,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="net_to_serial_chunks",  # type: ignore
+        icon="mdi:upload",  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.net_to_serial_chunks,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="byte_rate",  # type: ignore
+        device_class=SensorDeviceClass.DATA_RATE,  # type: ignore
+        state_class=SensorStateClass.MEASUREMENT,  # type: ignore
+        native_unit_of_measurement=UnitOfDataRate.BYTES_PER_SECOND,  # type: ignore
+        suggested_display_precision=0,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        get_value=lambda api: api.statistics.byte_rate,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="buffer_high_water",  # type: ignore
+        device_class=SensorDeviceClass.DATA_SIZE,  # type: ignore
+        state_class=SensorStateClass.MEASUREMENT,  # type: ignore
+        native_unit_of_measurement=UnitOfInformation.BYTES,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        get_value=lambda api: api.statistics.high_water,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="connects",  # type: ignore
+        icon="mdi:lan-connect",  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        get_value=lambda api: api.statistics.connects,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="reconnects",  # type: ignore
+        icon="mdi:lan-pending",  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.reconnects,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="reconnect_latency",  # type: ignore
+        device_class=SensorDeviceClass.DURATION,  # type: ignore
+        state_class=SensorStateClass.MEASUREMENT,  # type: ignore
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,  # type: ignore
+        suggested_display_precision=0,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.reconnect_latency_ms,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="serial_recoveries",  # type: ignore
+        icon="mdi:usb-port",  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.serial_recoveries,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="serial_recover_time",  # type: ignore
+        device_class=SensorDeviceClass.DURATION,  # type: ignore
+        state_class=SensorStateClass.MEASUREMENT,  # type: ignore
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,  # type: ignore
+        suggested_display_precision=0,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.serial_recover_ms,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="serial_open_time",  # type: ignore
+        device_class=SensorDeviceClass.DURATION,  # type: ignore
+        state_class=SensorStateClass.MEASUREMENT,  # type: ignore
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,  # type: ignore
+        suggested_display_precision=0,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.serial_open_ms,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="uncompressed_bytes",  # type: ignore
+        device_class=SensorDeviceClass.DATA_SIZE,  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        native_unit_of_measurement=UnitOfInformation.BYTES,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.uncompressed_bytes,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="compressed_bytes",  # type: ignore
+        device_class=SensorDeviceClass.DATA_SIZE,  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        native_unit_of_measurement=UnitOfInformation.BYTES,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.compressed_bytes,
+    ),
+    NetworkSerialPortEntitySensorDescription(  # type: ignore
+        key="flow_pauses",  # type: ignore
+        icon="mdi:pause-circle-outline",  # type: ignore
+        state_class=SensorStateClass.TOTAL_INCREASING,  # type: ignore
+        entity_category=EntityCategory.DIAGNOSTIC,  # type: ignore
+        entity_registry_enabled_default=False,  # type: ignore
+        get_value=lambda api: api.statistics.flow_pauses,
+    ),
 ]
 
 
@@ -67,5 +203,5 @@ class NetworkSerialPortSensor(
         self._attr_device_info = DeviceInfo(identifiers={(DOMAIN, config_entry_id)})
 
     @property
-    def native_value(self) -> str | None:
+    def native_value(self) -> str | int | float | None:
         return self.entity_description.get_value(self.coordinator.api)
@@ -0,0 +1,108 @@
+"""Services for the Network serial port integration."""
+
+from __future__ import annotations
+
+import os
+
+import voluptuous as vol  # type: ignore
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+
+from .const import DOMAIN
+from .coordinator import NetworkSerialPortCoordinator
+
+SERVICE_START_CAPTURE = "start_capture"
+SERVICE_STOP_CAPTURE = "stop_capture"
+SERVICE_PROFILE = "profile"
+
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_SIZE = "size"
+ATTR_DURATION = "duration"
+
+STOP_CAPTURE_SCHEMA = vol.Schema({vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string})
+# Size of the capture ring file in KiB
+START_CAPTURE_SCHEMA = STOP_CAPTURE_SCHEMA.extend(
+    {vol.Optional(ATTR_SIZE, default=1024): vol.All(int, vol.Range(min=4, max=65536))}
+)
+# Seconds the hot paths are instrumented
+PROFILE_SCHEMA = STOP_CAPTURE_SCHEMA.extend(
+    {
+        vol.Optional(ATTR_DURATION, default=10): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=300)
+        )
+    }
+)
+
+
+def capture_path(hass: HomeAssistant, entry_id: str) -> str:
+    """Ring file with the captured traffic of a config entry."""
+    return hass.config.path(DOMAIN, f"{entry_id}.capture")
+
+
+def _get_coordinator(hass: HomeAssistant, call: ServiceCall) -> NetworkSerialPortCoordinator:
+    entry_id = call.data[ATTR_CONFIG_ENTRY_ID]
+    if (coordinator := hass.data.get(DOMAIN, {}).get(entry_id)) is None:
+        raise ServiceValidationError(
+            translation_domain=DOMAIN,
+            translation_key="entry_not_loaded",
+            translation_placeholders={"entry_id": entry_id},
+        )
+    return coordinator
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services, they apply to the bridge of the given config entry."""
+
+    async def start_capture(call: ServiceCall) -> ServiceResponse:
+        coordinator = _get_coordinator(hass, call)
+        path = capture_path(hass, call.data[ATTR_CONFIG_ENTRY_ID])
+        await hass.async_add_executor_job(
+            lambda: os.makedirs(os.path.dirname(path), exist_ok=True)
+        )
+        if not await coordinator.api.capture(path, call.data[ATTR_SIZE] * 1024):
+            raise HomeAssistantError(
+                translation_domain=DOMAIN, translation_key="capture_failed"
+            )
+        return {"path": path}
+
+    async def stop_capture(call: ServiceCall) -> ServiceResponse:
+        coordinator = _get_coordinator(hass, call)
+        await coordinator.api.capture(None)
+        return {"path": capture_path(hass, call.data[ATTR_CONFIG_ENTRY_ID])}
+
+    async def profile(call: ServiceCall) -> ServiceResponse:
+        coordinator = _get_coordinator(hass, call)
+        if (results := await coordinator.api.profile(call.data[ATTR_DURATION])) is None:
+            raise HomeAssistantError(
+                translation_domain=DOMAIN, translation_key="profile_failed"
+            )
+        return results
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_START_CAPTURE,
+        start_capture,
+        schema=START_CAPTURE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_STOP_CAPTURE,
+        stop_capture,
+        schema=STOP_CAPTURE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        profile,
+        schema=PROFILE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
@@ -6,28 +6,1709 @@
 #
 # SPDX-License-Identifier:    BSD-3-Clause
 
+import collections
+import errno
+import io
+import json
+import os
+import random
+import select
+import struct
 import sys
 import socket
+import stat
 import serial  # type: ignore
 import serial.threaded  # type: ignore
+import threading
 import time
+import types
+import zlib
+
+from capture import DEFAULT_CAPTURE_SIZE, DIRECTION_NET_TO_SERIAL, DIRECTION_SERIAL_TO_NET, CaptureRing  # type: ignore
+from discovery import resolve_url  # type: ignore
+from framing import FRAMING_NONE, FRAMINGS, SilenceFramer, create_framer, silence_interval  # type: ignore
+from metrics import COUNTER, GAUGE, HISTOGRAM, LATENCY_BUCKETS, SIZE_BUCKETS, Histogram, MetricFamily  # type: ignore
+from metrics import serve as serve_metrics  # type: ignore
+from ring_buffer import ByteRingBuffer  # type: ignore
+
+SLOW_CLIENT_DROP_OLDEST = 'drop-oldest'
+SLOW_CLIENT_DISCONNECT = 'disconnect'
+SLOW_CLIENT_BLOCK = 'block'
+
+# when max_clients are connected a new client waits in the backlog until one
+# disconnects, disconnects the oldest client or is disconnected right away
+TAKEOVER_WAIT = 'wait'
+TAKEOVER_NEWEST = 'newest'
+TAKEOVER_REJECT = 'reject'
+# seconds a new client waits for the slot of the client it takes over from,
+# it is rejected when that client does not let go in time
+TAKEOVER_TIMEOUT = 5.0
+
+# dead peer detection: after KEEPALIVE_IDLE seconds idle TCP keep-alive
+# packets are sent every KEEPALIVE_INTERVAL seconds, the connection is closed
+# after KEEPALIVE_COUNT unanswered ones
+KEEPALIVE_IDLE = 1
+KEEPALIVE_INTERVAL = 1
+KEEPALIVE_COUNT = 3
+
+# with the "block" policy the serial reader waits at most this long for a
+# slow client before that client is disconnected, only allowed with one client
+# as the others would wait as well
+BLOCK_TIMEOUT = 1.0
+
+# maximum number of bytes handed to a single sendall() call
+SEND_CHUNK_SIZE = 16384
+
+# size of the preallocated buffer the serial port is read into
+SERIAL_READ_SIZE = 4096
+
+# maximum number of bytes moved by a single splice() call
+SPLICE_SIZE = 65536
+# splice() errors meaning the kernel can not splice these file descriptors
+SPLICE_UNSUPPORTED = (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP)
+
+WRITE_MODE_IMMEDIATE = 'immediate'
+WRITE_MODE_THROUGHPUT = 'throughput'
+
+# as client, reconnect delays grow exponentially between these limits, a
+# connection that lasted RECONNECT_RESET_AFTER seconds starts over
+RECONNECT_DELAY_MIN = 0.1
+RECONNECT_DELAY_MAX = 30.0
+RECONNECT_RESET_AFTER = 10.0
+CONNECT_TIMEOUT = 5.0
+
+# compressed connections, see --compress
+COMPRESS_LEVEL = 6
+# ms at most that the compressed stream holds data back before a flush
+COMPRESS_FLUSH = 10
+
+# with rtscts or xonxoff the device is paused when the fullest client queue
+# passes the high water mark and released below the low water mark, in
+# percent of --client-queue-size
+FLOW_HIGH_WATER = 75
+FLOW_LOW_WATER = 25
+# seconds between checks of CTS while the device holds it low
+CTS_POLL_INTERVAL = 0.01
+
+# reopening a lost serial port, the delay doubles from min to max
+REOPEN_DELAY_MIN = 0.1
+REOPEN_DELAY_MAX = 5.0
+# data from clients while the serial port is lost, written after reopening
+OUTAGE_BUFFER_SIZE = 4096
+
+# with --on-demand the serial port is closed after this many seconds without
+# client, a connecting client waits at most OPEN_TIMEOUT for it to open
+IDLE_CLOSE = 30.0
+OPEN_TIMEOUT = 5.0
+
+# settings when not given, also used for the --config-json fast path
+DEFAULTS = {
+    'BAUDRATE': 9600,
+    'quiet': False,
+    'stats_interval': 0,
+    'low_latency': False,
+    'event_fd': None,
+    'stdin_commands': False,
+    'develop': False,
+    'bytesize': 8,
+    'parity': 'N',
+    'stopbits': 1,
+    'rtscts': False,
+    'xonxoff': False,
+    'rts': None,
+    'dtr': None,
+    'splice': False,
+    'write_mode': WRITE_MODE_IMMEDIATE,
+    'coalesce_size': 4096,
+    'coalesce_window': 2,
+    'framing': FRAMING_NONE,
+    'capture': None,
+    'capture_size': DEFAULT_CAPTURE_SIZE,
+    'metrics_port': 0,
+    'metrics_bind': '127.0.0.1',
+    'metrics_socket': None,
+    'on_demand': False,
+    'idle_close': IDLE_CLOSE,
+    'localport': 7777,
+    'unix_socket': None,
+    'unix_socket_mode': None,
+    'client': False,
+    'recv_size': 1024,
+    'max_clients': 1,
+    'client_queue_size': 65536,
+    'slow_client_policy': SLOW_CLIENT_DROP_OLDEST,
+    'takeover': TAKEOVER_WAIT,
+    'keepalive_idle': KEEPALIVE_IDLE,
+    'keepalive_interval': KEEPALIVE_INTERVAL,
+    'keepalive_count': KEEPALIVE_COUNT,
+    'user_timeout': 0,
+    'compress': False,
+    'compress_level': COMPRESS_LEVEL,
+    'compress_flush': COMPRESS_FLUSH,
+    'flow_high_water': FLOW_HIGH_WATER,
+    'flow_low_water': FLOW_LOW_WATER,
+}
+
+
+class EventChannel(object):
+    """\
+    Machine readable events for the supervising process. Every event is a
+    JSON object written as a 4 byte big endian length followed by the UTF-8
+    encoded JSON to the file descriptor given with --event-fd.
+    """
+
+    def __init__(self):
+        self._file = None
+        self._lock = threading.Lock()
+
+    def open(self, fd):
+        self._file = os.fdopen(fd, 'wb', buffering=0)
+
+    def emit(self, event, **fields):
+        if self._file is None:
+            return
+        fields['event'] = event
+        payload = json.dumps(fields).encode('utf-8')
+        with self._lock:
+            try:
+                self._file.write(struct.pack('>I', len(payload)) + payload)
+            except (BrokenPipeError, ValueError):
+                # supervising process is gone, nothing left to report to
+                self._file = None
+
+
+events = EventChannel()
+
+# human readable progress messages on stderr, disabled with --quiet
+verbose = True
+
+
+def info(message):
+    if verbose:
+        sys.stderr.write(message)
+
+
+class LatencyStatistics(object):
+    """Count, average and maximum of measured per chunk latencies"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        if latency > self.maximum:
+            self.maximum = latency
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'average_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'max_ms': self.maximum * 1000,
+        }
+
+    def __str__(self):
+        return 'avg {average_ms:.3f} ms max {max_ms:.3f} ms over {count} chunks'.format(**self.as_dict())
+
+
+class Histograms(object):
+    """Distributions for the metrics endpoint, only collected while it is enabled"""
+
+    def __init__(self):
+        self.serial_to_net_chunk_size = Histogram(SIZE_BUCKETS)
+        self.net_to_serial_chunk_size = Histogram(SIZE_BUCKETS)
+        # time from reading a chunk from the serial port until it was sent
+        self.forward_latency = Histogram(LATENCY_BUCKETS)
+        # time spent in sendall(), long when the client does not keep up
+        self.send_blocking = Histogram(LATENCY_BUCKETS)
+
+
+# Histograms with --metrics-port or --metrics-socket, None skips collecting
+histograms = None
+
+
+class ProfileSection(object):
+    """Calls of a hot path section with their wall clock and CPU time"""
+
+    __slots__ = ('count', 'wall', 'cpu', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.maximum = 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'wall_ms': self.wall * 1000,
+            'cpu_ms': self.cpu * 1000,
+            'max_ms': self.maximum * 1000,
+        }
+
+
+class Profiler(object):
+    """\
+    Instrumentation of the hot paths while profiling, see start_profile().
+    Records the wall clock and CPU time of the sections, the number of
+    system calls made for them and the chunk sizes. The CPU time shows the
+    cost of a section, the wall clock time of recv and sendall includes
+    waiting for the network.
+    """
+
+    SECTIONS = ('data_received', 'sendall', 'recv', 'serial_write')
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.sections = {name: ProfileSection() for name in self.SECTIONS}
+        self.syscalls: collections.Counter[str] = collections.Counter()
+        self.serial_to_net_chunk_size = Histogram(SIZE_BUCKETS)
+        self.net_to_serial_chunk_size = Histogram(SIZE_BUCKETS)
+        self._started = time.monotonic()
+        self._cpu_started = time.process_time()
+
+    def add(self, section, started, cpu_started):
+        """Account the time since started and cpu_started (time.thread_time()) to section"""
+        wall = time.monotonic() - started
+        stats = self.sections[section]
+        stats.count += 1
+        stats.wall += wall
+        stats.cpu += time.thread_time() - cpu_started
+        if wall > stats.maximum:
+            stats.maximum = wall
+
+    def results(self):
+        def distribution(histogram):
+            bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+            return {bound: count for bound, count in zip(bounds, list(histogram.counts)) if count}
+
+        return {
+            'duration': time.monotonic() - self._started,
+            'cpu_seconds': time.process_time() - self._cpu_started,
+            'sections': {name: stats.as_dict() for name, stats in self.sections.items()},
+            'syscalls': dict(self.syscalls),
+            'chunk_size': {
+                'serial_to_net': distribution(self.serial_to_net_chunk_size),
+                'net_to_serial': distribution(self.net_to_serial_chunk_size),
+            },
+        }
+
+
+def format_profile(results):
+    """Human readable profile results"""
+    lines = ['--- profile of {:.1f} s, {:.3f} s CPU ({:.1f} %)'.format(
+        results['duration'], results['cpu_seconds'],
+        results['cpu_seconds'] / results['duration'] * 100 if results['duration'] else 0)]
+    for name, stats in results['sections'].items():
+        lines.append('  {:<14} {count:>8} calls  cpu {cpu_ms:10.3f} ms  wall {wall_ms:10.3f} ms  '
+                     'max {max_ms:8.3f} ms'.format(name, **stats))
+    lines.append('  system calls: {}'.format(
+        ', '.join('{} {}'.format(name, count) for name, count in sorted(results['syscalls'].items())) or 'none'))
+    for direction, distribution in results['chunk_size'].items():
+        lines.append('  chunk sizes {}: {}'.format(
+            direction, ', '.join('<={} {}'.format(bound, count) for bound, count in distribution.items()) or 'none'))
+    return '\n'.join(lines)
+
+
+# Profiler while profiling, None skips the instrumentation
+profiler = None
+
+
+def start_profile(duration):
+    """Instrument the hot paths for duration seconds, then report the results"""
+    global profiler
+    current = profiler = Profiler(duration)
+    info('--- profiling for {} s ---\n'.format(duration))
+
+    def stop():
+        global profiler
+        if profiler is not current:
+            # replaced by a newer profile
+            return
+        profiler = None
+        results = current.results()
+        report = format_profile(results)
+        events.emit('profile', success=True, results=results, report=report)
+        info('{}\n'.format(report))
+
+    timer = threading.Timer(duration, stop)
+    timer.daemon = True
+    timer.start()
+
+
+class ClientConnection(object):
+    """\
+    A connected network client. Data for the client is put in a bounded
+    ring buffer and sent by a dedicated writer thread, so a slow client can
+    not stall the serial reader.
+
+    When framed, every send() is a frame. Its boundaries are kept in the ring
+    buffer so each frame is sent with one write, and drop-oldest drops whole
+    frames.
+
+    With a compress level both directions are a zlib stream. The sent stream
+    is flushed at the latest compress_flush seconds after the oldest data
+    the compressor holds back, so data is not held back under steady
+    traffic either.
+    """
+
+    def __init__(self, sock, addr, queue_size, policy, framed=False, compress_level=None,
+                 compress_flush=COMPRESS_FLUSH / 1000, flow=None):
+        self.socket = sock
+        self.addr = addr
+        self.policy = policy
+        self.buffer = ByteRingBuffer(queue_size)
+        # lengths of the frames in the buffer, oldest first
+        self.frames: collections.deque[int] | None = collections.deque() if framed else None
+        # time from reading a chunk from the serial port until it was sent
+        self.send_latency = LatencyStatistics()
+        # time from receiving a chunk until it was written to the serial port
+        self.write_latency = LatencyStatistics()
+        self.written_bytes = 0
+        self.written_chunks = 0
+        # failed socket sends and receives
+        self.send_errors = 0
+        self.recv_errors = 0
+        self.compressor = None
+        self.decompressor = None
+        if compress_level is not None:
+            self.compressor = zlib.compressobj(compress_level)
+            self.decompressor = zlib.decompressobj()
+        self.compress_flush = compress_flush
+        # FlowControl, told when the queue shrinks while the device is paused
+        self.flow = flow
+        # bytes before and after compression, sent and received
+        self.uncompressed_sent = 0
+        self.compressed_sent = 0
+        self.uncompressed_received = 0
+        self.compressed_received = 0
+        self._pending_since = 0.0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def send(self, data):
+        """Queue data for the client, never blocks longer than BLOCK_TIMEOUT"""
+        with self._condition:
+            if self._closed:
+                return
+            if len(data) > self.buffer.free and self.policy != SLOW_CLIENT_DROP_OLDEST:
+                if self.policy == SLOW_CLIENT_BLOCK:
+                    self._condition.wait_for(
+                        lambda: self._closed or len(data) <= self.buffer.free,
+                        BLOCK_TIMEOUT)
+                    if self._closed:
+                        return
+                if len(data) > self.buffer.free:
+                    self.buffer.overflow_bytes += len(data)
+                    self.buffer.overflow_count += 1
+                    sys.stderr.write('Client {} too slow, disconnecting\n'.format(self.addr))
+                    self._close_locked()
+                    return
+            if self.frames is not None:
+                if len(data) > self.buffer.size:
+                    self.buffer.overflow_bytes += len(data)
+                    self.buffer.overflow_count += 1
+                    return
+                while len(data) > self.buffer.free:
+                    dropped = self.frames.popleft()
+                    self.buffer.read(dropped)
+                    self.buffer.overflow_bytes += dropped
+                    self.buffer.overflow_count += 1
+                self.frames.append(len(data))
+            if not len(self.buffer):
+                self._pending_since = time.monotonic()
+            # overwrites the oldest data when full
+            self.buffer.write(data)
+            self._condition.notify_all()
+
+    def statistics_event(self):
+        with self._condition:
+            return {
+                'client': self.addr[0],
+                'port': self.addr[1],
+                'buffer_size': self.buffer.size,
+                'high_water': self.buffer.high_water,
+                'overflow_bytes': self.buffer.overflow_bytes,
+                'overflow_count': self.buffer.overflow_count,
+                'send_latency': self.send_latency.as_dict(),
+                'write_latency': self.write_latency.as_dict(),
+                'uncompressed_sent': self.uncompressed_sent,
+                'compressed_sent': self.compressed_sent,
+                'uncompressed_received': self.uncompressed_received,
+                'compressed_received': self.compressed_received,
+            }
+
+    def statistics(self):
+        with self._condition:
+            text = ('high water mark {} of {} bytes, {} bytes dropped in {} overflows, '
+                    'serial->net latency {}, net->serial latency {}'.format(
+                        self.buffer.high_water,
+                        self.buffer.size,
+                        self.buffer.overflow_bytes,
+                        self.buffer.overflow_count,
+                        self.send_latency,
+                        self.write_latency))
+            if self.compressor is not None:
+                text += ', compressed {} to {} bytes sent, {} to {} bytes received'.format(
+                    self.uncompressed_sent, self.compressed_sent,
+                    self.compressed_received, self.uncompressed_received)
+            return text
+
+    def _write_loop(self):
+        # the compressor holds data back until flushed, since when
+        unflushed_since: float | None = None
+        while True:
+            with self._condition:
+                if unflushed_since is None:
+                    timeout = None
+                else:
+                    timeout = max(0.0, unflushed_since + self.compress_flush - time.monotonic())
+                ready = self._condition.wait_for(
+                    lambda: self._closed or len(self.buffer), timeout)
+                if self._closed:
+                    return
+                if ready:
+                    if self.frames is not None:
+                        data = self.buffer.read(self.frames.popleft())
+                    else:
+                        data = self.buffer.read(SEND_CHUNK_SIZE)
+                    pending_since = self._pending_since
+                    if len(self.buffer):
+                        self._pending_since = time.monotonic()
+                    self._condition.notify_all()
+            flow = self.flow
+            if ready and flow is not None and flow.paused:
+                flow.check()
+            if self.compressor is not None:
+                if ready:
+                    self.uncompressed_sent += len(data)
+                    data = self.compressor.compress(data)
+                    if unflushed_since is None:
+                        unflushed_since = pending_since
+                else:
+                    data = b''
+                if unflushed_since is not None and time.monotonic() - unflushed_since >= self.compress_flush:
+                    # send what the compressor held back, also under steady traffic
+                    data += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+                    pending_since, unflushed_since = unflushed_since, None
+                self.compressed_sent += len(data)
+                if not data:
+                    continue
+            h = histograms
+            p = profiler
+            send_started = time.monotonic() if h is not None or p is not None else 0.0
+            if p is not None:
+                cpu_started = time.thread_time()
+            try:
+                self.socket.sendall(data)
+            except socket.error as msg:
+                self.send_errors += 1
+                sys.stderr.write('ERROR: {}\n'.format(msg))
+                self.close()
+                return
+            if p is not None:
+                p.add('sendall', send_started, cpu_started)
+                p.syscalls['sendall'] += 1
+            sent_at = time.monotonic()
+            self.send_latency.add(sent_at - pending_since)
+            if h is not None:
+                h.send_blocking.observe(sent_at - send_started)
+                h.forward_latency.observe(sent_at - pending_since)
+
+    def _close_locked(self):
+        self._closed = True
+        self._condition.notify_all()
+        # wakes up the network -> serial loop blocked in recv()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def close(self):
+        with self._condition:
+            if not self._closed:
+                self._close_locked()
 
 
 class SerialToNet(serial.threaded.Protocol):
     """serial->socket"""
 
-    def __init__(self):
-        self.socket = None
+    def __init__(self, framer=None):
+        self.clients = []
+        self._lock = threading.Lock()
+        # splits the data into frames, None forwards it as it is read
+        self.framer = framer
+        self.serial_to_net_bytes = 0
+        self.serial_to_net_chunks = 0
+        self.connects = 0
+        # clients that disconnected the oldest client, or were rejected
+        self.takeovers = 0
+        self.rejects = 0
+        # as client, time from losing the connection until connected again
+        self.reconnect_latency = LatencyStatistics()
+        # time from losing the serial port until it was opened again
+        self.recover_latency = LatencyStatistics()
+        # on demand, time from a client connecting until the closed port was open
+        self.open_latency = LatencyStatistics()
+        # totals of clients that are no longer connected
+        self._net_to_serial_bytes = 0
+        self._net_to_serial_chunks = 0
+        self._high_water = 0
+        self._overflow_bytes = 0
+        self._overflow_count = 0
+        self._send_errors = 0
+        self._recv_errors = 0
+        self._uncompressed_bytes = 0
+        self._compressed_bytes = 0
+        # serial port read failures, counted as serial->net errors
+        self.serial_errors = 0
+        # FlowControl when pausing the device is enabled
+        self.flow = None
 
     def __call__(self):
         return self
 
+    def add_client(self, client):
+        with self._lock:
+            self.clients = self.clients + [client]
+            self.connects += 1
+
+    def remove_client(self, client):
+        with self._lock:
+            if client in self.clients:
+                self._net_to_serial_bytes += client.written_bytes
+                self._net_to_serial_chunks += client.written_chunks
+                self._high_water = max(self._high_water, client.buffer.high_water)
+                self._overflow_bytes += client.buffer.overflow_bytes
+                self._overflow_count += client.buffer.overflow_count
+                self._send_errors += client.send_errors
+                self._recv_errors += client.recv_errors
+                self._uncompressed_bytes += client.uncompressed_sent + client.uncompressed_received
+                self._compressed_bytes += client.compressed_sent + client.compressed_received
+            self.clients = [c for c in self.clients if c is not client]
+        if self.flow is not None and self.flow.paused:
+            # its queue no longer counts
+            self.flow.check()
+
+    def statistics_event(self):
+        """Traffic totals since start"""
+        with self._lock:
+            clients = self.clients
+            return {
+                'serial_to_net_bytes': self.serial_to_net_bytes,
+                'serial_to_net_chunks': self.serial_to_net_chunks,
+                'net_to_serial_bytes': self._net_to_serial_bytes + sum(c.written_bytes for c in clients),
+                'net_to_serial_chunks': self._net_to_serial_chunks + sum(c.written_chunks for c in clients),
+                'high_water': max([self._high_water] + [c.buffer.high_water for c in clients]),
+                'overflow_bytes': self._overflow_bytes + sum(c.buffer.overflow_bytes for c in clients),
+                'overflow_count': self._overflow_count + sum(c.buffer.overflow_count for c in clients),
+                'serial_to_net_errors': self.serial_errors + self._send_errors + sum(c.send_errors for c in clients),
+                'net_to_serial_errors': self._recv_errors + sum(c.recv_errors for c in clients),
+                # both directions, only of compressed connections
+                'uncompressed_bytes': self._uncompressed_bytes + sum(
+                    c.uncompressed_sent + c.uncompressed_received for c in clients),
+                'compressed_bytes': self._compressed_bytes + sum(
+                    c.compressed_sent + c.compressed_received for c in clients),
+                'connects': self.connects,
+                'takeovers': self.takeovers,
+                'rejects': self.rejects,
+                'reconnects': self.reconnect_latency.count,
+                'reconnect_latency_ms': self.reconnect_latency.as_dict()['average_ms'],
+                'reconnect_latency_max_ms': self.reconnect_latency.maximum * 1000,
+                'serial_recoveries': self.recover_latency.count,
+                'serial_recover_ms': self.recover_latency.as_dict()['average_ms'],
+                'serial_recover_max_ms': self.recover_latency.maximum * 1000,
+                'serial_opens': self.open_latency.count,
+                'serial_open_ms': self.open_latency.as_dict()['average_ms'],
+                'serial_open_max_ms': self.open_latency.maximum * 1000,
+                'flow_pauses': self.flow.pauses if self.flow is not None else 0,
+                'flow_paused_ms': self.flow.pause_time.total * 1000 if self.flow is not None else 0.0,
+                'cts_pauses': self.flow.cts_pauses if self.flow is not None else 0,
+            }
+
     def data_received(self, data):
+        self.serial_to_net_bytes += len(data)
+        self.serial_to_net_chunks += 1
+        h = histograms
+        if h is not None:
+            h.serial_to_net_chunk_size.observe(len(data))
+        ring = capture
+        if ring is not None:
+            ring.write(DIRECTION_SERIAL_TO_NET, data)
+        if self.framer is None:
+            self._send(data)
+            return
+        for frame in self.framer.feed(data):
+            self._send(frame)
+
+    def next_timeout(self):
+        """Seconds until timeout_expired() is due, None when nothing is pending"""
+        return self.framer.timeout() if self.framer is not None else None
+
+    def timeout_expired(self):
+        """No data for a while, send the frame in progress"""
+        frame = self.framer.flush()
+        if frame:
+            self._send(frame)
+
+    def _send(self, data):
+        # clients is replaced, not modified, so no lock needed to iterate
+        for client in self.clients:
+            client.send(data)
+        if self.flow is not None:
+            self.flow.check()
+
+    def connection_interrupted(self, exc):
+        """Serial port lost, the reader thread is opening it again"""
+        self.serial_errors += 1
+        events.emit('serial_lost', message=str(exc))
+        sys.stderr.write('WARNING: serial port lost, reopening: {}\n'.format(exc))
+
+    def connection_resumed(self, downtime):
+        self.recover_latency.add(downtime)
+        events.emit('serial_recovered', recover_ms=downtime * 1000)
+        info('--- serial port reopened after {:.3f} s ---\n'.format(downtime))
+
+    def connection_suspended(self):
+        """On demand, the serial port was closed without clients"""
+        events.emit('serial_closed')
+        info('--- serial port closed, no clients ---\n')
+
+    def connection_reopened(self, latency):
+        self.open_latency.add(latency)
+        events.emit('serial_opened', open_ms=latency * 1000)
+        info('--- serial port opened in {:.3f} s ---\n'.format(latency))
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            events.emit('error', message='Serial port error: {}'.format(exc), fatal=True)
+        super(SerialToNet, self).connection_lost(exc)
+
+
+class Listener(object):
+    """\
+    Listening server socket that can be moved to another port while running.
+    Connected clients are not affected by a move.
+
+    Optionally also listens on a Unix domain socket, for clients on the same
+    host. Port 0 only listens on the Unix domain socket, it is rejected
+    without one as nothing could connect.
+    """
+
+    def __init__(self, port, unix_socket=None, unix_socket_mode=None):
+        if not port and not unix_socket:
+            raise ValueError('port 0 needs a Unix domain socket')
+        self.port = port
+        self.socket = self._bind(port) if port else None
+        self.unix_path = unix_socket
+        self.unix_socket = None
+        if unix_socket:
+            try:
+                self.unix_socket = self._bind_unix(unix_socket, unix_socket_mode)
+            except (socket.error, EnvironmentError):
+                if self.socket is not None:
+                    self.socket.close()
+                raise
+
+    @staticmethod
+    def _bind(port, host=''):
+        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            srv.bind((host, port))
+        except socket.error:
+            srv.close()
+            raise
+        srv.listen(1)
+        return srv
+
+    @staticmethod
+    def _bind_unix(path, mode):
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                # left behind by an earlier run
+                os.unlink(path)
+            else:
+                raise socket.error(errno.EADDRINUSE, 'Address already in use: {}'.format(path))
+            finally:
+                probe.close()
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            srv.bind(path)
+            if mode is not None:
+                # before listen(), so nobody connects with the default permissions
+                os.chmod(path, mode)
+        except (socket.error, EnvironmentError):
+            srv.close()
+            raise
+        srv.listen(1)
+        return srv
+
+    def accept(self):
+        """Wait for a client on any of the sockets, returns the socket and address"""
+        while True:
+            waiting = [srv for srv in (self.socket, self.unix_socket) if srv is not None]
+            srv = select.select(waiting, [], [])[0][0]
+            try:
+                client_socket, addr = srv.accept()
+            except socket.error:
+                if srv is self.socket or srv is self.unix_socket:
+                    raise
+                # moved to another port while waiting
+                srv.close()
+                continue
+            if srv is self.unix_socket:
+                # unnamed, use the socket path and the process id of the peer
+                pid = 0
+                if hasattr(socket, 'SO_PEERCRED'):
+                    creds = client_socket.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+                    pid = struct.unpack('3i', creds)[0]
+                addr = (self.unix_path, pid)
+            return client_socket, addr
+
+    def rebind(self, port):
+        """Listen on port instead, keeps the current port when binding fails"""
+        if not port and self.unix_socket is None:
+            raise ValueError('port 0 needs a Unix domain socket')
+        srv = self._bind(port) if port else None
+        previous, self.socket, self.port = self.socket, srv, port
+        if previous is not None:
+            # wakes up accept(), closing alone does not on Linux
+            previous.shutdown(socket.SHUT_RDWR)
+
+    def close(self):
         if self.socket is not None:
-            self.socket.sendall(data)
+            self.socket.close()
+        if self.unix_socket is not None:
+            self.unix_socket.close()
+            try:
+                os.unlink(self.unix_path)
+            except EnvironmentError:
+                pass
 
 
-if __name__ == '__main__':  # noqa
+# serial settings that can be changed on the open port
+SERIAL_SETTINGS = ('baudrate', 'bytesize', 'parity', 'stopbits', 'rtscts', 'xonxoff')
+
+
+def configure(serial_worker, listener, ser_to_net, settings):
+    """Apply new settings to the open serial port and the listener"""
+    if listener is not None and settings.get('localport', listener.port) != listener.port:
+        listener.rebind(settings['localport'])
+        info('Waiting for connection on {}...\n'.format(listener.port))
+    serial_worker.configure_serial(settings)
+    ser = serial_worker.serial
+    if ser_to_net.flow is not None:
+        # releases the device when flow control was disabled
+        ser_to_net.flow.check()
+    if isinstance(ser_to_net.framer, SilenceFramer):
+        # the pause that ends a frame depends on the character time
+        ser_to_net.framer.interval = silence_interval(ser.baudrate, ser.bytesize, ser.parity, ser.stopbits)
+    info('--- Serial port settings {p.baudrate},{p.bytesize},{p.parity},{p.stopbits} ---\n'.format(p=ser))
+
+
+def process_commands(stream, serial_worker, listener, ser_to_net):
+    """\
+    Handle JSON commands, one per line, until the stream is closed:
+
+        {"command": "configure", "settings": {"baudrate": 9600, "localport": 7778}}
+        {"command": "capture", "path": "/tmp/port.capture", "size": 1048576}
+        {"command": "capture", "path": null}
+        {"command": "profile", "duration": 10}
+    """
+    for line in stream:
+        try:
+            command = json.loads(line)
+        except ValueError as e:
+            sys.stderr.write('ERROR: invalid command {!r}: {}\n'.format(line, e))
+            continue
+        if command.get('command') == 'configure':
+            try:
+                configure(serial_worker, listener, ser_to_net, command['settings'])
+            except (KeyError, ValueError, serial.SerialException, socket.error) as e:
+                events.emit('configured', success=False, message=str(e))
+                sys.stderr.write('ERROR: could not apply settings: {}\n'.format(e))
+            else:
+                events.emit('configured', success=True, message=None)
+        elif command.get('command') == 'capture':
+            try:
+                set_capture(command.get('path'), command.get('size', DEFAULT_CAPTURE_SIZE))
+            except (ValueError, EnvironmentError) as e:
+                events.emit('capture', success=False, message=str(e))
+                sys.stderr.write('ERROR: could not start capture: {}\n'.format(e))
+            else:
+                events.emit('capture', success=True, message=None)
+        elif command.get('command') == 'profile':
+            try:
+                duration = float(command.get('duration', 10))
+            except (TypeError, ValueError) as e:
+                events.emit('profile', success=False, message=str(e))
+                sys.stderr.write('ERROR: invalid profile duration: {}\n'.format(e))
+            else:
+                start_profile(duration)
+        else:
+            sys.stderr.write('ERROR: unknown command {!r}\n'.format(command.get('command')))
+
+
+class NetworkMonitor(object):
+    """\
+    Notices network changes, e.g. an interface coming up or getting an
+    address, with a netlink route socket. Only available on Linux, elsewhere
+    wait() just sleeps.
+    """
+
+    # multicast groups of interest
+    GROUPS = 0x1 | 0x10 | 0x40 | 0x100  # LINK, IPV4_IFADDR, IPV4_ROUTE, IPV6_IFADDR
+
+    def __init__(self):
+        self._socket: socket.socket | None = None
+        try:
+            self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self._socket.bind((0, self.GROUPS))
+        except (AttributeError, socket.error):
+            self._socket = None
+
+    def _drain(self, sock):
+        changed = False
+        while select.select([sock], [], [], 0)[0]:
+            sock.recv(65536)
+            changed = True
+        return changed
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds, returns True when the network changed"""
+        sock = self._socket
+        if sock is None:
+            time.sleep(timeout)
+            return False
+        # forget changes while connected, only new ones are of interest
+        self._drain(sock)
+        if not select.select([sock], [], [], timeout)[0]:
+            return False
+        # one change usually comes with a burst of messages
+        time.sleep(0.05)
+        return self._drain(sock)
+
+
+def wait_for_reconnect(network_monitor, delay):
+    """Wait before reconnecting as client, returns the delay for the next attempt"""
+    # jitter, so many bridges do not all reconnect at once after an outage
+    if network_monitor.wait(random.uniform(delay / 2, delay)):
+        info('Network changed, reconnecting\n')
+        return RECONNECT_DELAY_MIN
+    return min(delay * 2, RECONNECT_DELAY_MAX)
+
+
+class SerialReaderThread(serial.threaded.ReaderThread):
+    """\
+    ReaderThread that reads into a preallocated buffer with readv() when the
+    serial port has a file descriptor, instead of creating a new bytes object
+    for every read. Other ports (e.g. rfc2217://) use the normal read().
+
+    When a url is given a lost port (e.g. USB adapter reset) is opened again
+    from that url with backoff, so hwgrep:// is resolved again. Data written
+    in the meantime is buffered, the oldest is dropped when the buffer is
+    full. The protocol is told with connection_interrupted() and
+    connection_resumed() when it has these methods.
+
+    With idle_close the port is only open while it is used: it is closed
+    when there was no user for idle_close seconds, and opened again (from
+    the url) by acquire(). Users call release() when done. The protocol is
+    told with connection_suspended() and connection_reopened().
+
+    The data passed to the protocol is only valid during data_received().
+    """
+
+    def __init__(self, serial_instance, protocol_factory, url=None, low_latency=False, idle_close=None):
+        super(SerialReaderThread, self).__init__(serial_instance, protocol_factory)
+        self.url = url
+        self.low_latency = low_latency
+        # cleared while the port is lost
+        self.online = threading.Event()
+        self.online.set()
+        # on demand, cleared while the port should be closed
+        self.idle_close = idle_close
+        self.wanted = threading.Event()
+        if idle_close is None:
+            self.wanted.set()
+        self.users = 0
+        self._idle_timer = None
+        self._outage_buffer = ByteRingBuffer(OUTAGE_BUFFER_SIZE)
+        # settings changed while running, applied again to a reopened port
+        self._settings = {}
+        # writes that failed because the port was lost
+        self.write_errors = 0
+        # FlowControl, the port is not read while the device is paused
+        self.flow = None
+        self._stopping = threading.Event()
+        self.fd = self._fileno(serial_instance)
+        self.io_path = 'read' if self.fd is None else 'readinto'
+
+    @staticmethod
+    def _fileno(ser):
+        try:
+            return ser.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+
+    @property
+    def write_lock(self):
+        """Held while writing to the serial port"""
+        return self._lock
+
+    def write(self, data):
+        """Thread safe writing, buffers the data while the port is lost"""
+        with self._lock:
+            if self.online.is_set():
+                try:
+                    return self.serial.write(data)
+                except serial.SerialException:
+                    self.write_errors += 1
+                    if self.url is None:
+                        raise
+                    # lost, the reader notices as well and opens it again
+            self._outage_buffer.write(data)
+            return len(data)
+
+    def configure_serial(self, settings):
+        """Thread safe change of the serial settings, kept when the port is opened again"""
+        with self._lock:
+            self._settings.update(
+                (key, value) for key, value in settings.items()
+                if key in SERIAL_SETTINGS or (key in ('rts', 'dtr') and value is not None))
+            self._apply_settings(self.serial)
+
+    def _apply_settings(self, ser):
+        ser.apply_settings({key: value for key, value in self._settings.items() if key in SERIAL_SETTINGS})
+        if 'rts' in self._settings:
+            ser.rts = self._settings['rts']
+        if 'dtr' in self._settings:
+            ser.dtr = self._settings['dtr']
+
+    def acquire(self):
+        """A client needs the port, opens it when it is closed on demand"""
+        with self._lock:
+            self.users += 1
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+        self.wanted.set()
+
+    def release(self):
+        """The client no longer needs the port, closed after idle_close without users"""
+        with self._lock:
+            self.users -= 1
+            if self.users or self.idle_close is None:
+                return
+            self._idle_timer = threading.Timer(self.idle_close, self._idle)
+            self._idle_timer.daemon = True
+            self._idle_timer.start()
+
+    def _idle(self):
+        with self._lock:
+            if not self.users:
+                # the read loop notices within a second and closes the port
+                self.wanted.clear()
+                if hasattr(self.serial, 'cancel_read'):
+                    # a read without timeout would not notice
+                    self.serial.cancel_read()
+
+    def stop(self):
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+        self._stopping.set()
+        # wakes up a closed port waiting for a user
+        self.wanted.set()
+        super(SerialReaderThread, self).stop()
+
+    def run(self):
+        if not hasattr(self.serial, 'cancel_read'):
+            self.serial.timeout = 1
+        self.protocol = self.protocol_factory()
+        try:
+            self.protocol.connection_made(self)
+        except Exception as e:
+            self.alive = False
+            self.protocol.connection_lost(e)
+            self._connection_made.set()
+            return
+        self._connection_made.set()
+
+        error = None
+        buffer = memoryview(bytearray(SERIAL_READ_SIZE))
+        while self.alive:
+            try:
+                lost = self._read_loop(buffer)
+            except Exception as e:
+                # raised by the protocol
+                error = e
+                break
+            if lost is None and self.alive and not self.wanted.is_set() and self.url is not None:
+                if not self._close_until_wanted():
+                    break
+                continue
+            if lost is None or not self.alive or self.url is None:
+                error = lost
+                break
+            if not self._reopen(lost):
+                break
+        self.alive = False
+        self.protocol.connection_lost(error)
+        self.protocol = None
+
+    def _read_loop(self, buffer):
+        """Read until stopped or the port is lost, returns the error when lost"""
+        if self.fd is None:
+            while self.alive and self.serial.is_open and self.wanted.is_set():
+                flow = self.flow
+                if flow is not None and flow.paused:
+                    flow.resumed.wait(1)
+                    continue
+                try:
+                    # read all that is there or wait for one byte (blocking)
+                    data = self.serial.read(self.serial.in_waiting or 1)
+                except serial.SerialException as e:
+                    return e
+                if not data:
+                    continue
+                p = profiler
+                if p is None:
+                    self.protocol.data_received(data)
+                    continue
+                started, cpu_started = time.monotonic(), time.thread_time()
+                self.protocol.data_received(data)
+                p.add('data_received', started, cpu_started)
+                p.syscalls['read'] += 1
+                p.serial_to_net_chunk_size.observe(len(data))
+            return None
+
+        # cancel_read() writes to this pipe when stopping
+        abort = getattr(self.serial, 'pipe_abort_read_r', None)
+        wait_for = [self.fd] if abort is None else [self.fd, abort]
+        while self.alive and self.serial.is_open and self.wanted.is_set():
+            flow = self.flow
+            if flow is not None and flow.paused:
+                # what the device still sends stays in the driver
+                flow.resumed.wait(1)
+                continue
+            timeout = self.protocol.next_timeout()
+            try:
+                if self.fd not in select.select(wait_for, [], [], 1 if timeout is None else timeout)[0]:
+                    if timeout is not None:
+                        self.protocol.timeout_expired()
+                    continue
+                length = os.readv(self.fd, [buffer])
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError as e:
+                return serial.SerialException('read failed: {}'.format(e))
+            if not length:
+                # a tty returns EOF on hangup, e.g. USB adapter unplugged
+                return serial.SerialException('device reports readiness to read but returned no data '
+                                              '(device disconnected or multiple access on port?)')
+            p = profiler
+            if p is None:
+                self.protocol.data_received(buffer[:length])
+                continue
+            started, cpu_started = time.monotonic(), time.thread_time()
+            self.protocol.data_received(buffer[:length])
+            p.add('data_received', started, cpu_started)
+            p.syscalls['select'] += 1
+            p.syscalls['readv'] += 1
+            p.serial_to_net_chunk_size.observe(length)
+        return None
+
+    def _reopen(self, error):
+        """Open the lost port again with backoff, returns False when stopped"""
+        lost_at = time.monotonic()
+        with self._lock:
+            self.online.clear()
+            previous = self.serial
+            try:
+                previous.close()
+            except (serial.SerialException, EnvironmentError):
+                pass
+        if hasattr(self.protocol, 'connection_interrupted'):
+            self.protocol.connection_interrupted(error)
+
+        if not self._open_with_backoff(previous, REOPEN_DELAY_MIN):
+            return False
+        if self.protocol is not None and hasattr(self.protocol, 'connection_resumed'):
+            self.protocol.connection_resumed(time.monotonic() - lost_at)
+        return True
+
+    def _close_until_wanted(self):
+        """Close the unused port until acquire(), returns False when stopped"""
+        with self._lock:
+            self.online.clear()
+            previous = self.serial
+            try:
+                previous.close()
+            except (serial.SerialException, EnvironmentError):
+                pass
+        if hasattr(self.protocol, 'connection_suspended'):
+            self.protocol.connection_suspended()
+        self.wanted.wait()
+        if self._stopping.is_set():
+            return False
+        requested_at = time.monotonic()
+        # the first attempt right away, the device is expected to be there
+        if not self._open_with_backoff(previous, 0):
+            return False
+        if hasattr(self.protocol, 'connection_reopened'):
+            self.protocol.connection_reopened(time.monotonic() - requested_at)
+        return True
+
+    def _open_with_backoff(self, previous, delay):
+        """Open the port from the url with the settings of previous, returns False when stopped"""
+        while not self._stopping.wait(random.uniform(delay / 2, delay)):
+            delay = min(max(delay * 2, REOPEN_DELAY_MIN), REOPEN_DELAY_MAX)
+            try:
+                # a new instance, so hwgrep:// looks for the device again,
+                # the enumeration is only repeated when the devices changed
+                ser = serial.serial_for_url(resolve_url(self.url), do_not_open=True)
+                ser.apply_settings(previous.get_settings())
+                ser.rts = previous.rts
+                ser.dtr = previous.dtr
+                ser.open()
+            except (serial.SerialException, ValueError, EnvironmentError) as e:
+                info('Opening {} failed: {}\n'.format(self.url, e))
+                continue
+            if self.low_latency:
+                try:
+                    ser.set_low_latency_mode(True)
+                except (AttributeError, NotImplementedError, ValueError, IOError):
+                    pass
+            if not hasattr(ser, 'cancel_read'):
+                ser.timeout = 1
+            with self._lock:
+                try:
+                    # changed while the port was opened from the old settings
+                    self._apply_settings(ser)
+                except (serial.SerialException, ValueError) as e:
+                    info('Applying the settings to {} failed: {}\n'.format(self.url, e))
+                self.serial = ser
+                self.fd = self._fileno(ser)
+                pending = self._outage_buffer.read(len(self._outage_buffer))
+                try:
+                    ser.write(pending)
+                except serial.SerialException as e:
+                    info('Writing buffered data failed: {}\n'.format(e))
+                self.online.set()
+            return True
+        return False
+
+class FlowControl(object):
+    """\
+    End to end flow control with the device, when the serial port uses RTS/CTS
+    or XON/XOFF flow control.
+
+    When the queue of the slowest client passes the high water mark (bytes)
+    the device is paused: RTS is deasserted or XOFF is sent, and the serial
+    port is no longer read, so what the device still sends stays in the
+    driver (which throttles the device as well when its buffer fills).
+    Below the low water mark the device is released again. Without flow
+    control on the serial port nothing is paused, the slow client policy
+    applies.
+
+    In the other direction the clients are not read while the device holds
+    CTS low, see wait_for_cts().
+    """
+
+    def __init__(self, serial_worker, ser_to_net, high_water, low_water):
+        self.serial_worker = serial_worker
+        self.ser_to_net = ser_to_net
+        self.high_water = high_water
+        self.low_water = low_water
+        # set while the device may send
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.paused = False
+        self.pauses = 0
+        # how long the device was paused
+        self.pause_time = LatencyStatistics()
+        # times reading from the clients waited for CTS
+        self.cts_pauses = 0
+        self._paused_at = 0.0
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Pause or release the device depending on the queued data, thread safe"""
+        # clients is replaced, not modified, so no lock needed to iterate
+        queued = max([len(client.buffer) for client in self.ser_to_net.clients] or [0])
+        if not self.paused and queued < self.high_water:
+            return
+        ser = self.serial_worker.serial
+        with self._lock:
+            if not self.paused:
+                if queued >= self.high_water and (ser.rtscts or ser.xonxoff):
+                    self.paused = True
+                    self.resumed.clear()
+                    self.pauses += 1
+                    self._paused_at = time.monotonic()
+                    self._signal(ser, False)
+            elif queued <= self.low_water or not (ser.rtscts or ser.xonxoff):
+                self._signal(ser, True)
+                self.paused = False
+                self.pause_time.add(time.monotonic() - self._paused_at)
+                self.resumed.set()
+
+    @staticmethod
+    def _signal(ser, run):
+        """Tell the device to stop or continue sending"""
+        try:
+            if ser.xonxoff:
+                # sends XOFF or XON
+                ser.set_input_flow_control(run)
+            else:
+                ser.rts = run
+        except (AttributeError, NotImplementedError, serial.SerialException, EnvironmentError) as e:
+            # e.g. rfc2217://, not reading the port still throttles the device
+            info('Could not signal flow control to the device: {}\n'.format(e))
+
+    def wait_for_cts(self):
+        """Block while the device holds CTS low, with rtscts"""
+        ser = self.serial_worker.serial
+        try:
+            if not ser.rtscts or ser.cts:
+                return
+        except (serial.SerialException, EnvironmentError):
+            # lost, writes are buffered until it is opened again
+            return
+        self.cts_pauses += 1
+        while self.serial_worker.alive and self.serial_worker.online.is_set():
+            time.sleep(CTS_POLL_INTERVAL)
+            try:
+                if ser.cts:
+                    return
+            except (serial.SerialException, EnvironmentError):
+                return
+
+    def statistics(self):
+        return ('flow control paused the device {} times for {:.3f} s (max {:.3f} s), '
+                'CTS paused the clients {} times'.format(
+                    self.pauses, self.pause_time.total, self.pause_time.maximum, self.cts_pauses))
+
+
+# active data paths, reported to the supervising process
+io_path = {'serial_to_net': 'read', 'net_to_serial': 'recv_into'}
+
+# CaptureRing while capturing the traffic, see set_capture()
+capture = None
+
+
+def set_capture(path, size=DEFAULT_CAPTURE_SIZE):
+    """Start capturing to path, replacing a running capture, or stop when path is None"""
+    global capture
+    ring, capture = capture, None
+    if ring is not None:
+        # closed first, the new capture may truncate the same file
+        ring.close()
+        info('--- capture stopped ---\n')
+    if path:
+        capture = CaptureRing(path, size)
+        info('--- capturing to {} ---\n'.format(path))
+
+
+def splice_network_to_serial(client, serial_worker, args):
+    """\
+    Move data from the client to the serial port through a pipe with
+    os.splice(), so it is not copied into Python at all. Returns False when
+    the kernel can not splice the serial port, the caller then continues with
+    the normal path. Returns None when a capture was started, the data then
+    has to pass through Python and the client continues on the normal path.
+    """
+    quickack = args.low_latency and hasattr(socket, 'TCP_QUICKACK') and client.socket.family != socket.AF_UNIX
+    sock = client.socket
+    read_fd, write_fd = os.pipe()
+    flow = client.flow
+    try:
+        while True:
+            if flow is not None:
+                flow.wait_for_cts()
+            p = profiler
+            if p is not None:
+                started, cpu_started = time.monotonic(), time.thread_time()
+            try:
+                length = os.splice(sock.fileno(), write_fd, SPLICE_SIZE)
+            except OSError as e:
+                if e.errno in SPLICE_UNSUPPORTED:
+                    return False
+                raise
+            if not length:
+                return True
+            received_at = time.monotonic()
+            if p is not None:
+                p.add('recv', started, cpu_started)
+                p.syscalls['splice'] += 1
+                started, cpu_started = received_at, time.thread_time()
+            if quickack:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            pending = length
+            ring = capture
+            if ring is not None:
+                while pending:
+                    data = os.read(read_fd, pending)
+                    ring.write(DIRECTION_NET_TO_SERIAL, data)
+                    serial_worker.write(data)
+                    pending -= len(data)
+                client.write_latency.add(time.monotonic() - received_at)
+                client.written_bytes += length
+                client.written_chunks += 1
+                h = histograms
+                if h is not None:
+                    h.net_to_serial_chunk_size.observe(length)
+                return None
+            while pending and serial_worker.alive and serial_worker.online.is_set():
+                with serial_worker.write_lock:
+                    if p is not None:
+                        p.syscalls['splice'] += 1
+                    try:
+                        pending -= os.splice(read_fd, serial_worker.fd, pending)
+                        continue
+                    except BlockingIOError:
+                        pass
+                    except OSError as e:
+                        if e.errno not in SPLICE_UNSUPPORTED:
+                            # serial port lost
+                            break
+                        # write what is already in the pipe the normal way
+                        while pending:
+                            data = os.read(read_fd, pending)
+                            serial_worker.serial.write(data)
+                            pending -= len(data)
+                        return False
+                # the serial port is non blocking, wait without the lock and
+                # check again, a port that never gets writable (CTS held low, a
+                # hung adapter) must not block closing or opening it again
+                try:
+                    select.select([], [serial_worker.fd], [], BLOCK_TIMEOUT)
+                except (OSError, ValueError):
+                    # closed meanwhile
+                    break
+            # buffered by write() until the lost serial port is opened again
+            while pending:
+                data = os.read(read_fd, pending)
+                serial_worker.write(data)
+                pending -= len(data)
+            client.write_latency.add(time.monotonic() - received_at)
+            client.written_bytes += length
+            client.written_chunks += 1
+            h = histograms
+            if h is not None:
+                h.net_to_serial_chunk_size.observe(length)
+            if p is not None:
+                p.add('serial_write', started, cpu_started)
+                p.net_to_serial_chunk_size.observe(length)
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def report_statistics(ser_to_net, interval):
+    """Periodically report the statistics of all clients"""
+    while True:
+        time.sleep(interval)
+        clients = ser_to_net.clients
+        events.emit('statistics', clients=[client.statistics_event() for client in clients],
+                    io_path=io_path, **ser_to_net.statistics_event())
+        for client in clients:
+            info('Statistics for {}: {}\n'.format(client.addr, client.statistics()))
+        if ser_to_net.flow is not None and ser_to_net.flow.pauses + ser_to_net.flow.cts_pauses:
+            info('Statistics: {}\n'.format(ser_to_net.flow.statistics()))
+
+
+def collect_metrics(ser_to_net, serial_worker, labels):
+    """Metric families for the metrics endpoint, labels are added to every sample"""
+    statistics = ser_to_net.statistics_event()
+    clients = ser_to_net.clients
+    h = histograms
+    # the endpoint is only served while collecting
+    assert h is not None
+
+    def per_direction(serial_to_net, net_to_serial):
+        return [(dict(labels, direction='serial_to_net'), serial_to_net),
+                (dict(labels, direction='net_to_serial'), net_to_serial)]
+
+    return [
+        MetricFamily('network_serial_bytes_total', COUNTER, 'Bytes forwarded.',
+                     per_direction(statistics['serial_to_net_bytes'], statistics['net_to_serial_bytes'])),
+        MetricFamily('network_serial_chunks_total', COUNTER, 'Chunks forwarded, one per read.',
+                     per_direction(statistics['serial_to_net_chunks'], statistics['net_to_serial_chunks'])),
+        MetricFamily('network_serial_errors_total', COUNTER, 'Failed reads and writes of the serial port and the clients.',
+                     per_direction(statistics['serial_to_net_errors'],
+                                   statistics['net_to_serial_errors'] + serial_worker.write_errors)),
+        MetricFamily('network_serial_connects_total', COUNTER, 'Client connections.',
+                     [(labels, statistics['connects'])]),
+        MetricFamily('network_serial_takeovers_total', COUNTER,
+                     'New clients that disconnected the oldest client (newest takeover policy).',
+                     [(labels, statistics['takeovers'])]),
+        MetricFamily('network_serial_rejects_total', COUNTER,
+                     'New clients that were disconnected because all slots were taken (reject takeover policy).',
+                     [(labels, statistics['rejects'])]),
+        MetricFamily('network_serial_overflows_total', COUNTER, 'Times data for a slow client was dropped.',
+                     [(labels, statistics['overflow_count'])]),
+        MetricFamily('network_serial_overflow_bytes_total', COUNTER, 'Bytes dropped for slow clients.',
+                     [(labels, statistics['overflow_bytes'])]),
+        MetricFamily('network_serial_compression_bytes_total', COUNTER,
+                     'Bytes of compressed connections before and after compression.',
+                     [(dict(labels, stage='uncompressed'), statistics['uncompressed_bytes']),
+                      (dict(labels, stage='compressed'), statistics['compressed_bytes'])]),
+        MetricFamily('network_serial_flow_pauses_total', COUNTER,
+                     'Times flow control paused the device (serial_to_net) or the clients (net_to_serial).',
+                     per_direction(statistics['flow_pauses'], statistics['cts_pauses'])),
+        MetricFamily('network_serial_serial_recoveries_total', COUNTER, 'Times the lost serial port was opened again.',
+                     [(labels, statistics['serial_recoveries'])]),
+        MetricFamily('network_serial_clients', GAUGE, 'Connected clients.',
+                     [(labels, len(clients))]),
+        MetricFamily('network_serial_queue_bytes', GAUGE, 'Bytes queued for the clients.',
+                     [(labels, sum(len(client.buffer) for client in clients))]),
+        MetricFamily('network_serial_serial_online', GAUGE, '1 while the serial port is open.',
+                     [(labels, 1 if serial_worker.online.is_set() else 0)]),
+        MetricFamily('network_serial_chunk_size_bytes', HISTOGRAM, 'Size of the forwarded chunks.',
+                     per_direction(h.serial_to_net_chunk_size, h.net_to_serial_chunk_size)),
+        MetricFamily('network_serial_forward_latency_seconds', HISTOGRAM,
+                     'Time from reading serial data until it was sent to a client.',
+                     [(labels, h.forward_latency)]),
+        MetricFamily('network_serial_send_blocking_seconds', HISTOGRAM, 'Time spent sending to a client.',
+                     [(labels, h.send_blocking)]),
+    ]
+
+
+def set_keepalive(sock, args):
+    """\
+    Detect peers that are gone without closing the connection, e.g. after a
+    power loss or a network change, so their slot is freed: keep-alive
+    notices an idle connection, user_timeout (ms) closes the connection when
+    sent data is not acknowledged for that long, which keep-alive does not.
+    """
+    if args.keepalive_idle > 0:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, args.keepalive_idle)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, args.keepalive_interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, args.keepalive_count)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except AttributeError:
+            pass # XXX not available on windows
+    if args.user_timeout > 0 and hasattr(socket, 'TCP_USER_TIMEOUT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, args.user_timeout)
+
+
+def take_slot(ser_to_net, slots, addr, policy):
+    """\
+    Get a slot for a new client with the newest or reject takeover policy,
+    returns False when the client is rejected.
+    """
+    if slots.acquire(False):
+        return True
+    if policy == TAKEOVER_NEWEST:
+        clients = ser_to_net.clients
+        if clients:
+            oldest = clients[0]
+            info('{} takes over from {}\n'.format(addr, oldest.addr))
+            try:
+                # recv() of its thread returns, which frees the slot
+                oldest.socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        # not forever, the slot may not be freed (e.g. a client that is
+        # still being set up)
+        if slots.acquire(timeout=TAKEOVER_TIMEOUT):
+            ser_to_net.takeovers += 1
+            return True
+        sys.stderr.write('WARNING: slot for {} not freed in time\n'.format(addr))
+    ser_to_net.rejects += 1
+    events.emit('rejected', client=addr[0], port=addr[1])
+    info('Rejected {}, {} clients connected\n'.format(addr, len(ser_to_net.clients)))
+    return False
+
+
+def client_disconnected(client):
+    events.emit('disconnected', client=client.addr[0], port=client.addr[1],
+                statistics=client.statistics_event())
+    info('Statistics for {}: {}\n'.format(client.addr, client.statistics()))
+
+
+def network_to_serial(client, serial_worker, args):
+    """Forward data from the client to the serial port until disconnected"""
+    if io_path['net_to_serial'] == 'splice' and capture is None and client.decompressor is None:
+        try:
+            spliced = splice_network_to_serial(client, serial_worker, args)
+        except socket.error as msg:
+            client.recv_errors += 1
+            if args.develop:
+                raise
+            sys.stderr.write('ERROR: {}\n'.format(msg))
+            return
+        if spliced:
+            return
+        if spliced is False:
+            # not supported for this serial port, so also not for later clients
+            io_path['net_to_serial'] = 'recv_into'
+            sys.stderr.write('WARNING: splice not supported, falling back to recv_into\n')
+            events.emit('io_path', **io_path)
+
+    # low latency never waits for more data
+    coalesce = args.write_mode == WRITE_MODE_THROUGHPUT and not args.low_latency
+    quickack = args.low_latency and hasattr(socket, 'TCP_QUICKACK') and client.socket.family != socket.AF_UNIX
+    recv_size = args.recv_size
+    buffer_size = max(recv_size, args.coalesce_size) if coalesce else recv_size
+    # reused for every read, data is received directly into it
+    buffer = memoryview(bytearray(buffer_size))
+    sock = client.socket
+    flow = client.flow
+    while True:
+        try:
+            if flow is not None:
+                # the data stays in the socket buffer, so TCP slows down the client
+                flow.wait_for_cts()
+            p = profiler
+            if p is not None:
+                started, cpu_started = time.monotonic(), time.thread_time()
+            length = sock.recv_into(buffer, recv_size)
+            if not length:
+                break
+            received_at = time.monotonic()
+            if p is not None:
+                p.add('recv', started, cpu_started)
+                p.syscalls['recv'] += 1
+            if quickack:
+                # Linux resets quick ack mode, so set it again after each read
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            if coalesce:
+                # collect more pending data, bounded by size and time, so the
+                # serial port gets fewer but larger writes
+                deadline = time.monotonic() + args.coalesce_window / 1000
+                while length < buffer_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if p is not None:
+                        p.syscalls['select'] += 1
+                    if not select.select([sock], [], [], remaining)[0]:
+                        break
+                    received = sock.recv_into(buffer[length:], min(recv_size, buffer_size - length))
+                    if p is not None:
+                        p.syscalls['recv'] += 1
+                    if not received:
+                        break
+                    length += received
+            data = buffer[:length]
+            if client.decompressor is not None:
+                client.compressed_received += length
+                data = client.decompressor.decompress(data)
+                client.uncompressed_received += len(data)
+                if not data:
+                    continue
+                length = len(data)
+            if p is None:
+                serial_worker.write(data)    # get a bunch of bytes and send them
+            else:
+                started, cpu_started = time.monotonic(), time.thread_time()
+                serial_worker.write(data)
+                p.add('serial_write', started, cpu_started)
+                p.syscalls['write'] += 1
+                p.net_to_serial_chunk_size.observe(length)
+            h = histograms
+            if h is not None:
+                h.net_to_serial_chunk_size.observe(length)
+            ring = capture
+            if ring is not None:
+                ring.write(DIRECTION_NET_TO_SERIAL, data)
+            client.write_latency.add(time.monotonic() - received_at)
+            client.written_bytes += length
+            client.written_chunks += 1
+        except socket.error as msg:
+            client.recv_errors += 1
+            if args.develop:
+                raise
+            sys.stderr.write('ERROR: {}\n'.format(msg))
+            # probably got disconnected
+            break
+        except zlib.error as e:
+            client.recv_errors += 1
+            sys.stderr.write('ERROR: invalid compressed data from {}: {}\n'.format(client.addr, e))
+            break
+
+
+def start_client(client_socket, addr, ser_to_net, serial_worker, slots, args):
+    """\
+    Set up an accepted server mode client and serve it, in its own thread.
+    With the newest or reject takeover policy the slot is taken here, so
+    waiting for the client that is taken over from does not hold up the
+    accept loop.
+    """
+    if args.takeover != TAKEOVER_WAIT and not take_slot(ser_to_net, slots, addr, args.takeover):
+        client_socket.close()
+        return
+    if client_socket.family != socket.AF_UNIX:
+        try:
+            # More quickly detect bad clients who quit without closing the
+            # connection, see --keepalive-idle and --user-timeout
+            set_keepalive(client_socket, args)
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if args.low_latency and hasattr(socket, 'TCP_QUICKACK'):
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        except socket.error as msg:
+            # gone again already
+            sys.stderr.write('ERROR: {}\n'.format(msg))
+            client_socket.close()
+            slots.release()
+            return
+    events.emit('connected', client=addr[0], port=addr[1])
+    info('Connected by {}\n'.format(addr))
+    client = ClientConnection(
+        client_socket, addr, args.client_queue_size, args.slow_client_policy,
+        framed=ser_to_net.framer is not None, flow=ser_to_net.flow)
+    ser_to_net.add_client(client)
+    serve_client(client, ser_to_net, serial_worker, slots, args)
+
+
+def wait_until_open(serial_worker, client):
+    """\
+    On demand the serial port is opened first, returns False when it could
+    not be opened and the client is to be disconnected.
+    """
+    if serial_worker.online.wait(OPEN_TIMEOUT):
+        return True
+    if serial_worker.idle_close is not None:
+        sys.stderr.write('ERROR: could not open {} for {}, disconnecting\n'.format(
+            serial_worker.url, client.addr))
+        return False
+    # lost, data of the client is buffered until it is back
+    sys.stderr.write('WARNING: {} is not available, buffering data of {}\n'.format(
+        serial_worker.url, client.addr))
+    return True
+
+
+def serve_client(client, ser_to_net, serial_worker, slots, args):
+    """Run the network -> serial loop of a server mode client in a thread"""
+    serial_worker.acquire()
+    try:
+        if wait_until_open(serial_worker, client):
+            network_to_serial(client, serial_worker, args)
+    finally:
+        serial_worker.release()
+        ser_to_net.remove_client(client)
+        client.close()
+        client.socket.close()
+        client_disconnected(client)
+        info('Disconnected from {}\n'.format(client.addr))
+        slots.release()
+
+
+def parse_args():
+    """Parse the command line, see DEFAULTS for the default values"""
     import argparse
 
     parser = argparse.ArgumentParser(
@@ -36,8 +1717,9 @@ if __name__ == '__main__':  # noqa
 NOTE: no security measures are implemented. Anyone can remotely connect
 to this service over the network.
 
-Only one connection at once is supported. When the connection is terminated
-it waits for the next connect.
+By default only one connection at once is supported. When the connection is
+terminated it waits for the next connect. Use --max-clients to allow more
+clients, serial data is then sent to all of them.
 """)
 
     parser.add_argument(
@@ -49,19 +1731,43 @@ it waits for the next connect.
         type=int,
         nargs='?',
         help='set baud rate, default: %(default)s',
-        default=9600)
+        default=DEFAULTS['BAUDRATE'])
 
     parser.add_argument(
         '-q', '--quiet',
         action='store_true',
         help='suppress non error messages',
-        default=False)
+        default=DEFAULTS['quiet'])
+
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        help='write client statistics every this many seconds, 0 disables, default: %(default)s',
+        default=DEFAULTS['stats_interval'])
+
+    parser.add_argument(
+        '--low-latency',
+        action='store_true',
+        help='optimize for round trip latency instead of throughput',
+        default=DEFAULTS['low_latency'])
+
+    parser.add_argument(
+        '--event-fd',
+        type=int,
+        help='write machine readable events to this (inherited) file descriptor',
+        default=DEFAULTS['event_fd'])
+
+    parser.add_argument(
+        '--stdin-commands',
+        action='store_true',
+        help='read JSON commands from stdin, e.g. to change settings while running',
+        default=DEFAULTS['stdin_commands'])
 
     parser.add_argument(
         '--develop',
         action='store_true',
         help='Development mode, prints Python internals on errors',
-        default=False)
+        default=DEFAULTS['develop'])
 
     group = parser.add_argument_group('serial port')
 
@@ -70,45 +1776,107 @@ it waits for the next connect.
         choices=[5, 6, 7, 8],
         type=int,
         help="set bytesize, one of {5 6 7 8}, default: 8",
-        default=8)
+        default=DEFAULTS['bytesize'])
 
     group.add_argument(
         "--parity",
         choices=['N', 'E', 'O', 'S', 'M'],
         type=lambda c: c.upper(),
         help="set parity, one of {N E O S M}, default: N",
-        default='N')
+        default=DEFAULTS['parity'])
 
     group.add_argument(
         "--stopbits",
         choices=[1, 1.5, 2],
         type=float,
         help="set stopbits, one of {1 1.5 2}, default: 1",
-        default=1)
+        default=DEFAULTS['stopbits'])
 
     group.add_argument(
         '--rtscts',
         action='store_true',
         help='enable RTS/CTS flow control (default off)',
-        default=False)
+        default=DEFAULTS['rtscts'])
 
     group.add_argument(
         '--xonxoff',
         action='store_true',
         help='enable software flow control (default off)',
-        default=False)
+        default=DEFAULTS['xonxoff'])
+
+    group.add_argument(
+        '--on-demand',
+        action='store_true',
+        help='only keep the serial port open while a client is connected',
+        default=DEFAULTS['on_demand'])
+
+    group.add_argument(
+        '--idle-close',
+        type=float,
+        metavar='S',
+        help='with --on-demand, close the serial port after this many seconds without client, '
+             'default: %(default)s',
+        default=DEFAULTS['idle_close'])
+
+    group.add_argument(
+        '--flow-high-water',
+        type=int,
+        metavar='PERCENT',
+        help='with flow control, pause the device when a client queue is this full, 0 disables, '
+             'default: %(default)s',
+        default=DEFAULTS['flow_high_water'])
+
+    group.add_argument(
+        '--flow-low-water',
+        type=int,
+        metavar='PERCENT',
+        help='release the device again when the client queues are this empty, default: %(default)s',
+        default=DEFAULTS['flow_low_water'])
 
     group.add_argument(
         '--rts',
         type=int,
         help='set initial RTS line state (possible values: 0, 1)',
-        default=None)
+        default=DEFAULTS['rts'])
 
     group.add_argument(
         '--dtr',
         type=int,
         help='set initial DTR line state (possible values: 0, 1)',
-        default=None)
+        default=DEFAULTS['dtr'])
+
+    group.add_argument(
+        '--splice',
+        action='store_true',
+        help='move network data to the serial port with splice() (Linux), '
+             'falls back to the normal path when not supported',
+        default=DEFAULTS['splice'])
+
+    group.add_argument(
+        '--write-mode',
+        choices=[WRITE_MODE_IMMEDIATE, WRITE_MODE_THROUGHPUT],
+        help='immediate writes every received chunk to the serial port, '
+             'throughput combines pending data in larger writes, default: %(default)s',
+        default=DEFAULTS['write_mode'])
+
+    group.add_argument(
+        '--coalesce-size',
+        type=int,
+        help='maximum size of a combined serial write in throughput mode, default: %(default)s',
+        default=DEFAULTS['coalesce_size'])
+
+    group.add_argument(
+        '--coalesce-window',
+        type=float,
+        help='maximum time in ms to wait for more data in throughput mode, default: %(default)s',
+        default=DEFAULTS['coalesce_window'])
+
+    group.add_argument(
+        '--framing',
+        choices=FRAMINGS,
+        help='send serial data to the network in whole frames, ended by a pause '
+             '(silence, like Modbus RTU) or a delimiter, default: %(default)s',
+        default=DEFAULTS['framing'])
 
     group = parser.add_argument_group('network settings')
 
@@ -118,18 +1886,170 @@ it waits for the next connect.
         '-P', '--localport',
         type=int,
         help='local TCP port',
-        default=7777)
+        default=DEFAULTS['localport'])
 
     exclusive_group.add_argument(
         '-c', '--client',
         metavar='HOST:PORT',
         help='make the connection as a client, instead of running a server',
-        default=False)
+        default=DEFAULTS['client'])
+
+    group.add_argument(
+        '--compress',
+        action='store_true',
+        help='as client, send and receive a zlib stream, e.g. to network_serial_tunnel.py',
+        default=DEFAULTS['compress'])
+
+    group.add_argument(
+        '--compress-level',
+        type=int,
+        choices=range(1, 10),
+        metavar='1..9',
+        help='zlib compression level, default: %(default)s',
+        default=DEFAULTS['compress_level'])
+
+    group.add_argument(
+        '--compress-flush',
+        type=int,
+        metavar='MS',
+        help='flush the compressed stream at the latest after this many ms, default: %(default)s',
+        default=DEFAULTS['compress_flush'])
+
+    group.add_argument(
+        '--unix-socket',
+        metavar='PATH',
+        help='also listen on a Unix domain socket for clients on this host, '
+             'use -P 0 to only listen on the Unix domain socket',
+        default=DEFAULTS['unix_socket'])
+
+    group.add_argument(
+        '--unix-socket-mode',
+        type=lambda mode: int(mode, 8),
+        help='permissions of the Unix domain socket, e.g. 660',
+        default=DEFAULTS['unix_socket_mode'])
+
+    group.add_argument(
+        '--recv-size',
+        type=int,
+        help='maximum number of bytes read from a client at once, default: %(default)s',
+        default=DEFAULTS['recv_size'])
+
+    group.add_argument(
+        '--max-clients',
+        type=int,
+        help='number of clients that can be connected at the same time, default: %(default)s',
+        default=DEFAULTS['max_clients'])
+
+    group.add_argument(
+        '--client-queue-size',
+        type=int,
+        help='size in bytes of the ring buffer per client, when full the slow client policy applies, default: %(default)s',
+        default=DEFAULTS['client_queue_size'])
+
+    group.add_argument(
+        '--slow-client-policy',
+        choices=[SLOW_CLIENT_DROP_OLDEST, SLOW_CLIENT_DISCONNECT, SLOW_CLIENT_BLOCK],
+        help='what to do when the queue of a client is full, block needs --max-clients 1, default: %(default)s',
+        default=DEFAULTS['slow_client_policy'])
+
+    group.add_argument(
+        '--takeover',
+        choices=[TAKEOVER_WAIT, TAKEOVER_NEWEST, TAKEOVER_REJECT],
+        help='when --max-clients are connected a new client waits until one disconnects, '
+             'disconnects the oldest client (newest) or is disconnected (reject), default: %(default)s',
+        default=DEFAULTS['takeover'])
+
+    group.add_argument(
+        '--keepalive-idle',
+        type=int,
+        metavar='S',
+        help='send TCP keep-alive packets after this many seconds idle, 0 disables, default: %(default)s',
+        default=DEFAULTS['keepalive_idle'])
+
+    group.add_argument(
+        '--keepalive-interval',
+        type=int,
+        metavar='S',
+        help='seconds between TCP keep-alive packets, default: %(default)s',
+        default=DEFAULTS['keepalive_interval'])
+
+    group.add_argument(
+        '--keepalive-count',
+        type=int,
+        help='close the connection after this many unanswered keep-alive packets, default: %(default)s',
+        default=DEFAULTS['keepalive_count'])
+
+    group.add_argument(
+        '--user-timeout',
+        type=int,
+        metavar='MS',
+        help='close the connection when sent data is not acknowledged for this long (TCP_USER_TIMEOUT, Linux), '
+             '0 uses the system default, default: %(default)s',
+        default=DEFAULTS['user_timeout'])
 
-    args = parser.parse_args()
+    group = parser.add_argument_group('diagnostics')
+
+    group.add_argument(
+        '--capture',
+        metavar='FILE',
+        help='capture the traffic to a ring file, export it with capture.py',
+        default=DEFAULTS['capture'])
+
+    group.add_argument(
+        '--capture-size',
+        type=int,
+        help='size of the capture ring file in bytes, default: %(default)s',
+        default=DEFAULTS['capture_size'])
+
+    group.add_argument(
+        '--metrics-port',
+        type=int,
+        help='serve Prometheus metrics over HTTP on this TCP port, 0 disables, default: %(default)s',
+        default=DEFAULTS['metrics_port'])
+
+    group.add_argument(
+        '--metrics-bind',
+        metavar='ADDRESS',
+        help='local address of the metrics port, empty for all interfaces, default: %(default)s',
+        default=DEFAULTS['metrics_bind'])
+
+    group.add_argument(
+        '--metrics-socket',
+        metavar='PATH',
+        help='serve Prometheus metrics over HTTP on this Unix domain socket',
+        default=DEFAULTS['metrics_socket'])
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':  # noqa
+    if len(sys.argv) == 3 and sys.argv[1] == '--config-json':
+        # started by the integration with all settings in one JSON object,
+        # skips importing argparse and building the parser
+        settings = dict(DEFAULTS)
+        settings.update(json.loads(sys.argv[2]))
+        args = types.SimpleNamespace(**settings)
+    else:
+        args = parse_args()
+
+    verbose = not args.quiet
+    if args.event_fd is not None:
+        events.open(args.event_fd)
+
+    if args.slow_client_policy == SLOW_CLIENT_BLOCK and args.max_clients != 1:
+        # one slow client would stall the data of all others
+        events.emit('error', message='The block slow client policy needs --max-clients 1', fatal=True)
+        sys.stderr.write('The block slow client policy needs --max-clients 1\n')
+        sys.exit(1)
 
     # connect to serial port
-    ser = serial.serial_for_url(args.SERIALPORT, do_not_open=True)
+    try:
+        # hwgrep:// is resolved from the cache of discovery.py
+        ser = serial.serial_for_url(resolve_url(args.SERIALPORT), do_not_open=True)
+    except (serial.SerialException, ValueError) as e:
+        events.emit('error', message='Could not find serial port {}: {}'.format(args.SERIALPORT, e), fatal=True)
+        sys.stderr.write('Could not find serial port {}: {}\n'.format(args.SERIALPORT, e))
+        sys.exit(1)
     ser.baudrate = args.BAUDRATE
     ser.bytesize = args.bytesize
     ser.parity = args.parity
@@ -151,80 +2071,165 @@ it waits for the next connect.
     try:
         ser.open()
     except serial.SerialException as e:
+        events.emit('error', message='Could not open serial port {}: {}'.format(ser.name, e), fatal=True)
         sys.stderr.write('Could not open serial port {}: {}\n'.format(ser.name, e))
         sys.exit(1)
 
-    ser_to_net = SerialToNet()
-    serial_worker = serial.threaded.ReaderThread(ser, ser_to_net)
+    if args.low_latency:
+        try:
+            # sets ASYNC_LOW_LATENCY on Linux, only available for real ports
+            ser.set_low_latency_mode(True)
+        except (AttributeError, NotImplementedError, ValueError, IOError) as e:
+            sys.stderr.write('WARNING: low latency mode not supported by {}: {}\n'.format(ser.name, e))
+
+    if args.capture:
+        try:
+            set_capture(args.capture, args.capture_size)
+        except (ValueError, EnvironmentError) as e:
+            sys.stderr.write('WARNING: could not start capture: {}\n'.format(e))
+
+    ser_to_net = SerialToNet(create_framer(args.framing, ser.baudrate, ser.bytesize, ser.parity, ser.stopbits))
+    # on demand the port is only opened here to check it, it is closed until
+    # the first client connects
+    serial_worker = SerialReaderThread(ser, ser_to_net, url=args.SERIALPORT, low_latency=args.low_latency,
+                                       idle_close=args.idle_close if args.on_demand else None)
+    if isinstance(ser_to_net.framer, SilenceFramer) and serial_worker.fd is None:
+        # pauses are only noticed by the select() loop
+        sys.stderr.write('WARNING: silence framing needs a serial port with a file descriptor, disabled\n')
+        ser_to_net.framer = None
+    if args.flow_high_water > 0:
+        # the flow control of the serial port may be enabled later on
+        flow = FlowControl(serial_worker, ser_to_net,
+                           args.client_queue_size * args.flow_high_water // 100,
+                           args.client_queue_size * args.flow_low_water // 100)
+        ser_to_net.flow = serial_worker.flow = flow
+    io_path['serial_to_net'] = serial_worker.io_path
+    if args.splice and hasattr(os, 'splice') and serial_worker.fd is not None:
+        io_path['net_to_serial'] = 'splice'
     serial_worker.start()
 
+    metrics_servers = []
+    if args.metrics_port or args.metrics_socket:
+        histograms = Histograms()
+        labels = {'serial': args.SERIALPORT}
+        try:
+            if args.metrics_port:
+                metrics_servers.append(serve_metrics(
+                    Listener._bind(args.metrics_port, args.metrics_bind),
+                    lambda: collect_metrics(ser_to_net, serial_worker, labels)))
+            if args.metrics_socket:
+                metrics_servers.append(serve_metrics(
+                    Listener._bind_unix(args.metrics_socket, None),
+                    lambda: collect_metrics(ser_to_net, serial_worker, labels)))
+        except (socket.error, EnvironmentError) as e:
+            sys.stderr.write('WARNING: could not serve metrics: {}\n'.format(e))
+        else:
+            info('--- metrics on {} ---\n'.format(
+                ' and '.join(str(x) for x in (args.metrics_port or None, args.metrics_socket) if x)))
+
+    if args.stats_interval > 0:
+        stats_thread = threading.Thread(
+            target=report_statistics, args=(ser_to_net, args.stats_interval))
+        stats_thread.daemon = True
+        stats_thread.start()
+
+    listener = None
     if not args.client:
-        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        srv.bind(('', args.localport))
-        srv.listen(1)
+        try:
+            listener = Listener(args.localport, args.unix_socket, args.unix_socket_mode)
+        except (socket.error, EnvironmentError, ValueError) as e:
+            where = ' and '.join(str(x) for x in (args.localport or None, args.unix_socket) if x) or 'port 0'
+            events.emit('error', message='Could not listen on {}: {}'.format(where, e), fatal=True)
+            sys.stderr.write('Could not listen on {}: {}\n'.format(where, e))
+            serial_worker.stop()
+            sys.exit(1)
+        slots = threading.Semaphore(args.max_clients)
+
+    if args.stdin_commands:
+        command_thread = threading.Thread(
+            target=process_commands, args=(sys.stdin, serial_worker, listener, ser_to_net))
+        command_thread.daemon = True
+        command_thread.start()
+    if args.client:
+        host, port = args.client.rsplit(':', 1)
+        network_monitor = NetworkMonitor()
+        reconnect_delay = RECONNECT_DELAY_MIN
+        disconnected_at = None
+
+    info('--- serial->net {serial_to_net}, net->serial {net_to_serial} ---\n'.format(**io_path))
+    events.emit('started', serial=ser.name, localport=None if args.client else args.localport,
+                io_path=io_path)
     try:
-        intentional_exit = False
         while True:
             if args.client:
-                host, port = args.client.split(':')
-                sys.stderr.write("Opening connection to {}:{}...\n".format(host, port))
-                client_socket = socket.socket()
+                info("Opening connection to {}:{}...\n".format(host, port))
                 try:
-                    client_socket.connect((host, int(port)))
+                    client_socket = socket.create_connection((host, int(port)), CONNECT_TIMEOUT)
                 except socket.error as msg:
                     sys.stderr.write('WARNING: {}\n'.format(msg))
-                    time.sleep(5)  # intentional delay on reconnection as client
+                    reconnect_delay = wait_for_reconnect(network_monitor, reconnect_delay)
                     continue
-                sys.stderr.write('Connected\n')
+                client_socket.settimeout(None)
+                connected_at = time.monotonic()
+                if disconnected_at is not None:
+                    ser_to_net.reconnect_latency.add(connected_at - disconnected_at)
+                events.emit('connected', client=host, port=int(port))
+                info('Connected\n')
                 client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                if args.low_latency and hasattr(socket, 'TCP_QUICKACK'):
+                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+                set_keepalive(client_socket, args)
                 #~ client_socket.settimeout(5)
-            else:
-                sys.stderr.write('Waiting for connection on {}...\n'.format(args.localport))
-                client_socket, addr = srv.accept()
-                sys.stderr.write('Connected by {}\n'.format(addr))
-                # More quickly detect bad clients who quit without closing the
-                # connection: After 1 second of idle, start sending TCP keep-alive
-                # packets every 1 second. If 3 consecutive keep-alive packets
-                # fail, assume the client is gone and close the connection.
+                client = ClientConnection(
+                    client_socket, (host, int(port)), args.client_queue_size, args.slow_client_policy,
+                    framed=ser_to_net.framer is not None,
+                    compress_level=args.compress_level if args.compress else None,
+                    compress_flush=args.compress_flush / 1000,
+                    flow=ser_to_net.flow)
+                ser_to_net.add_client(client)
+                serial_worker.acquire()
                 try:
-                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 1)
-                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 1)
-                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
-                    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                except AttributeError:
-                    pass # XXX not available on windows
-                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-            try:
-                ser_to_net.socket = client_socket
+                    opened = wait_until_open(serial_worker, client)
+                    if opened:
+                        # enter network <-> serial loop
+                        network_to_serial(client, serial_worker, args)
+                finally:
+                    serial_worker.release()
+                    ser_to_net.remove_client(client)
+                    client.close()
+                    client_disconnected(client)
+                    info('Disconnected\n')
+                    client_socket.close()
+                disconnected_at = time.monotonic()
+                # not connected right away again when the port did not open
+                if opened and disconnected_at - connected_at > RECONNECT_RESET_AFTER:
+                    reconnect_delay = RECONNECT_DELAY_MIN
+                reconnect_delay = wait_for_reconnect(network_monitor, reconnect_delay)
+            else:
+                # only None in client mode
+                assert listener is not None
+                if args.takeover == TAKEOVER_WAIT:
+                    # wait for a free slot, further clients wait in the backlog
+                    slots.acquire()
+                info('Waiting for connection on {}...\n'.format(
+                    ' and '.join(str(x) for x in (listener.port or None, listener.unix_path) if x)))
+                client_socket, addr = listener.accept()
                 # enter network <-> serial loop
-                while True:
-                    try:
-                        data = client_socket.recv(1024)
-                        if not data:
-                            break
-                        ser.write(data)                 # get a bunch of bytes and send them
-                    except socket.error as msg:
-                        if args.develop:
-                            raise
-                        sys.stderr.write('ERROR: {}\n'.format(msg))
-                        # probably got disconnected
-                        break
-            except KeyboardInterrupt:
-                intentional_exit = True
-                raise
-            except socket.error as msg:
-                if args.develop:
-                    raise
-                sys.stderr.write('ERROR: {}\n'.format(msg))
-            finally:
-                ser_to_net.socket = None
-                sys.stderr.write('Disconnected\n')
-                client_socket.close()
-                if args.client and not intentional_exit:
-                    time.sleep(5)  # intentional delay on reconnection as client
+                network_thread = threading.Thread(
+                    target=start_client,
+                    args=(client_socket, addr, ser_to_net, serial_worker, slots, args))
+                network_thread.daemon = True
+                network_thread.start()
     except KeyboardInterrupt:
         pass
 
-    sys.stderr.write('\n--- exit ---\n')
-    serial_worker.stop()
\ No newline at end of file
+    for client in ser_to_net.clients:
+        client.close()
+    if listener is not None:
+        listener.close()
+    for server in metrics_servers:
+        server.server_close()
+        if server.socket.family == socket.AF_UNIX:
+            os.unlink(args.metrics_socket)
+    info('\n--- exit ---\n')
+    serial_worker.stop()
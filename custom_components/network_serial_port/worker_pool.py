@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""Host many serial <-> TCP bridges in a small, fixed pool of worker processes.
+
+Instead of one process per port, ports are registered over a local control
+socket (a Unix domain socket speaking JSON lines) and assigned to one of the
+workers, by default one per CPU core. Each worker runs the asyncio bridge for
+all of its ports on a single event loop. Ports are periodically rebalanced
+between workers based on their byte rate.
+
+Control commands (one JSON object per line):
+
+    {"command": "register", "id": "...", "settings": {...}}
+    {"command": "unregister", "id": "..."}
+    {"command": "configure", "id": "...", "settings": {...}}
+
+Events sent back on the connection that registered the port:
+
+    {"event": "registered", "id": "...", "success": true, "error": null}
+    {"event": "configured", "id": "...", "success": true, "error": null}
+    {"event": "connected", "id": "...", "client": "192.168.1.2"}
+    {"event": "disconnected", "id": "..."}
+    {"event": "serial_lost", "id": "...", "error": "..."}
+    {"event": "statistics", "id": "...", "statistics": {...}}
+    {"event": "moved", "id": "...", "worker": 1}
+
+After moved the statistics of the port count from 0 again.
+
+Ports registered over a connection are unregistered when that connection
+closes. The daemon exits when it has been idle (no control connections) for
+IDLE_TIMEOUT seconds.
+
+This file is started as a script, so it only imports sibling modules that
+have no package relative imports.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import fcntl
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import sys
+import time
+
+from asyncio_bridge import SerialBridge  # type: ignore
+from discovery import resolve_url  # type: ignore
+
+_LOGGER = logging.getLogger("network_serial_port.worker_pool")
+
+STATS_INTERVAL = 5.0
+REBALANCE_INTERVAL = 30.0
+# Only move a port when the busiest and idlest worker differ by at least this
+# many bytes per second (moving a port disconnects its client)
+REBALANCE_MIN_DIFFERENCE = 10000
+IDLE_TIMEOUT = 30.0
+ACK_TIMEOUT = 10.0
+
+
+class _Worker:
+    """Runs inside a worker process, hosts bridges on one event loop."""
+
+    def __init__(self, conn: Connection) -> None:
+        self._conn = conn
+        self._bridges: dict[str, SerialBridge] = {}
+
+    def run(self) -> None:
+        asyncio.run(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._done = loop.create_future()
+        loop.add_reader(self._conn.fileno(), self._command_received)
+        stats_task = loop.create_task(self._report_statistics())
+        await self._done
+        stats_task.cancel()
+        for bridge in self._bridges.values():
+            await bridge.stop()
+
+    def _send(self, message: dict) -> None:
+        try:
+            self._conn.send(message)
+        except OSError:
+            pass  # supervisor is gone, will be noticed by the reader
+
+    def _command_received(self) -> None:
+        try:
+            message = self._conn.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(self._conn.fileno())
+            if not self._done.done():
+                self._done.set_result(None)
+            return
+
+        if message["command"] == "register":
+            asyncio.create_task(self._register(message["id"], message["settings"]))
+        elif message["command"] == "unregister":
+            asyncio.create_task(self._unregister(message["id"]))
+        elif message["command"] == "configure":
+            asyncio.create_task(self._configure(message["id"], message["settings"]))
+
+    async def _register(self, port_id: str, settings: dict) -> None:
+        settings = dict(settings)
+        bridge = SerialBridge(
+            settings.pop("url"),
+            settings.pop("localport"),
+            **settings,
+            on_client_connected=lambda client: self._send(
+                {"event": "connected", "id": port_id, "client": client}
+            ),
+            on_client_disconnected=lambda: self._send(
+                {"event": "disconnected", "id": port_id}
+            ),
+            on_serial_lost=lambda exc: self._serial_lost(port_id, exc),
+            resolve_url=resolve_url,
+        )
+        try:
+            await bridge.start()
+        except Exception as e:  # pylint: disable=broad-except
+            self._send(
+                {"event": "registered", "id": port_id, "success": False, "error": str(e)}
+            )
+            return
+        self._bridges[port_id] = bridge
+        self._send({"event": "registered", "id": port_id, "success": True, "error": None})
+
+    async def _unregister(self, port_id: str) -> None:
+        if bridge := self._bridges.pop(port_id, None):
+            await bridge.stop()
+        self._send({"event": "unregistered", "id": port_id})
+
+    async def _configure(self, port_id: str, settings: dict) -> None:
+        error = None
+        if (bridge := self._bridges.get(port_id)) is None:
+            error = "Port is not registered"
+        else:
+            try:
+                await bridge.reconfigure(settings)
+            except Exception as e:  # pylint: disable=broad-except
+                error = str(e)
+        self._send(
+            {"event": "configured", "id": port_id, "success": error is None, "error": error}
+        )
+
+    def _serial_lost(self, port_id: str, exc: Exception | None) -> None:
+        self._bridges.pop(port_id, None)
+        self._send({"event": "serial_lost", "id": port_id, "error": str(exc)})
+
+    async def _report_statistics(self) -> None:
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            self._send(
+                {
+                    "event": "statistics",
+                    "ports": {
+                        port_id: bridge.statistics()
+                        for port_id, bridge in self._bridges.items()
+                    },
+                }
+            )
+
+
+def _worker_main(conn: Connection) -> None:
+    _Worker(conn).run()
+
+
+@dataclass
+class _WorkerHandle:
+    index: int
+    process: multiprocessing.Process
+    conn: Connection
+    ports: set[str] = field(default_factory=set)
+
+
+@dataclass
+class _Port:
+    id: str
+    settings: dict
+    owner: asyncio.StreamWriter
+    worker: _WorkerHandle | None = None
+    total_bytes: int = 0
+    byte_rate: float = 0.0
+    client: str | None = None
+
+
+class Supervisor:
+    """Accepts control connections and distributes ports over the workers."""
+
+    def __init__(self, socket_path: str, worker_count: int) -> None:
+        self._socket_path = socket_path
+        self._workers: list[_WorkerHandle] = []
+        self._ports: dict[str, _Port] = {}
+        self._connections: set[asyncio.StreamWriter] = set()
+        self._pending: dict[tuple[int, str], asyncio.Future] = {}
+        self._last_activity = time.monotonic()
+
+        # Fork the workers before any event loop or thread exists
+        for index in range(worker_count):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(child_conn,),
+                name=f"network_serial_port worker {index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(_WorkerHandle(index, process, parent_conn))
+
+    def run(self) -> None:
+        asyncio.run(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            loop.add_reader(worker.conn.fileno(), self._worker_event, worker)
+
+        server = await asyncio.start_unix_server(
+            self._handle_connection, path=self._socket_path
+        )
+        os.chmod(self._socket_path, 0o600)
+        socket_inode = os.stat(self._socket_path).st_ino
+        _LOGGER.info(
+            "Listening on %s with %d workers", self._socket_path, len(self._workers)
+        )
+
+        try:
+            last_rebalance = time.monotonic()
+            while True:
+                await asyncio.sleep(1)
+                now = time.monotonic()
+                if not self._connections and now - self._last_activity > IDLE_TIMEOUT:
+                    _LOGGER.info("Idle, exiting")
+                    break
+                if any(not worker.process.is_alive() for worker in self._workers):
+                    _LOGGER.error("Worker died, exiting")
+                    break
+                if not self._workers:
+                    _LOGGER.error("No workers left, exiting")
+                    break
+                if now - last_rebalance > REBALANCE_INTERVAL:
+                    last_rebalance = now
+                    await self._rebalance()
+        finally:
+            server.close()
+            # Do not remove the socket of a supervisor that replaced us
+            try:
+                if os.stat(self._socket_path).st_ino == socket_inode:
+                    os.unlink(self._socket_path)
+            except FileNotFoundError:
+                pass
+            for worker in self._workers:
+                loop.remove_reader(worker.conn.fileno())
+                worker.conn.close()
+                worker.process.join(5)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._connections.add(writer)
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["command"] == "register":
+                    await self._register(message["id"], message["settings"], writer)
+                elif message["command"] == "unregister":
+                    await self._unregister(message["id"])
+                elif message["command"] == "configure":
+                    await self._configure(message["id"], message["settings"], writer)
+        except (ConnectionError, json.JSONDecodeError, KeyError) as e:
+            _LOGGER.warning("Closing control connection: %s", e)
+        finally:
+            self._connections.discard(writer)
+            self._last_activity = time.monotonic()
+            for port in [p for p in self._ports.values() if p.owner is writer]:
+                await self._unregister(port.id)
+            writer.close()
+
+    def _notify(self, port: _Port, message: dict) -> None:
+        self._send(port.owner, message)
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, message: dict) -> None:
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(message).encode() + b"\n")
+
+    async def _request(self, worker: _WorkerHandle, message: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[(worker.index, message["id"])] = future
+        worker.conn.send(message)
+        try:
+            return await asyncio.wait_for(future, ACK_TIMEOUT)
+        finally:
+            self._pending.pop((worker.index, message["id"]), None)
+
+    async def _assign(self, port: _Port, worker: _WorkerHandle) -> dict:
+        port.worker = worker
+        port.total_bytes = 0
+        worker.ports.add(port.id)
+        try:
+            result = await self._request(
+                worker, {"command": "register", "id": port.id, "settings": port.settings}
+            )
+        except asyncio.TimeoutError:
+            worker.ports.discard(port.id)
+            port.worker = None
+            self._evict(worker)
+            return {"success": False, "error": "Timeout waiting for worker"}
+        if not result["success"]:
+            worker.ports.discard(port.id)
+            port.worker = None
+        return result
+
+    async def _release(self, port: _Port) -> None:
+        if (worker := port.worker) is None:
+            return
+        port.worker = None
+        worker.ports.discard(port.id)
+        try:
+            await self._request(worker, {"command": "unregister", "id": port.id})
+        except asyncio.TimeoutError:
+            self._evict(worker)
+        if port.client is not None:
+            port.client = None
+            self._notify(port, {"event": "disconnected", "id": port.id})
+
+    async def _register(
+        self, port_id: str, settings: dict, owner: asyncio.StreamWriter
+    ) -> None:
+        if port_id in self._ports:
+            await self._unregister(port_id)
+
+        port = _Port(port_id, settings, owner)
+        self._ports[port_id] = port
+        if not self._workers:
+            result = {"success": False, "error": "No workers left"}
+        else:
+            worker = min(
+                self._workers, key=lambda w: (self._worker_load(w), len(w.ports))
+            )
+            result = await self._assign(port, worker)
+            _LOGGER.info("Registered %s on worker %d: %s", port_id, worker.index, result)
+        if not result["success"]:
+            self._ports.pop(port_id, None)
+        self._notify(
+            port,
+            {
+                "event": "registered",
+                "id": port_id,
+                "success": result["success"],
+                "error": result["error"],
+            },
+        )
+
+    async def _unregister(self, port_id: str) -> None:
+        if port := self._ports.pop(port_id, None):
+            await self._release(port)
+
+    async def _configure(
+        self, port_id: str, settings: dict, writer: asyncio.StreamWriter
+    ) -> None:
+        port = self._ports.get(port_id)
+        if port is None or port.worker is None:
+            result = {"success": False, "error": "Port is not registered"}
+        else:
+            try:
+                result = await self._request(
+                    port.worker,
+                    {"command": "configure", "id": port_id, "settings": settings},
+                )
+            except asyncio.TimeoutError:
+                self._evict(port.worker)
+                result = {"success": False, "error": "Timeout waiting for worker"}
+            if result["success"]:
+                # Used when the port moves to another worker
+                port.settings.update(settings)
+        self._send(
+            writer,
+            {
+                "event": "configured",
+                "id": port_id,
+                "success": result["success"],
+                "error": result["error"],
+            },
+        )
+
+    def _evict(self, worker: _WorkerHandle) -> None:
+        """Stop a worker that does not respond, its ports are lost.
+
+        The owners of the ports register them again, on the remaining
+        workers. The supervisor exits when no worker is left.
+        """
+        if worker not in self._workers:
+            return
+        _LOGGER.error("Worker %d does not respond, stopping it", worker.index)
+        self._workers.remove(worker)
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        worker.process.kill()
+        worker.process.join(1)
+        for port_id in list(worker.ports):
+            if port := self._ports.pop(port_id, None):
+                self._notify(
+                    port,
+                    {"event": "serial_lost", "id": port_id, "error": "Worker does not respond"},
+                )
+        worker.ports.clear()
+
+    def _worker_load(self, worker: _WorkerHandle) -> float:
+        return sum(self._ports[port_id].byte_rate for port_id in worker.ports)
+
+    async def _rebalance(self) -> None:
+        """Move one port from the busiest to the idlest worker if worthwhile."""
+        if len(self._workers) < 2:
+            return
+        loads = sorted(self._workers, key=self._worker_load)
+        idlest, busiest = loads[0], loads[-1]
+        difference = self._worker_load(busiest) - self._worker_load(idlest)
+        if difference < REBALANCE_MIN_DIFFERENCE:
+            return
+
+        # A port with a rate of about half the difference evens out the load
+        candidates = [
+            self._ports[port_id]
+            for port_id in busiest.ports
+            if 0 < self._ports[port_id].byte_rate < difference
+        ]
+        if not candidates:
+            return
+        port = min(candidates, key=lambda p: abs(p.byte_rate - difference / 2))
+
+        _LOGGER.info(
+            "Moving %s from worker %d to worker %d",
+            port.id,
+            busiest.index,
+            idlest.index,
+        )
+        await self._release(port)
+        result = await self._assign(port, idlest)
+        if not result["success"]:
+            self._ports.pop(port.id, None)
+            self._notify(
+                port, {"event": "serial_lost", "id": port.id, "error": result["error"]}
+            )
+        else:
+            self._notify(port, {"event": "moved", "id": port.id, "worker": idlest.index})
+
+    def _worker_event(self, worker: _WorkerHandle) -> None:
+        try:
+            message = worker.conn.recv()
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+            return
+
+        event = message["event"]
+        if event in ("registered", "unregistered", "configured"):
+            if future := self._pending.get((worker.index, message["id"])):
+                if not future.done():
+                    future.set_result(message)
+        elif event == "statistics":
+            for port_id, statistics in message["ports"].items():
+                if (port := self._ports.get(port_id)) and port.worker is worker:
+                    total_bytes = (
+                        statistics["serial_to_net_bytes"]
+                        + statistics["net_to_serial_bytes"]
+                    )
+                    delta = max(total_bytes - port.total_bytes, 0)
+                    port.byte_rate = delta / STATS_INTERVAL
+                    port.total_bytes = total_bytes
+                    self._notify(
+                        port,
+                        {"event": "statistics", "id": port_id, "statistics": statistics},
+                    )
+        elif (port := self._ports.get(message["id"])) and port.worker is worker:
+            if event == "connected":
+                port.client = message["client"]
+            elif event == "disconnected":
+                port.client = None
+            elif event == "serial_lost":
+                worker.ports.discard(port.id)
+                del self._ports[port.id]
+            self._notify(port, message)
+
+
+def lock_control_socket(socket_path: str) -> int | None:
+    """Take the lock that allows one supervisor per control socket.
+
+    Returns the file descriptor that holds the lock while open, None when
+    another supervisor has it.
+    """
+    fd = os.open(socket_path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Host serial to network redirects in a pool of worker processes."
+    )
+    parser.add_argument("--control-socket", required=True, help="path of control socket")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes, default: %(default)s",
+    )
+    parser.add_argument(
+        "--loglevel",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        default="WARNING",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.loglevel)
+
+    # held until we exit, a supervisor started at the same time gives up
+    lock_fd = lock_control_socket(args.control_socket)
+    if lock_fd is None:
+        sys.stderr.write("Already running on {}\n".format(args.control_socket))
+        sys.exit(0)
+    if os.path.exists(args.control_socket):
+        # left behind by a supervisor that was killed
+        os.unlink(args.control_socket)
+    # the socket is created only accessible by us, not just chmod after bind
+    os.umask(0o077)
+
+    multiprocessing.set_start_method("fork")
+    Supervisor(args.control_socket, args.workers).run()
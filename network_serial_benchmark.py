@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""Throughput and latency benchmark for the serial <-> TCP bridge.
+
+Runs the bridge through the engines against local stand-ins for a serial
+device, so results are reproducible without hardware:
+
+* `pty` opens a pseudo terminal pair, the bridge gets the slave side and the
+  benchmark plays the device on the master side (echoing or streaming).
+* `loop` uses the pyserial `loop://` URL, everything sent to it is echoed.
+
+A pseudo terminal is not limited by the baud rate. With --baudrate the pty
+device sends at most as fast as a real device would at that rate (10 bits
+per byte), 0 (the default) does not limit it, so the numbers show the
+overhead of the bridge itself. loop:// is never limited and only runs with 0.
+
+Only the Home Assistant free modules of the integration are imported, so
+Home Assistant does not need to be installed.
+
+For every combination of the swept parameters the MB/s, the p50/p99 round
+trip latency, the CPU time per MB and the peak RSS of the bridge are
+measured. Results are written to a JSON file, use --compare to show the
+difference with an earlier run.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import pathlib
+import select
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tty
+import types
+
+# The package __init__ needs Home Assistant, the engines do not. Register the
+# package without running it, so its modules can still be imported.
+_package = types.ModuleType("network_serial_port")
+_package.__path__ = [
+    str(pathlib.Path(__file__).parent / "custom_components" / "network_serial_port")
+]
+sys.modules["network_serial_port"] = _package
+
+from network_serial_port.engines import create_engine  # type: ignore  # noqa: E402
+from network_serial_port.network_serial_process import (  # type: ignore  # noqa: E402
+    NetworkSerialPortConfiguration,
+    NetworkSerialProcess,
+)
+
+# Baudrate of the serial port when the device is not limited
+UNLIMITED_BAUDRATE = 115200
+
+PATTERN_STREAM = "stream"
+PATTERN_REQUEST_RESPONSE = "request_response"
+
+TRANSPORT_TCP = "tcp"
+TRANSPORT_UNIX = "unix"
+UNIX_SOCKET_PATH = "/tmp/network_serial_benchmark.sock"
+
+
+class Device:
+    """Device side of the serial port, only does something for pty."""
+
+    def __init__(self, kind: str, baudrate: int = 0) -> None:
+        self.kind = kind
+        # Bytes per second the device sends at most, 0 is not limited
+        self.byte_rate = baudrate / 10
+        self._master: int | None = None
+        self._slave: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def open(self) -> str:
+        """Returns the URL for the bridge"""
+        if self.kind == "loop":
+            return "loop://"
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        return os.ttyname(self._slave)
+
+    def start(self, pattern: str, chunk_size: int) -> None:
+        if self._master is None:
+            return
+        if pattern == PATTERN_STREAM:
+            target = self._stream
+        else:
+            target = self._echo
+        self._thread = threading.Thread(target=target, args=(chunk_size,), daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+
+    def _stream(self, chunk_size: int) -> None:
+        assert self._master is not None
+        data = bytes(range(256)) * (chunk_size // 256 + 1)
+        data = data[:chunk_size]
+        while not self._stop.is_set():
+            _, writable, _ = select.select([], [self._master], [], 0.1)
+            if writable:
+                self._pace(os.write(self._master, data))
+
+    def _echo(self, chunk_size: int) -> None:
+        assert self._master is not None
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.1)
+            if readable:
+                data = os.read(self._master, 65536)
+                os.write(self._master, data)
+                self._pace(len(data))
+
+    def _pace(self, sent: int) -> None:
+        """Wait as long as sending the bytes takes at the baud rate."""
+        if self.byte_rate:
+            time.sleep(sent / self.byte_rate)
+
+
+def drain(sock: socket.socket, stop: threading.Event, counter: list[int]) -> None:
+    """Read and count everything received until stopped."""
+    sock.settimeout(0.1)
+    buffer = bytearray(65536)
+    while not stop.is_set():
+        try:
+            n = sock.recv_into(buffer)
+        except socket.timeout:
+            continue
+        except OSError:
+            return
+        if not n:
+            return
+        counter[0] += n
+
+
+def connect(port: int, transport: str) -> socket.socket:
+    if transport == TRANSPORT_UNIX:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(UNIX_SOCKET_PATH)
+        return sock
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def run_load(
+    port: int,
+    transport: str,
+    device: Device,
+    pattern: str,
+    chunk_size: int,
+    clients: int,
+    duration: float,
+) -> dict:
+    """Connect the clients and generate traffic, runs in a thread."""
+    sockets = [connect(port, transport) for _ in range(clients)]
+    # Give the bridge time to register all clients
+    time.sleep(0.2)
+
+    stop = threading.Event()
+    counters = [[0] for _ in sockets]
+    # The first client generates the traffic, the others only listen
+    listeners = [
+        threading.Thread(target=drain, args=(sock, stop, counter), daemon=True)
+        for sock, counter in zip(sockets[1:], counters[1:])
+    ]
+    for listener in listeners:
+        listener.start()
+
+    data = bytes(range(256)) * (chunk_size // 256 + 1)
+    data = data[:chunk_size]
+    round_trips: list[float] = []
+    received = 0
+    start = time.monotonic()
+
+    if pattern == PATTERN_REQUEST_RESPONSE:
+        sock = sockets[0]
+        buffer = bytearray(65536)
+        while time.monotonic() - start < duration:
+            sent_at = time.perf_counter()
+            sock.sendall(data)
+            pending = chunk_size
+            while pending > 0:
+                n = sock.recv_into(buffer)
+                if not n:
+                    raise ConnectionError("Bridge closed the connection")
+                pending -= n
+            round_trips.append(time.perf_counter() - sent_at)
+            received += chunk_size
+    else:
+        receiver = threading.Thread(
+            target=drain, args=(sockets[0], stop, counters[0]), daemon=True
+        )
+        receiver.start()
+        if device.kind == "loop":
+            # loop:// echoes, so the client is the source of the stream
+            sockets[0].settimeout(0.1)
+            while time.monotonic() - start < duration:
+                try:
+                    sockets[0].sendall(data)
+                except socket.timeout:
+                    pass
+        else:
+            time.sleep(duration)
+        received = counters[0][0]
+
+    elapsed = time.monotonic() - start
+    stop.set()
+    for sock in sockets:
+        sock.close()
+
+    result = {
+        "bytes": received,
+        "elapsed": elapsed,
+        "mb_per_s": received / elapsed / 1e6,
+        "listener_bytes": [counter[0] for counter in counters[1:]],
+    }
+    if round_trips:
+        quantiles = statistics.quantiles(round_trips, n=100)
+        result["round_trips"] = len(round_trips)
+        result["rtt_p50_ms"] = statistics.median(round_trips) * 1e3
+        result["rtt_p99_ms"] = quantiles[98] * 1e3
+    return result
+
+
+def process_usage(pid: int) -> tuple[float, int]:
+    """CPU seconds and peak RSS in kB of a process."""
+    with open(f"/proc/{pid}/stat") as f:
+        # The command can contain spaces, fields after it are fixed
+        stat = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK")
+    rss = 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                rss = int(line.split()[1])
+    return cpu, rss
+
+
+async def run_case(case: dict, duration: float, port: int) -> dict:
+    device = Device(case["device"], case["baudrate"])
+    configuration = NetworkSerialPortConfiguration(
+        device.open(),
+        baudrate=case["baudrate"] or UNLIMITED_BAUDRATE,
+        localport=port,
+        engine=case["engine"],
+        max_clients=case["clients"],
+        splice=args.splice,
+        unix_socket=UNIX_SOCKET_PATH if case["transport"] == TRANSPORT_UNIX else "",
+    )
+    engine = create_engine(configuration, f"benchmark-{port}")
+    if not await engine.start():
+        device.stop()
+        raise RuntimeError(f"Could not start the bridge for {case}")
+
+    # The asyncio engine runs in this process, so the load generator is
+    # included in its CPU time and RSS
+    pid = engine.pid if isinstance(engine, NetworkSerialProcess) else None
+    if pid is None:
+        pid = os.getpid()
+
+    try:
+        device.start(case["pattern"], case["chunk_size"])
+        cpu_before, _ = process_usage(pid)
+        result = await asyncio.to_thread(
+            run_load,
+            port,
+            case["transport"],
+            device,
+            case["pattern"],
+            case["chunk_size"],
+            case["clients"],
+            duration,
+        )
+        cpu_after, rss = process_usage(pid)
+    finally:
+        await engine.stop()
+        device.stop()
+
+    megabytes = result["bytes"] / 1e6
+    result["cpu_seconds"] = cpu_after - cpu_before
+    result["cpu_seconds_per_mb"] = (
+        result["cpu_seconds"] / megabytes if megabytes else None
+    )
+    result["rss_kb"] = rss
+    return {**case, **result}
+
+
+def case_key(result: dict) -> tuple:
+    return tuple(
+        result[key]
+        for key in ("engine", "device", "pattern", "baudrate", "chunk_size", "clients")
+    ) + (result.get("transport", TRANSPORT_TCP),)
+
+
+def compare(previous_file: str, results: list[dict]):
+    with open(previous_file) as f:
+        previous = {case_key(result): result for result in json.load(f)["results"]}
+
+    print(f"\nCompared to {previous_file}:")
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        line = f"{case_key(result)}: {old['mb_per_s']:.2f} -> {result['mb_per_s']:.2f} MB/s"
+        if "rtt_p99_ms" in result and "rtt_p99_ms" in old:
+            line += f", p99 {old['rtt_p99_ms']:.3f} -> {result['rtt_p99_ms']:.3f} ms"
+        print(line)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+parser = argparse.ArgumentParser(description="Network Serial Port benchmark")
+parser.add_argument(
+    "--engine",
+    nargs="+",
+    choices=["process", "asyncio"],
+    default=["process"],
+    help="Engines to benchmark, default is process.",
+)
+parser.add_argument(
+    "--device",
+    nargs="+",
+    choices=["pty", "loop"],
+    default=["pty", "loop"],
+    help="Serial port stand-ins, default is both.",
+)
+parser.add_argument(
+    "--pattern",
+    nargs="+",
+    choices=[PATTERN_STREAM, PATTERN_REQUEST_RESPONSE],
+    default=[PATTERN_STREAM, PATTERN_REQUEST_RESPONSE],
+    help="Traffic patterns, default is both.",
+)
+parser.add_argument(
+    "--baudrate",
+    nargs="+",
+    type=int,
+    default=[0],
+    help="Baudrates to sweep, the pty device is limited to this rate. Default is 0, not limited.",
+)
+parser.add_argument(
+    "--chunk-size",
+    nargs="+",
+    type=int,
+    default=[16, 1024],
+    help="Chunk sizes to sweep, default is 16 and 1024 bytes.",
+)
+parser.add_argument(
+    "--clients",
+    nargs="+",
+    type=int,
+    default=[1, 4],
+    help="Number of connected clients to sweep, default is 1 and 4.",
+)
+parser.add_argument(
+    "--transport",
+    nargs="+",
+    choices=[TRANSPORT_TCP, TRANSPORT_UNIX],
+    default=[TRANSPORT_TCP],
+    help="How the clients connect, default is loopback tcp. unix uses a Unix domain socket (process engine only).",
+)
+parser.add_argument(
+    "--duration", type=float, default=3, help="Seconds per case, default is 3."
+)
+parser.add_argument(
+    "--port", type=int, default=17000, help="TCP port for the bridge."
+)
+parser.add_argument(
+    "--output",
+    default="benchmark_results.json",
+    help="File to write the results to, default is benchmark_results.json.",
+)
+parser.add_argument(
+    "--splice",
+    action="store_true",
+    help="Use the splice fast path of the process engine.",
+)
+parser.add_argument("--compare", help="Earlier results file to compare with.")
+parser.add_argument(
+    "--loglevel",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+    default="WARNING",
+    help="Define loglevel, default is WARNING.",
+)
+
+args = parser.parse_args()
+
+logging.basicConfig(level=args.loglevel)
+
+
+async def main():
+    results = []
+    for engine, device, pattern, baudrate, chunk_size, clients, transport in itertools.product(
+        args.engine,
+        args.device,
+        args.pattern,
+        args.baudrate,
+        args.chunk_size,
+        args.clients,
+        args.transport,
+    ):
+        case = {
+            "engine": engine,
+            "device": device,
+            "pattern": pattern,
+            "baudrate": baudrate,
+            "chunk_size": chunk_size,
+            "clients": clients,
+            "transport": transport,
+        }
+        if engine == "asyncio" and device == "loop":
+            # The asyncio engine needs a serial port with a file descriptor
+            continue
+        if engine != "process" and transport == TRANSPORT_UNIX:
+            continue
+        if device == "loop" and baudrate:
+            # loop:// can not be limited to the baud rate
+            continue
+        result = await run_case(case, args.duration, args.port)
+        results.append(result)
+
+        line = f"{case_key(result)}: {result['mb_per_s']:.2f} MB/s"
+        if "rtt_p50_ms" in result:
+            line += f", rtt p50 {result['rtt_p50_ms']:.3f} ms p99 {result['rtt_p99_ms']:.3f} ms"
+        if result["cpu_seconds_per_mb"] is not None:
+            line += f", {result['cpu_seconds_per_mb']:.3f} cpu s/MB"
+        line += f", rss {result['rss_kb']} kB"
+        print(line)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "revision": git_revision(),
+                "python": sys.version.split()[0],
+                "timestamp": time.time(),
+                "duration": args.duration,
+                "splice": args.splice,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+asyncio.run(main())
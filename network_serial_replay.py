@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Replay captured traffic as a virtual serial device.
+
+Opens a pseudo terminal and plays the device side of a capture made with the
+start_capture service (see capture.py), so the bridge and its consumers can
+be load tested without the hardware. Start the bridge on the printed pty path
+(or on --link) exactly like on a real /dev/ttyUSB*.
+
+* `stream` writes the data the device sent with the original timing, N times
+  faster with --speed N or as fast as possible with --speed 0. Data written
+  to the device is read and discarded.
+* `respond` answers requests from the request/response table recorded in
+  the capture: data written to the pty that matches a recorded request is
+  answered with the recorded response. Requests that were answered
+  differently over time get the recorded responses in turn.
+
+Needs only the standard library, capture.py is loaded from the integration
+directory.
+"""
+
+import argparse
+import collections
+import os
+import pathlib
+import select
+import signal
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(
+    0, str(pathlib.Path(__file__).parent / "custom_components" / "network_serial_port")
+)
+from capture import (  # type: ignore  # noqa: E402
+    DIRECTION_NET_TO_SERIAL,
+    DIRECTION_SERIAL_TO_NET,
+    read_records,
+)
+
+MODE_STREAM = "stream"
+MODE_RESPOND = "respond"
+
+# A response is a list of (delay after the request in seconds, data)
+Response = list[tuple[float, bytes]]
+
+
+def build_response_table(records: list) -> dict[bytes, list[Response]]:
+    """Pair every request with the device data that followed it.
+
+    Consecutive records in the same direction are joined, the bridge may have
+    received a request in several chunks.
+    """
+    table: dict[bytes, list[Response]] = collections.defaultdict(list)
+    request = b""
+    requested_at = 0.0
+    response: Response = []
+    for timestamp, direction, data in records:
+        if direction == DIRECTION_NET_TO_SERIAL:
+            if response:
+                table[request].append(response)
+                request, response = b"", []
+            if not request:
+                requested_at = timestamp
+            request += data
+        elif direction == DIRECTION_SERIAL_TO_NET and request:
+            response.append((timestamp - requested_at, data))
+    if request and response:
+        table[request].append(response)
+    return dict(table)
+
+
+def wait_until(deadline: float, stop: threading.Event) -> bool:
+    """Sleep until the monotonic deadline, returns False when stopped"""
+    return not stop.wait(max(deadline - time.monotonic(), 0))
+
+
+def stream(master: int, records: list, speed: float, loop: bool, stop: threading.Event):
+    """Write the data sent by the device with the recorded timing"""
+    device_records = [
+        (timestamp, data)
+        for timestamp, direction, data in records
+        if direction == DIRECTION_SERIAL_TO_NET
+    ]
+    if not device_records:
+        print("Capture has no data from the device", file=sys.stderr)
+        return
+    first = device_records[0][0]
+    while not stop.is_set():
+        started_at = time.monotonic()
+        for timestamp, data in device_records:
+            if speed and not wait_until(started_at + (timestamp - first) / speed, stop):
+                return
+            os.write(master, data)
+        if not loop:
+            return
+
+
+def discard_input(master: int, stop: threading.Event) -> None:
+    """Read what the bridge writes to the device, so it does not block"""
+    while not stop.is_set():
+        if select.select([master], [], [], 0.1)[0]:
+            os.read(master, 65536)
+
+
+def respond(master: int, table: dict[bytes, list[Response]], speed: float, stop: threading.Event):
+    """Answer recorded requests with the recorded responses"""
+    if not table:
+        print("Capture has no request/response pairs", file=sys.stderr)
+        return
+    longest = max(len(request) for request in table)
+    turns = {request: 0 for request in table}
+    received = b""
+    while not stop.is_set():
+        if not select.select([master], [], [], 0.1)[0]:
+            continue
+        received += os.read(master, 65536)
+        for request, responses in table.items():
+            if not received.endswith(request):
+                continue
+            response = responses[turns[request] % len(responses)]
+            turns[request] += 1
+            requested_at = time.monotonic()
+            for delay, data in response:
+                if speed and not wait_until(requested_at + delay / speed, stop):
+                    return
+                os.write(master, data)
+            received = b""
+            break
+        else:
+            # keep enough to match a request that arrives in pieces
+            received = received[-longest:]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay captured traffic as a virtual serial device"
+    )
+    parser.add_argument("capture", help="Capture file made with the start_capture service.")
+    parser.add_argument(
+        "--mode",
+        choices=[MODE_STREAM, MODE_RESPOND],
+        default=MODE_STREAM,
+        help="Play back the device data or answer recorded requests, default is stream.",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="Playback speed factor, 0 is as fast as possible. Default is 1 (original timing).",
+    )
+    parser.add_argument(
+        "--loop", action="store_true", help="Repeat the stream until stopped."
+    )
+    parser.add_argument(
+        "--link", help="Create a symlink to the pty, e.g. /tmp/ttyREPLAY."
+    )
+    args = parser.parse_args()
+
+    records = read_records(args.capture)
+    master, slave = os.openpty()
+    tty.setraw(master)
+    # Keeping the slave side open avoids hangups between bridge restarts
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if args.link:
+        if os.path.islink(args.link):
+            os.unlink(args.link)
+        os.symlink(path, args.link)
+        path = args.link
+    print(f"Replaying {len(records)} records of {args.capture} on {path}", flush=True)
+
+    # Clean up the link when stopped with SIGTERM as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    stop = threading.Event()
+    reader = threading.Thread(target=discard_input, args=(master, stop), daemon=True)
+    try:
+        if args.mode == MODE_STREAM:
+            reader.start()
+            stream(master, records, args.speed, args.loop, stop)
+            print("Done, press Ctrl-C to close the pty", flush=True)
+            stop.wait()
+        else:
+            respond(master, build_response_table(records), args.speed, stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if reader.is_alive():
+            reader.join()
+        if args.link and os.path.islink(args.link):
+            os.unlink(args.link)
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Far end of a compressed bridge connection.
+
+A bridge in client mode with the compress option sends and receives a zlib
+stream. This script takes that connection (--listen) and offers the plain
+serial data to the consumers on the far side of the link on --local, like
+the bridge would in server mode:
+
+    network_serial_port (client mode, compress) --zlib--> this script <--plain-- consumers
+
+Data from the consumers is compressed for the bridge and flushed at the
+latest --flush ms after the oldest data held back, like the bridge does. A new
+connection of the bridge replaces the previous one with a new zlib stream.
+Consumers receive all data from the serial port, their data is merged.
+
+All connections are non-blocking, data that cannot be sent right away is
+queued per connection. A consumer with more than --backlog bytes queued is
+disconnected, so it cannot stall the bridge or the other consumers. While
+more than --backlog bytes are queued for the bridge, consumer data is
+dropped.
+
+The bytes before and after compression are printed every --stats seconds
+and when stopped.
+
+Needs only the standard library.
+"""
+
+import argparse
+import selectors
+import signal
+import socket
+import time
+import zlib
+
+# bytes queued for a connection before it counts as too slow
+BACKLOG = 1 << 20
+
+
+class Tunnel:
+    """Relays between the compressed bridge connection and the plain consumers."""
+
+    def __init__(self, level: int, flush: float, backlog: int = BACKLOG) -> None:
+        self.level = level
+        self.flush = flush
+        self.backlog = backlog
+        self.selector = selectors.DefaultSelector()
+        self.bridge: socket.socket | None = None
+        self.consumers: list[socket.socket] = []
+        # data not sent yet, per connection
+        self.pending: dict[socket.socket, bytearray] = {}
+        self.compressor = zlib.compressobj(level)
+        self.decompressor = zlib.decompressobj()
+        # since when data is held back in the compressor
+        self.unflushed_since: float | None = None
+        # bytes before and after compression, to and from the bridge
+        self.uncompressed_sent = 0
+        self.compressed_sent = 0
+        self.uncompressed_received = 0
+        self.compressed_received = 0
+        # data of consumers while the bridge is not connected or too slow
+        self.dropped = 0
+
+    def add_listener(self, sock: socket.socket, accept) -> None:
+        self.selector.register(sock, selectors.EVENT_READ, accept)
+
+    def accept_bridge(self, listener: socket.socket) -> None:
+        sock, addr = listener.accept()
+        if self.bridge is not None:
+            print("Bridge connected again, closing the previous connection", flush=True)
+            self.close_bridge()
+        print(f"Bridge connected from {addr[0]}:{addr[1]}", flush=True)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.bridge = sock
+        self.pending[sock] = bytearray()
+        self.compressor = zlib.compressobj(self.level)
+        self.decompressor = zlib.decompressobj()
+        self.unflushed_since = None
+        self.selector.register(sock, selectors.EVENT_READ, self.from_bridge)
+
+    def accept_consumer(self, listener: socket.socket) -> None:
+        sock, addr = listener.accept()
+        print(f"Consumer connected from {addr[0]}:{addr[1]}", flush=True)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.consumers.append(sock)
+        self.pending[sock] = bytearray()
+        self.selector.register(sock, selectors.EVENT_READ, self.from_consumer)
+
+    def close_bridge(self) -> None:
+        if self.bridge is not None:
+            self.selector.unregister(self.bridge)
+            del self.pending[self.bridge]
+            self.bridge.close()
+            self.bridge = None
+
+    def close_consumer(self, sock: socket.socket, reason: str = "disconnected") -> None:
+        print(f"Consumer {reason}", flush=True)
+        self.selector.unregister(sock)
+        self.consumers.remove(sock)
+        del self.pending[sock]
+        sock.close()
+
+    def send(self, sock: socket.socket, data: bytes) -> None:
+        """Send what the socket takes right away, queue the rest."""
+        pending = self.pending[sock]
+        if not pending:
+            try:
+                sent = sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            data = data[sent:]
+            if data:
+                key = self.selector.get_key(sock)
+                self.selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, key.data)
+        pending += data
+
+    def send_pending(self, sock: socket.socket) -> None:
+        """Continue sending the queued data when the socket is writable again."""
+        pending = self.pending[sock]
+        try:
+            sent = sock.send(pending)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            if sock is self.bridge:
+                print(f"Bridge disconnected: {err}", flush=True)
+                self.close_bridge()
+            else:
+                self.close_consumer(sock)
+            return
+        del pending[:sent]
+        if not pending:
+            key = self.selector.get_key(sock)
+            self.selector.modify(sock, selectors.EVENT_READ, key.data)
+
+    def from_bridge(self, sock: socket.socket) -> None:
+        try:
+            data = sock.recv(16384)
+            if not data:
+                raise ConnectionError("connection closed")
+            self.compressed_received += len(data)
+            data = self.decompressor.decompress(data)
+        except (OSError, zlib.error) as err:
+            print(f"Bridge disconnected: {err}", flush=True)
+            self.close_bridge()
+            return
+        self.uncompressed_received += len(data)
+        for consumer in list(self.consumers):
+            try:
+                self.send(consumer, data)
+            except OSError:
+                self.close_consumer(consumer)
+                continue
+            if len(self.pending[consumer]) > self.backlog:
+                self.close_consumer(consumer, "too slow, disconnected")
+
+    def from_consumer(self, sock: socket.socket) -> None:
+        try:
+            data = sock.recv(16384)
+        except OSError:
+            data = b""
+        if not data:
+            self.close_consumer(sock)
+            return
+        if self.bridge is None or len(self.pending[self.bridge]) > self.backlog:
+            self.dropped += len(data)
+            return
+        self.uncompressed_sent += len(data)
+        if self.unflushed_since is None:
+            self.unflushed_since = time.monotonic()
+        self.send_to_bridge(self.compressor.compress(data))
+
+    def flush_to_bridge(self) -> None:
+        """Send what the compressor held back."""
+        self.unflushed_since = None
+        if self.bridge is not None:
+            self.send_to_bridge(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def send_to_bridge(self, data: bytes) -> None:
+        if not data or self.bridge is None:
+            return
+        try:
+            self.send(self.bridge, data)
+        except OSError as err:
+            print(f"Bridge disconnected: {err}", flush=True)
+            self.close_bridge()
+            return
+        self.compressed_sent += len(data)
+
+    def statistics(self) -> str:
+        def ratio(compressed: int, uncompressed: int) -> str:
+            return f"{compressed / uncompressed:.1%}" if uncompressed else "-"
+
+        return (
+            f"to bridge {self.uncompressed_sent} -> {self.compressed_sent} bytes"
+            f" ({ratio(self.compressed_sent, self.uncompressed_sent)}),"
+            f" from bridge {self.compressed_received} -> {self.uncompressed_received} bytes"
+            f" ({ratio(self.compressed_received, self.uncompressed_received)}),"
+            f" {self.dropped} bytes dropped without bridge or while it was slow"
+        )
+
+    def run(self, stats_interval: float) -> None:
+        next_stats = time.monotonic() + stats_interval if stats_interval else None
+        while True:
+            deadlines = [next_stats]
+            if self.unflushed_since is not None:
+                deadlines.append(self.unflushed_since + self.flush)
+            deadline = min((d for d in deadlines if d is not None), default=None)
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            for key, events in self.selector.select(timeout):
+                sock = key.fileobj
+                assert isinstance(sock, socket.socket)
+                # closed by an earlier callback of this round
+                if sock.fileno() == -1:
+                    continue
+                if events & selectors.EVENT_WRITE:
+                    self.send_pending(sock)
+                if events & selectors.EVENT_READ and sock.fileno() != -1:
+                    key.data(sock)
+            now = time.monotonic()
+            if self.unflushed_since is not None and now >= self.unflushed_since + self.flush:
+                self.flush_to_bridge()
+            if next_stats is not None and now >= next_stats:
+                print(self.statistics(), flush=True)
+                next_stats = now + stats_interval
+
+
+def listen(address: str) -> socket.socket:
+    host, _, port = address.rpartition(":")
+    sock = socket.create_server((host, int(port)))
+    sock.setblocking(False)
+    return sock
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Decompressing far end of a network_serial_port bridge in client mode with compression."
+    )
+    parser.add_argument(
+        "--listen",
+        required=True,
+        metavar="[HOST:]PORT",
+        help="Address the bridge connects to, set as host:port of the client mode.",
+    )
+    parser.add_argument(
+        "--local",
+        required=True,
+        metavar="[HOST:]PORT",
+        help="Address the consumers connect to for the plain serial data.",
+    )
+    parser.add_argument(
+        "--level", type=int, choices=range(1, 10), metavar="1..9", default=6,
+        help="zlib compression level of the data to the bridge (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--flush", type=int, metavar="MS", default=10,
+        help="Flush the compressed stream at the latest after this many ms (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--backlog", type=int, metavar="BYTES", default=BACKLOG,
+        help="Disconnect a consumer with more than this queued, drop consumer data while more "
+        "than this is queued for the bridge (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--stats", type=float, metavar="SECONDS", default=60,
+        help="Print the bytes before and after compression this often, 0 only when stopped "
+        "(default: %(default)s).",
+    )
+    args = parser.parse_args()
+
+    tunnel = Tunnel(args.level, args.flush / 1000, args.backlog)
+    tunnel.add_listener(listen(args.listen), tunnel.accept_bridge)
+    tunnel.add_listener(listen(args.local), tunnel.accept_consumer)
+    print(f"Waiting for the bridge on {args.listen}, consumers on {args.local}", flush=True)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        tunnel.run(args.stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(tunnel.statistics(), flush=True)
+
+
+if __name__ == "__main__":
+    main()
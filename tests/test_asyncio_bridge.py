@@ -0,0 +1,147 @@
+"""Test the asyncio engine."""
+import asyncio
+import os
+import pathlib
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(
+    0,
+    str(
+        pathlib.Path(__file__).parent.parent
+        / "custom_components"
+        / "network_serial_port"
+    ),
+)
+import asyncio_bridge  # type: ignore  # noqa: E402
+
+
+@pytest.fixture
+def pty_pair():
+    """Serial port for the bridge, with the file descriptor of the device side."""
+    controller, device = os.openpty()
+    yield controller, os.ttyname(device)
+    os.close(controller)
+    os.close(device)
+
+
+@pytest.fixture
+def pty(pty_pair) -> str:
+    """Serial port for the bridge."""
+    return pty_pair[1]
+
+
+def _run_bridge(url: str, takeover: str, test) -> None:
+    """Run test(bridge, port) against a started bridge."""
+
+    async def run() -> None:
+        bridge = asyncio_bridge.SerialBridge(url, 0, takeover=takeover)
+        await bridge.start()
+        try:
+            port = bridge._server.sockets[0].getsockname()[1]
+            await test(bridge, port)
+        finally:
+            await bridge.stop()
+
+    asyncio.run(run())
+
+
+async def _wait_for(condition) -> None:
+    async with asyncio.timeout(2):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_takeover_newest(pty: str, socket_enabled) -> None:
+    """Test a new client disconnects the active one and gets the port."""
+
+    async def test(bridge, port: int) -> None:
+        first_reader, first_writer = await asyncio.open_connection("127.0.0.1", port)
+        await _wait_for(lambda: bridge.connects == 1)
+        first = bridge._client
+
+        _, second_writer = await asyncio.open_connection("127.0.0.1", port)
+        await _wait_for(lambda: bridge.connects == 2)
+        assert bridge.takeovers == 1
+        assert bridge._client is not first
+        async with asyncio.timeout(2):
+            assert await first_reader.read() == b""
+        first_writer.close()
+        second_writer.close()
+
+    _run_bridge(pty, asyncio_bridge.TAKEOVER_NEWEST, test)
+
+
+def test_takeover_reject(pty: str, socket_enabled) -> None:
+    """Test a new client is disconnected while the port is in use."""
+
+    async def test(bridge, port: int) -> None:
+        _, first_writer = await asyncio.open_connection("127.0.0.1", port)
+        await _wait_for(lambda: bridge.connects == 1)
+        first = bridge._client
+
+        second_reader, second_writer = await asyncio.open_connection("127.0.0.1", port)
+        await _wait_for(lambda: bridge.rejects == 1)
+        async with asyncio.timeout(2):
+            try:
+                assert await second_reader.read() == b""
+            except ConnectionResetError:
+                pass
+        assert bridge._client is first
+        assert bridge.connects == 1
+        assert not bridge._waiting_clients
+        first_writer.close()
+        second_writer.close()
+
+    _run_bridge(pty, asyncio_bridge.TAKEOVER_REJECT, test)
+
+
+def test_slow_client_pauses_serial(pty_pair, socket_enabled) -> None:
+    """Test the serial port is not read while the client does not keep up."""
+    controller, url = pty_pair
+
+    async def test(bridge, port: int) -> None:
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.setblocking(False)
+        await loop.sock_connect(sock, ("127.0.0.1", port))
+        await _wait_for(lambda: bridge.connects == 1)
+
+        # the device keeps sending, the client does not read
+        os.set_blocking(controller, False)
+        chunk = b"x" * 4096
+        async with asyncio.timeout(5):
+            while not bridge.flow_pauses:
+                try:
+                    os.write(controller, chunk)
+                except BlockingIOError:
+                    pass
+                await asyncio.sleep(0)
+        transport = bridge._client.transport
+        assert transport.get_write_buffer_size() <= (
+            asyncio_bridge.CLIENT_WRITE_HIGH_WATER + asyncio_bridge.READ_SIZE
+        )
+
+        # nothing more is read from the serial port
+        read = bridge.bytes_from_serial
+        for _ in range(20):
+            try:
+                os.write(controller, chunk)
+            except BlockingIOError:
+                pass
+            await asyncio.sleep(0.01)
+        assert bridge.bytes_from_serial == read
+
+        # reading again resumes the serial port
+        async with asyncio.timeout(5):
+            while bridge._serial_paused:
+                try:
+                    await loop.sock_recv(sock, 65536)
+                except BlockingIOError:
+                    await asyncio.sleep(0.01)
+        sock.close()
+
+    _run_bridge(url, asyncio_bridge.TAKEOVER_WAIT, test)
@@ -0,0 +1,60 @@
+"""Test the capture ring file and the exporters."""
+import io
+
+from custom_components.network_serial_port.capture import (
+    DIRECTION_NET_TO_SERIAL,
+    DIRECTION_SERIAL_TO_NET,
+    PCAP_HEADER,
+    RECORD,
+    CaptureRing,
+    export_hexdump,
+    export_pcap,
+    read_records,
+)
+
+
+def test_records_in_order(tmp_path) -> None:
+    """Test records are read back oldest first with their direction."""
+    path = tmp_path / "port.capture"
+    ring = CaptureRing(path, 1024)
+    ring.write(DIRECTION_NET_TO_SERIAL, b"request")
+    ring.write(DIRECTION_SERIAL_TO_NET, memoryview(b"response"))
+    ring.close()
+
+    records = read_records(path)
+    assert [(direction, data) for _, direction, data in records] == [
+        (DIRECTION_NET_TO_SERIAL, b"request"),
+        (DIRECTION_SERIAL_TO_NET, b"response"),
+    ]
+    assert records[0][0] <= records[1][0]
+
+
+def test_wraparound_drops_oldest(tmp_path) -> None:
+    """Test the file size is fixed and the newest records are kept when full."""
+    path = tmp_path / "port.capture"
+    record_size = RECORD.size + 10
+    ring = CaptureRing(path, record_size * 5 + 7)
+    for i in range(23):
+        ring.write(DIRECTION_SERIAL_TO_NET, b"%010d" % i)
+    ring.close()
+
+    assert path.stat().st_size == 32 + record_size * 5 + 7
+    assert [data for _, _, data in read_records(path)] == [
+        b"%010d" % i for i in range(18, 23)
+    ]
+
+
+def test_exporters(tmp_path) -> None:
+    """Test the pcap and hexdump output."""
+    records = [(1700000000.5, DIRECTION_SERIAL_TO_NET, b"Hello\x00")]
+
+    pcap = io.BytesIO()
+    export_pcap(records, pcap)
+    assert len(pcap.getvalue()) == PCAP_HEADER.size + 16 + 7
+    assert pcap.getvalue().endswith(b"\x00Hello\x00")
+
+    text = io.StringIO()
+    export_hexdump(records, text)
+    lines = text.getvalue().splitlines()
+    assert lines[0].endswith("serial->net 6 bytes")
+    assert lines[1] == "  0000  48 65 6c 6c 6f 00" + " " * 32 + "Hello."
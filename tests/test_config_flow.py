@@ -8,6 +8,7 @@ from custom_components.network_serial_port.config_flow import CannotConnect, Inv
 from custom_components.network_serial_port.const import DOMAIN
 from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResultType
+from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 pytestmark = pytest.mark.usefixtures("mock_setup_entry")
 
@@ -40,6 +41,32 @@ async def test_form(hass: HomeAssistant, mock_setup_entry: AsyncMock) -> None:
         "serial_url": "Serial URL handler",
         "baudrate": 12345,
         "tcp_port": 54321,
+        "client": "",
+        "unix_socket": "",
+        "unix_socket_mode": "660",
+        "engine": "process",
+        "max_clients": 1,
+        "slow_client_policy": "drop-oldest",
+        "client_queue_size": 65536,
+        "write_mode": "immediate",
+    "recv_size": 1024,
+    "coalesce_size": 4096,
+    "coalesce_window": 2,
+        "recv_size": 1024,
+        "coalesce_size": 4096,
+        "coalesce_window": 2,
+        "low_latency": False,
+        "splice": False,
+        "framing": "none",
+        "metrics_port": 0,
+        "on_demand": False,
+        "idle_close": 30,
+        "compress": False,
+        "compress_flush": 10,
+        "flow_control": "none",
+        "takeover": "wait",
+        "keepalive_idle": 1,
+        "user_timeout": 0,
     }
     assert len(mock_setup_entry.mock_calls) == 1
 
@@ -65,3 +92,132 @@ async def test_form_cannot_connect(hass: HomeAssistant) -> None:
 
     assert result2["type"] == FlowResultType.FORM
     assert result2["errors"] == {"base": "cannot_connect"}
+
+
+async def test_form_specific_errors(hass: HomeAssistant) -> None:
+    """Test probe failures are reported on the field."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+
+    with patch(
+        "custom_components.network_serial_port.config_flow.probe_serial",
+        return_value="serial_not_found",
+    ), patch(
+        "custom_components.network_serial_port.config_flow.probe_tcp_port",
+        return_value="tcp_port_in_use",
+    ):
+        result2 = await hass.config_entries.flow.async_configure(
+            result["flow_id"],
+            {
+                "serial_url": "/dev/ttyUSB0",
+                "baudrate": 12345,
+                "tcp_port": 54321,
+            },
+        )
+
+    assert result2["type"] == FlowResultType.FORM
+    assert result2["errors"] == {
+        "serial_url": "serial_not_found",
+        "tcp_port": "tcp_port_in_use",
+    }
+
+
+async def test_options_flow(hass: HomeAssistant) -> None:
+    """Test changing the options."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            "serial_url": "Serial URL handler",
+            "baudrate": 12345,
+            "tcp_port": 54321,
+        },
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "init"
+
+    with patch(
+        "custom_components.network_serial_port.config_flow.validate_input",
+        return_value={"title": "Title"},
+    ) as mock_validate_input:
+        result2 = await hass.config_entries.options.async_configure(
+            result["flow_id"],
+            {
+                "baudrate": 9600,
+                "tcp_port": 54322,
+            },
+        )
+
+    assert result2["type"] == FlowResultType.CREATE_ENTRY
+    assert mock_validate_input.call_args.args[1]["serial_url"] == "Serial URL handler"
+    assert entry.options == {
+        "baudrate": 9600,
+        "tcp_port": 54322,
+        "client": "",
+        "unix_socket": "",
+        "unix_socket_mode": "660",
+        "engine": "process",
+        "max_clients": 1,
+        "slow_client_policy": "drop-oldest",
+        "client_queue_size": 65536,
+        "write_mode": "immediate",
+    "recv_size": 1024,
+    "coalesce_size": 4096,
+    "coalesce_window": 2,
+        "recv_size": 1024,
+        "coalesce_size": 4096,
+        "coalesce_window": 2,
+        "low_latency": False,
+        "splice": False,
+        "framing": "none",
+        "metrics_port": 0,
+        "on_demand": False,
+        "idle_close": 30,
+        "compress": False,
+        "compress_flush": 10,
+        "flow_control": "none",
+        "takeover": "wait",
+        "keepalive_idle": 1,
+        "user_timeout": 0,
+    }
+
+
+async def test_options_flow_errors(hass: HomeAssistant) -> None:
+    """Test invalid options are reported on the field and not saved."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            "serial_url": "Serial URL handler",
+            "baudrate": 12345,
+            "tcp_port": 54321,
+        },
+    )
+    entry.add_to_hass(hass)
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    with patch(
+        "custom_components.network_serial_port.config_flow.probe_serial"
+    ) as mock_probe_serial, patch(
+        "custom_components.network_serial_port.config_flow.probe_tcp_port",
+        return_value="tcp_port_in_use",
+    ):
+        result2 = await hass.config_entries.options.async_configure(
+            result["flow_id"],
+            {
+                "baudrate": 12345,
+                "tcp_port": 54322,
+                "compress": True,
+            },
+        )
+
+    assert result2["type"] == FlowResultType.FORM
+    assert result2["errors"] == {
+        "tcp_port": "tcp_port_in_use",
+        "compress": "compress_needs_client",
+    }
+    # The running bridge holds the serial port
+    mock_probe_serial.assert_not_called()
+    assert entry.options == {}
@@ -0,0 +1,37 @@
+"""Test the Network serial port coordinator."""
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from homeassistant.core import HomeAssistant
+import homeassistant.util.dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.network_serial_port.const import MIN_UPDATE_INTERVAL
+from custom_components.network_serial_port.coordinator import (
+    NetworkSerialPortCoordinator,
+)
+
+
+async def test_updates_are_throttled(hass: HomeAssistant) -> None:
+    """Test updates within the interval are combined into one at its end."""
+    coordinator = NetworkSerialPortCoordinator(hass, MagicMock())
+    updates: list[None] = []
+    coordinator.async_add_listener(lambda: updates.append(None))
+
+    # The first update is pushed immediately
+    coordinator.async_schedule_update()
+    assert len(updates) == 1
+
+    coordinator.async_schedule_update()
+    coordinator.async_schedule_update()
+    await hass.async_block_till_done()
+    assert len(updates) == 1
+
+    # The trailing update, so the last state is not lost
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=MIN_UPDATE_INTERVAL + 1)
+    )
+    await hass.async_block_till_done()
+    assert len(updates) == 2
+
+    await coordinator.async_shutdown()
@@ -0,0 +1,63 @@
+"""Test the cached serial port discovery."""
+import pytest
+import serial
+from serial.tools.list_ports_common import ListPortInfo
+
+from custom_components.network_serial_port import discovery
+from custom_components.network_serial_port.discovery import PortDiscovery, hwgrep_url
+
+
+def _usb_port(device: str, serial_number: str | None, location: str) -> ListPortInfo:
+    port = ListPortInfo(device, skip_link_detection=True)
+    port.description = "FT232R USB UART"
+    port.vid, port.pid = 0x0403, 0x6001
+    port.serial_number = serial_number
+    port.location = location
+    port.hwid = port.usb_info()
+    return port
+
+
+@pytest.fixture
+def ports(monkeypatch) -> list[ListPortInfo]:
+    """Ports returned by the enumeration."""
+    ports = [
+        _usb_port("/dev/ttyUSB0", "A1", "1-1.2:1.0"),
+        _usb_port("/dev/ttyUSB1", "A12", "1-1.3:1.0"),
+        _usb_port("/dev/ttyUSB2", None, "1-1.4:1.0"),
+    ]
+    monkeypatch.setattr(discovery.serial.tools.list_ports, "comports", lambda: ports)
+    return ports
+
+
+def test_cached_until_devices_change(tmp_path, ports) -> None:
+    """Test the ports are only enumerated again when the watched directory changes."""
+    port_discovery = PortDiscovery(watched=[str(tmp_path)])
+    assert len(port_discovery.comports()) == 3
+    assert len(port_discovery.comports()) == 3
+    assert port_discovery.scans == 1
+
+    (tmp_path / "ttyUSB3").symlink_to("../../devices/usb1/1-1.5")
+    ports.pop()
+    assert len(port_discovery.comports()) == 2
+    assert port_discovery.scans == 2
+
+
+def test_resolve_url(tmp_path, ports) -> None:
+    """Test hwgrep:// URLs are resolved from the cache."""
+    port_discovery = PortDiscovery(watched=[str(tmp_path)])
+    assert port_discovery.resolve_url("/dev/ttyS0") == "/dev/ttyS0"
+    assert port_discovery.resolve_url("hwgrep://SER=A12") == "/dev/ttyUSB1"
+    assert port_discovery.resolve_url("hwgrep://0403:6001&n=3") == "/dev/ttyUSB2"
+    assert port_discovery.resolve_url("hwgrep://SER=A1&skip_busy") == "hwgrep://SER=A1&skip_busy"
+    with pytest.raises(serial.SerialException):
+        port_discovery.resolve_url("hwgrep://SER=B7")
+    assert port_discovery.scans == 1
+
+
+def test_hwgrep_url(ports) -> None:
+    """Test the suggested URL only matches its own port."""
+    # SER=A1 also matches SER=A12, the location is unique
+    assert hwgrep_url(ports[0], ports) == "hwgrep://LOCATION=1\\-1\\.2:1\\.0$"
+    assert hwgrep_url(ports[1], ports) == "hwgrep://SER=A12"
+    assert hwgrep_url(ports[2], ports) == "hwgrep://LOCATION=1\\-1\\.4:1\\.0$"
+    assert hwgrep_url(ListPortInfo("/dev/ttyAMA0", skip_link_detection=True), ports) == "/dev/ttyAMA0"
@@ -0,0 +1,67 @@
+"""Test splitting serial data into frames."""
+import time
+
+from custom_components.network_serial_port.framing import (
+    FRAMING_CRLF,
+    FRAMING_LF,
+    FRAMING_NONE,
+    FRAMING_SLIP,
+    MAX_FRAME_SIZE,
+    DelimiterFramer,
+    SilenceFramer,
+    create_framer,
+    silence_interval,
+)
+
+
+def test_delimiter_across_reads() -> None:
+    """Test frames are split on the delimiter, also when it is split over reads."""
+    framer = DelimiterFramer(b"\r\n")
+    assert framer.feed(b"first\r") == []
+    assert framer.feed(b"\nsecond\r\nthi") == [b"first\r\n", b"second\r\n"]
+    assert framer.feed(b"rd\r\n") == [b"third\r\n"]
+    assert framer.timeout() is None
+
+
+def test_empty_lines_are_frames() -> None:
+    """Test an empty line is a frame of its own and not merged into the next line."""
+    framer = create_framer(FRAMING_LF)
+    assert framer.feed(b"\nfirst\n\n") == [b"\n", b"first\n", b"\n"]
+    assert framer.feed(b"\r\n") == [b"\r\n"]
+
+    framer = create_framer(FRAMING_CRLF)
+    assert framer.feed(b"\r\nfirst\r\n\r") == [b"\r\n", b"first\r\n"]
+    assert framer.feed(b"\n\n\r\n") == [b"\r\n", b"\n\r\n"]
+
+
+def test_slip_leading_end() -> None:
+    """Test a SLIP END starting a frame is kept with that frame."""
+    framer = create_framer(FRAMING_SLIP)
+    assert framer.feed(b"\xc0ab\xc0\xc0") == [b"\xc0ab\xc0"]
+    assert framer.feed(b"cd\xc0") == [b"\xc0cd\xc0"]
+
+
+def test_frame_size_limit() -> None:
+    """Test a frame without end is sent when it reaches the maximum size."""
+    framer = DelimiterFramer(b"\n")
+    frames = framer.feed(b"x" * MAX_FRAME_SIZE)
+    assert frames == [b"x" * MAX_FRAME_SIZE]
+    assert framer.flush() == b""
+
+
+def test_silence() -> None:
+    """Test a frame ends after the interval without data."""
+    assert create_framer(FRAMING_NONE) is None
+    assert silence_interval(9600) == 3.5 * 10 / 9600
+    assert silence_interval(9600, parity="E", stopbits=2) == 3.5 * 12 / 9600
+    assert silence_interval(115200) == 0.00175
+
+    framer = SilenceFramer(0.01)
+    assert framer.timeout() is None
+    assert framer.feed(b"ab") == []
+    assert framer.feed(b"cd") == []
+    assert 0 < framer.timeout() <= 0.01
+    time.sleep(0.02)
+    assert framer.timeout() == 0
+    assert framer.flush() == b"abcd"
+    assert framer.timeout() is None
@@ -0,0 +1,74 @@
+"""Test the histograms and the metrics text exposition."""
+import pathlib
+import socket
+
+from custom_components.network_serial_port.metrics import (
+    COUNTER,
+    HISTOGRAM,
+    Histogram,
+    MetricFamily,
+    render,
+    serve,
+)
+
+
+def test_histogram_buckets() -> None:
+    """Test a value is counted in the first bucket it is not larger than."""
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 2, 10, 11):
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 2), (10, 4), (float("inf"), 5)]
+    assert histogram.sum == 24.5
+
+
+def test_render() -> None:
+    """Test the Prometheus and OpenMetrics output."""
+    histogram = Histogram((0.001,))
+    histogram.observe(0.0005)
+    families = [
+        MetricFamily(
+            "bridge_bytes_total", COUNTER, "Bytes.", [({"serial": 'a"b'}, 3)]
+        ),
+        MetricFamily("bridge_latency_seconds", HISTOGRAM, "Latency.", [({}, histogram)]),
+    ]
+
+    assert render(families).splitlines() == [
+        "# HELP bridge_bytes_total Bytes.",
+        "# TYPE bridge_bytes_total counter",
+        'bridge_bytes_total{serial="a\\"b"} 3',
+        "# HELP bridge_latency_seconds Latency.",
+        "# TYPE bridge_latency_seconds histogram",
+        'bridge_latency_seconds_bucket{le="0.001"} 1',
+        'bridge_latency_seconds_bucket{le="+Inf"} 1',
+        "bridge_latency_seconds_sum 0.0005",
+        "bridge_latency_seconds_count 1",
+    ]
+
+    lines = render(families, openmetrics=True).splitlines()
+    assert lines[1] == "# TYPE bridge_bytes counter"
+    assert lines[2] == 'bridge_bytes_total{serial="a\\"b"} 3'
+    assert lines[-1] == "# EOF"
+
+
+def test_serve(tmp_path: pathlib.Path) -> None:
+    """Test GET /metrics answers with the collected families."""
+    path = str(tmp_path / "metrics.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    families = [MetricFamily("bridge_clients", COUNTER, "Clients.", [({}, 1)])]
+    server = serve(listener, lambda: families)
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(2)
+        client.connect(path)
+        client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+        response = b""
+        while data := client.recv(4096):
+            response += data
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert response.startswith(b"HTTP/1.0 200")
+    assert response.endswith(b"bridge_clients 1\n")
@@ -0,0 +1,85 @@
+"""Test the replay of captured traffic."""
+import os
+import select
+import threading
+import tty
+
+from network_serial_replay import (
+    DIRECTION_NET_TO_SERIAL,
+    DIRECTION_SERIAL_TO_NET,
+    build_response_table,
+    respond,
+)
+
+
+def test_build_response_table() -> None:
+    """Test requests are paired with the device data that followed them."""
+    records = [
+        # device data before the first request is not a response
+        (0.5, DIRECTION_SERIAL_TO_NET, b"boot"),
+        # a request received in two chunks
+        (1.0, DIRECTION_NET_TO_SERIAL, b"RE"),
+        (1.1, DIRECTION_NET_TO_SERIAL, b"AD"),
+        (1.25, DIRECTION_SERIAL_TO_NET, b"4"),
+        (1.5, DIRECTION_SERIAL_TO_NET, b"2"),
+        (2.0, DIRECTION_NET_TO_SERIAL, b"READ"),
+        (2.5, DIRECTION_SERIAL_TO_NET, b"43"),
+        # never answered
+        (3.0, DIRECTION_NET_TO_SERIAL, b"RESET"),
+    ]
+    assert build_response_table(records) == {
+        b"READ": [[(0.25, b"4"), (0.5, b"2")], [(0.5, b"43")]],
+    }
+
+
+def test_build_response_table_empty() -> None:
+    """Test a capture without requests has no pairs."""
+    assert build_response_table([(0.0, DIRECTION_SERIAL_TO_NET, b"data")]) == {}
+
+
+def _read(fd: int, size: int) -> bytes:
+    data = b""
+    while len(data) < size and select.select([fd], [], [], 2)[0]:
+        data += os.read(fd, size - len(data))
+    return data
+
+
+def test_respond() -> None:
+    """Test requests are answered with the recorded responses in turn."""
+    table = build_response_table(
+        [
+            (0.0, DIRECTION_NET_TO_SERIAL, b"READ"),
+            (0.1, DIRECTION_SERIAL_TO_NET, b"first"),
+            (1.0, DIRECTION_NET_TO_SERIAL, b"READ"),
+            (1.1, DIRECTION_SERIAL_TO_NET, b"second"),
+            (2.0, DIRECTION_NET_TO_SERIAL, b"PING"),
+            (2.1, DIRECTION_SERIAL_TO_NET, b"PONG"),
+        ]
+    )
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    stop = threading.Event()
+    responder = threading.Thread(
+        target=respond, args=(master, table, 0, stop), daemon=True
+    )
+    responder.start()
+    try:
+        # unknown data before the request, the request in pieces
+        os.write(slave, b"noise RE")
+        os.write(slave, b"AD")
+        assert _read(slave, 5) == b"first"
+        os.write(slave, b"PING")
+        assert _read(slave, 4) == b"PONG"
+        os.write(slave, b"READ")
+        assert _read(slave, 6) == b"second"
+        os.write(slave, b"READ")
+        assert _read(slave, 5) == b"first"
+        os.write(slave, b"UNKNOWN")
+        assert not select.select([slave], [], [], 0.2)[0]
+    finally:
+        stop.set()
+        responder.join(2)
+        os.close(master)
+        os.close(slave)
+    assert not responder.is_alive()
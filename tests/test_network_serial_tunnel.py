@@ -0,0 +1,92 @@
+"""Test the far end of a compressed bridge connection."""
+import socket
+import threading
+import time
+import zlib
+
+from network_serial_tunnel import BACKLOG, Tunnel, listen
+
+
+def _start_tunnel(
+    flush: float, backlog: int = BACKLOG
+) -> tuple[Tunnel, socket.socket, socket.socket]:
+    """Run a tunnel in a thread, return it with a connected bridge and consumer."""
+    tunnel = Tunnel(6, flush, backlog)
+    bridge_listener = listen("127.0.0.1:0")
+    consumer_listener = listen("127.0.0.1:0")
+    tunnel.add_listener(bridge_listener, tunnel.accept_bridge)
+    tunnel.add_listener(consumer_listener, tunnel.accept_consumer)
+    threading.Thread(target=tunnel.run, args=(0,), daemon=True).start()
+
+    bridge = socket.create_connection(bridge_listener.getsockname())
+    consumer = socket.create_connection(consumer_listener.getsockname())
+    deadline = time.monotonic() + 2
+    while (tunnel.bridge is None or not tunnel.consumers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    bridge.settimeout(2)
+    consumer.settimeout(2)
+    return tunnel, bridge, consumer
+
+
+def test_bridge_to_consumer(socket_enabled) -> None:
+    """Test the compressed data of the bridge reaches the consumers in plain."""
+    tunnel, bridge, consumer = _start_tunnel(0.01)
+    compressor = zlib.compressobj()
+    bridge.sendall(
+        compressor.compress(b"hello serial\n") + compressor.flush(zlib.Z_SYNC_FLUSH)
+    )
+    assert consumer.recv(100) == b"hello serial\n"
+    assert tunnel.uncompressed_received == 13
+    bridge.close()
+    consumer.close()
+
+
+def test_consumer_steady_traffic_is_flushed(socket_enabled) -> None:
+    """Test consumer data reaches the bridge within the flush interval."""
+    flush = 0.05
+    tunnel, bridge, consumer = _start_tunnel(flush)
+    decompressor = zlib.decompressobj()
+    started = time.monotonic()
+    received = b""
+    first_arrival = None
+    bridge.setblocking(False)
+    while time.monotonic() - started < 0.5:
+        consumer.sendall(b"x" * 10)
+        time.sleep(0.005)
+        try:
+            received += decompressor.decompress(bridge.recv(65536))
+        except BlockingIOError:
+            pass
+        if received and first_arrival is None:
+            first_arrival = time.monotonic()
+    assert first_arrival is not None
+    assert first_arrival - started < flush + 0.05
+    assert tunnel.compressed_sent < tunnel.uncompressed_sent
+    bridge.close()
+    consumer.close()
+
+
+def test_slow_consumer_is_disconnected(socket_enabled) -> None:
+    """Test a consumer that does not read is dropped instead of stalling the others."""
+    tunnel, bridge, slow = _start_tunnel(0.01, backlog=65536)
+    fast = socket.create_connection(slow.getpeername())
+    fast.settimeout(2)
+    deadline = time.monotonic() + 2
+    while len(tunnel.consumers) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    compressor = zlib.compressobj()
+    chunk = bytes(range(256)) * 64
+    sent = received = 0
+    # more than the socket buffers of the slow consumer take
+    while len(tunnel.consumers) == 2 and sent < 1 << 26:
+        bridge.sendall(
+            compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        )
+        sent += len(chunk)
+        while received < sent:
+            received += len(fast.recv(65536))
+    assert len(tunnel.consumers) == 1
+    assert received == sent
+    bridge.close()
+    slow.close()
+    fast.close()
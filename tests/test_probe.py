@@ -0,0 +1,182 @@
+"""Test the config flow probes."""
+import socket
+
+from custom_components.network_serial_port.network_serial_process import (
+    NetworkSerialPortConfiguration,
+)
+from custom_components.network_serial_port.probe import (
+    probe_client,
+    probe_clients,
+    probe_compress,
+    probe_metrics_port,
+    probe_on_demand,
+    probe_serial,
+    probe_slow_client_policy,
+    probe_tcp_port,
+    probe_unix_socket,
+)
+
+
+def test_probe_serial() -> None:
+    """Test the serial port probe reasons."""
+    assert probe_serial(NetworkSerialPortConfiguration("loop://")) is None
+    assert (
+        probe_serial(NetworkSerialPortConfiguration("/dev/does-not-exist"))
+        == "serial_not_found"
+    )
+    assert (
+        probe_serial(NetworkSerialPortConfiguration("unknown://handler"))
+        == "invalid_serial_url"
+    )
+    assert (
+        probe_serial(NetworkSerialPortConfiguration("loop://", engine="asyncio"))
+        == "no_file_descriptor"
+    )
+
+
+def test_probe_tcp_port(socket_enabled) -> None:
+    """Test the TCP port probe reasons."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("", 0))
+    sock.listen()
+    port = sock.getsockname()[1]
+    try:
+        assert probe_tcp_port(port) == "tcp_port_in_use"
+    finally:
+        sock.close()
+    assert probe_tcp_port(port) is None
+    assert probe_tcp_port(70000) == "invalid_tcp_port"
+
+
+def test_probe_client() -> None:
+    """Test the client mode settings check."""
+    assert probe_client(NetworkSerialPortConfiguration("loop://", client="host:7000")) is None
+    assert (
+        probe_client(NetworkSerialPortConfiguration("loop://", client="host"))
+        == "invalid_client"
+    )
+    assert (
+        probe_client(NetworkSerialPortConfiguration("loop://", client="host:70000"))
+        == "invalid_client"
+    )
+    assert (
+        probe_client(
+            NetworkSerialPortConfiguration(
+                "/dev/ttyUSB0", client="host:7000", engine="asyncio"
+            )
+        )
+        == "client_needs_process_engine"
+    )
+
+
+def test_probe_unix_socket(tmp_path, socket_enabled) -> None:
+    """Test the Unix domain socket probe reasons."""
+    path = str(tmp_path / "port.sock")
+    configuration = NetworkSerialPortConfiguration("loop://", unix_socket=path)
+    assert probe_unix_socket(configuration) is None
+    assert (
+        probe_unix_socket(
+            NetworkSerialPortConfiguration("loop://", unix_socket="port.sock")
+        )
+        == "invalid_unix_socket"
+    )
+    assert (
+        probe_unix_socket(
+            NetworkSerialPortConfiguration(
+                "loop://", unix_socket=str(tmp_path / "missing" / "port.sock")
+            )
+        )
+        == "unix_socket_directory_not_found"
+    )
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    try:
+        assert probe_unix_socket(configuration) == "unix_socket_path_in_use"
+    finally:
+        sock.close()
+    # Left behind, replaced when starting
+    assert probe_unix_socket(configuration) is None
+
+
+def test_probe_metrics_port() -> None:
+    """Test the metrics port probe reasons."""
+    assert (
+        probe_metrics_port(
+            NetworkSerialPortConfiguration("loop://", localport=7000, metrics_port=7000)
+        )
+        == "tcp_port_in_use"
+    )
+    assert (
+        probe_metrics_port(
+            NetworkSerialPortConfiguration(
+                "/dev/ttyUSB0", localport=7000, metrics_port=9100, engine="asyncio"
+            )
+        )
+        == "metrics_needs_process_engine"
+    )
+
+
+def test_probe_compress() -> None:
+    """Test compression needs client mode."""
+    assert (
+        probe_compress(NetworkSerialPortConfiguration("loop://", localport=7000, compress=True))
+        == "compress_needs_client"
+    )
+    assert (
+        probe_compress(
+            NetworkSerialPortConfiguration("loop://", client="tunnel.example:7000", compress=True)
+        )
+        is None
+    )
+
+
+def test_probe_clients() -> None:
+    """Test several clients and the slow client policies need the process engine."""
+    assert probe_clients(NetworkSerialPortConfiguration("loop://", max_clients=4)) is None
+    assert (
+        probe_clients(
+            NetworkSerialPortConfiguration(
+                "/dev/ttyUSB0", slow_client_policy="block", engine="worker_pool"
+            )
+        )
+        == "clients_need_process_engine"
+    )
+
+
+def test_probe_slow_client_policy() -> None:
+    """Test the block policy needs a single client, waiting would stall the others."""
+    assert (
+        probe_slow_client_policy(
+            NetworkSerialPortConfiguration("loop://", slow_client_policy="block")
+        )
+        is None
+    )
+    assert (
+        probe_slow_client_policy(
+            NetworkSerialPortConfiguration(
+                "loop://", slow_client_policy="block", max_clients=2
+            )
+        )
+        == "block_needs_one_client"
+    )
+    assert (
+        probe_slow_client_policy(
+            NetworkSerialPortConfiguration(
+                "loop://", slow_client_policy="disconnect", max_clients=2
+            )
+        )
+        is None
+    )
+
+
+def test_probe_on_demand() -> None:
+    """Test opening on demand needs the process engine."""
+    assert probe_on_demand(NetworkSerialPortConfiguration("loop://", on_demand=True)) is None
+    assert (
+        probe_on_demand(
+            NetworkSerialPortConfiguration("/dev/ttyUSB0", on_demand=True, engine="asyncio")
+        )
+        == "on_demand_needs_process_engine"
+    )
@@ -0,0 +1,35 @@
+"""Test the ring buffer used between the serial reader and the clients."""
+import pytest
+
+from custom_components.network_serial_port.ring_buffer import ByteRingBuffer
+
+
+def test_fifo_with_wraparound() -> None:
+    """Test data comes out in order when wrapping around the end."""
+    buffer = ByteRingBuffer(8)
+    assert buffer.write(b"abcdef") == 0
+    assert buffer.read(4) == b"abcd"
+    assert buffer.write(b"ghijk") == 0
+    assert len(buffer) == 7
+    assert buffer.read(100) == b"efghijk"
+    assert len(buffer) == 0
+    assert buffer.high_water == 7
+
+
+def test_overflow_drops_oldest() -> None:
+    """Test the oldest data is overwritten and counted when full."""
+    buffer = ByteRingBuffer(4)
+    buffer.write(b"abc")
+    assert buffer.write(b"de") == 1
+    assert buffer.read(10) == b"bcde"
+    assert buffer.write(b"0123456789") == 6
+    assert buffer.read(10) == b"6789"
+    assert buffer.overflow_bytes == 7
+    assert buffer.overflow_count == 2
+    assert buffer.high_water == 4
+
+
+def test_invalid_size() -> None:
+    """Test a buffer needs a size."""
+    with pytest.raises(ValueError):
+        ByteRingBuffer(0)
@@ -0,0 +1,41 @@
+"""Test the traffic statistics reported by the engines."""
+import time
+
+from custom_components.network_serial_port.network_serial_process import (
+    NetworkSerialStatistics,
+)
+
+
+def test_update_and_byte_rate() -> None:
+    """Test reported values are taken over and the byte rate is derived."""
+    statistics = NetworkSerialStatistics()
+    statistics.update({"serial_to_net_bytes": 100, "high_water": 10, "unknown": 1})
+    assert statistics.serial_to_net_bytes == 100
+    assert statistics.high_water == 10
+    assert statistics.byte_rate == 0
+
+    time.sleep(0.1)
+    statistics.update({"serial_to_net_bytes": 150, "net_to_serial_bytes": 50})
+    assert 0 < statistics.byte_rate <= 100 / 0.1
+
+
+def test_counters_continue_after_restart() -> None:
+    """Test counters of a restarted engine are added to the totals so far."""
+    statistics = NetworkSerialStatistics()
+    statistics.update({"serial_to_net_bytes": 1000, "connects": 3, "high_water": 500})
+
+    # e.g. moved to another worker, which counts from 0
+    statistics.continue_from(statistics)
+    statistics.update({"serial_to_net_bytes": 10, "connects": 1, "high_water": 20})
+    assert statistics.serial_to_net_bytes == 1010
+    assert statistics.connects == 4
+    # Not a counter
+    assert statistics.high_water == 20
+
+    # e.g. the bridge was restarted with new statistics
+    restarted = NetworkSerialStatistics()
+    restarted.continue_from(statistics)
+    assert restarted.serial_to_net_bytes == 1010
+    restarted.update({"serial_to_net_bytes": 5})
+    assert restarted.serial_to_net_bytes == 1015
+    assert restarted.connects == 4
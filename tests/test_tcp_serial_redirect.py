@@ -0,0 +1,701 @@
+"""Test the serial to network redirect script."""
+import errno
+import os
+import pathlib
+import socket
+import sys
+import threading
+import time
+import types
+import zlib
+
+import pytest
+import serial  # type: ignore
+import serial.threaded  # type: ignore
+
+sys.path.insert(
+    0,
+    str(
+        pathlib.Path(__file__).parent.parent
+        / "custom_components"
+        / "network_serial_port"
+    ),
+)
+import tcp_serial_redirect  # type: ignore  # noqa: E402
+
+
+def _receive(
+    sock: socket.socket, decompress: bool
+) -> tuple[list[tuple[float, bytes]], threading.Thread]:
+    """Collect (arrival time, data) from sock in a thread until it closes."""
+    received: list[tuple[float, bytes]] = []
+
+    def run() -> None:
+        decompressor = zlib.decompressobj()
+        while data := sock.recv(65536):
+            if decompress:
+                data = decompressor.decompress(data)
+            if data:
+                received.append((time.monotonic(), data))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return received, thread
+
+
+def test_compressed_steady_traffic_is_flushed() -> None:
+    """Test data arrives within the flush interval while new data keeps coming."""
+    ours, theirs = socket.socketpair()
+    flush = 0.05
+    client = tcp_serial_redirect.ClientConnection(
+        ours,
+        ("test", 0),
+        65536,
+        tcp_serial_redirect.SLOW_CLIENT_DROP_OLDEST,
+        compress_level=6,
+        compress_flush=flush,
+    )
+    received, receiver = _receive(theirs, decompress=True)
+
+    sent = []
+    started = time.monotonic()
+    while time.monotonic() - started < 0.5:
+        line = "{:.6f}\n".format(time.monotonic()).encode()
+        sent.append(line)
+        client.send(line)
+        time.sleep(0.005)
+    time.sleep(flush * 2)
+    client.close()
+    receiver.join(1)
+    theirs.close()
+
+    assert b"".join(data for _, data in received) == b"".join(sent)
+    # every line arrives within the flush interval (plus scheduling slack)
+    partial = b""
+    for arrived, data in received:
+        *lines, partial = (partial + data).split(b"\n")
+        for line in lines:
+            assert arrived - float(line) < flush + 0.05
+    assert client.compressed_sent < client.uncompressed_sent
+
+
+def test_compressed_flush_zero_sends_every_chunk() -> None:
+    """Test a flush delay of 0 sends every chunk right away."""
+    ours, theirs = socket.socketpair()
+    client = tcp_serial_redirect.ClientConnection(
+        ours,
+        ("test", 0),
+        65536,
+        tcp_serial_redirect.SLOW_CLIENT_DROP_OLDEST,
+        compress_level=6,
+        compress_flush=0,
+    )
+    decompressor = zlib.decompressobj()
+    theirs.settimeout(1)
+    client.send(b"ping")
+    data = b""
+    while data != b"ping":
+        data += decompressor.decompress(theirs.recv(100))
+    client.close()
+    theirs.close()
+
+
+def test_listener_needs_a_socket() -> None:
+    """Test port 0 without a Unix domain socket is rejected instead of waiting forever."""
+    with pytest.raises(ValueError):
+        tcp_serial_redirect.Listener(0)
+
+
+def test_listener_unix_socket_only(tmp_path: pathlib.Path, socket_enabled) -> None:
+    """Test port 0 only listens on the Unix domain socket."""
+    path = str(tmp_path / "serial.sock")
+    listener = tcp_serial_redirect.Listener(0, path)
+    try:
+        assert listener.socket is None
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        accepted, addr = listener.accept()
+        assert addr[0] == path
+        accepted.close()
+        client.close()
+    finally:
+        listener.close()
+
+
+def test_listener_close(tmp_path: pathlib.Path, socket_enabled) -> None:
+    """Test closing the listener releases the TCP and the Unix domain socket."""
+    path = str(tmp_path / "serial.sock")
+    listener = tcp_serial_redirect.Listener(0, path)
+    listener.socket = tcp = tcp_serial_redirect.Listener._bind(0, "127.0.0.1")
+    listener.close()
+    assert tcp.fileno() == -1
+    assert listener.unix_socket.fileno() == -1
+    assert not os.path.exists(path)
+
+
+def test_framed_drop_oldest() -> None:
+    """Test a slow client loses whole frames, the oldest first."""
+    ours, theirs = socket.socketpair()
+    ours.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    theirs.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    client = tcp_serial_redirect.ClientConnection(
+        ours,
+        ("test", 0),
+        65536,
+        tcp_serial_redirect.SLOW_CLIENT_DROP_OLDEST,
+        framed=True,
+    )
+    # the writer blocks sending the first frame, the others are queued
+    client.send(b"0" * 60000)
+    deadline = time.monotonic() + 2
+    while len(client.buffer) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for frame in (b"a" * 30000, b"b" * 30000, b"c" * 30000):
+        client.send(frame)
+    assert list(client.frames) == [30000, 30000]
+    assert client.buffer.overflow_count == 1
+    assert client.buffer.overflow_bytes == 30000
+
+    # a frame larger than the buffer is dropped
+    client.send(b"x" * 70000)
+    assert list(client.frames) == [30000, 30000]
+    assert client.buffer.overflow_count == 2
+
+    theirs.settimeout(2)
+    received = b""
+    while len(received) < 120000:
+        received += theirs.recv(65536)
+    assert received == b"0" * 60000 + b"b" * 30000 + b"c" * 30000
+    client.close()
+    theirs.close()
+
+
+class _SerialWorker:
+    """Keeps the writes to the serial port."""
+
+    def __init__(self) -> None:
+        self.writes: list[bytes] = []
+
+    def write(self, data) -> None:
+        self.writes.append(bytes(data))
+
+
+@pytest.mark.parametrize(
+    ("write_mode", "max_write"),
+    [
+        (tcp_serial_redirect.WRITE_MODE_IMMEDIATE, 16),
+        (tcp_serial_redirect.WRITE_MODE_THROUGHPUT, 64),
+    ],
+)
+def test_coalesce_writes(write_mode: str, max_write: int) -> None:
+    """Test throughput mode combines data of the client in larger serial writes."""
+    ours, theirs = socket.socketpair()
+    client = tcp_serial_redirect.ClientConnection(
+        ours, ("test", 0), 65536, tcp_serial_redirect.SLOW_CLIENT_DROP_OLDEST
+    )
+    serial_worker = _SerialWorker()
+    args = types.SimpleNamespace(
+        write_mode=write_mode,
+        low_latency=False,
+        recv_size=16,
+        coalesce_size=64,
+        coalesce_window=100,
+        develop=False,
+    )
+    forwarder = threading.Thread(
+        target=tcp_serial_redirect.network_to_serial,
+        args=(client, serial_worker, args),
+        daemon=True,
+    )
+    forwarder.start()
+
+    sent = [bytes([i]) * 8 for i in range(20)]
+    for data in sent:
+        theirs.sendall(data)
+        time.sleep(0.002)
+    theirs.close()
+    forwarder.join(2)
+    client.close()
+
+    assert b"".join(serial_worker.writes) == b"".join(sent)
+    assert max(len(data) for data in serial_worker.writes) <= max_write
+    if write_mode == tcp_serial_redirect.WRITE_MODE_THROUGHPUT:
+        assert len(serial_worker.writes) <= 4
+
+
+class _Protocol(serial.threaded.Protocol):
+    """Keeps the received data and counts the closes and opens of the port."""
+
+    def __init__(self) -> None:
+        self.received = bytearray()
+        self.suspended = 0
+        self.reopened = 0
+        self.interrupted = 0
+        self.resumed = 0
+
+    def data_received(self, data) -> None:
+        self.received += data
+
+    def connection_suspended(self) -> None:
+        self.suspended += 1
+
+    def connection_reopened(self, duration: float) -> None:
+        self.reopened += 1
+
+    def connection_interrupted(self, error) -> None:
+        self.interrupted += 1
+
+    def connection_resumed(self, duration: float) -> None:
+        self.resumed += 1
+
+
+def _wait_for(condition, timeout: float = 3) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_on_demand_open_and_idle_close() -> None:
+    """Test the port is opened for a user and closed after idle_close without users."""
+    protocol = _Protocol()
+    worker = tcp_serial_redirect.SerialReaderThread(
+        serial.serial_for_url("loop://"),
+        lambda: protocol,
+        url="loop://",
+        idle_close=0.1,
+    )
+    worker.start()
+    try:
+        # not wanted before the first user
+        assert _wait_for(lambda: protocol.suspended == 1)
+        assert not worker.online.is_set()
+        assert not worker.serial.is_open
+
+        worker.acquire()
+        assert worker.online.wait(3)
+        assert worker.serial.is_open
+        assert protocol.reopened == 1
+        worker.write(b"ping")
+        assert _wait_for(lambda: protocol.received == b"ping")
+
+        # a user within idle_close keeps it open
+        worker.release()
+        worker.acquire()
+        time.sleep(0.3)
+        assert worker.online.is_set()
+        assert protocol.suspended == 1
+
+        worker.release()
+        assert worker.users == 0
+        assert _wait_for(lambda: protocol.suspended == 2)
+        assert not worker.serial.is_open
+
+        # and opened again for the next user
+        worker.acquire()
+        assert worker.online.wait(3)
+        assert protocol.reopened == 2
+        worker.release()
+        timer = worker._idle_timer
+    finally:
+        worker.stop()
+    # stopped within idle_close, the timer does not outlive the worker
+    assert worker._idle_timer is None
+    timer.join(1)
+    assert not timer.is_alive()
+
+
+def test_wait_until_open(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test an on demand client is disconnected when the port does not open."""
+    monkeypatch.setattr(tcp_serial_redirect, "OPEN_TIMEOUT", 0.01)
+    worker = types.SimpleNamespace(online=threading.Event(), idle_close=0.1, url="loop://")
+    client = types.SimpleNamespace(addr=("test", 0))
+    worker.online.set()
+    assert tcp_serial_redirect.wait_until_open(worker, client)
+
+    worker.online.clear()
+    assert not tcp_serial_redirect.wait_until_open(worker, client)
+    # lost while always open, the data is buffered
+    worker.idle_close = None
+    assert tcp_serial_redirect.wait_until_open(worker, client)
+
+
+class _Slots:
+    """Semaphore of max_clients slots with the clients that hold them."""
+
+    def __init__(self, count: int) -> None:
+        self.semaphore = threading.Semaphore(count)
+        self.ser_to_net = types.SimpleNamespace(clients=[], takeovers=0, rejects=0)
+
+
+def _held_client() -> tuple[types.SimpleNamespace, socket.socket]:
+    ours, theirs = socket.socketpair()
+    return types.SimpleNamespace(socket=ours, addr=("old", 1)), theirs
+
+
+def test_take_slot_free() -> None:
+    """Test a free slot is taken with every policy."""
+    for policy in (tcp_serial_redirect.TAKEOVER_NEWEST, tcp_serial_redirect.TAKEOVER_REJECT):
+        slots = _Slots(1)
+        assert tcp_serial_redirect.take_slot(
+            slots.ser_to_net, slots.semaphore, ("new", 2), policy
+        )
+        assert not slots.semaphore.acquire(False)
+
+
+def test_take_slot_reject() -> None:
+    """Test a new client is rejected when all slots are taken."""
+    slots = _Slots(1)
+    slots.semaphore.acquire()
+    client, theirs = _held_client()
+    slots.ser_to_net.clients.append(client)
+    assert not tcp_serial_redirect.take_slot(
+        slots.ser_to_net, slots.semaphore, ("new", 2), tcp_serial_redirect.TAKEOVER_REJECT
+    )
+    assert slots.ser_to_net.rejects == 1
+    # the connected client is left alone
+    theirs.setblocking(False)
+    with pytest.raises(BlockingIOError):
+        theirs.recv(1)
+    client.socket.close()
+    theirs.close()
+
+
+def test_take_slot_newest() -> None:
+    """Test the oldest client is disconnected and its slot is taken."""
+    slots = _Slots(1)
+    slots.semaphore.acquire()
+    client, theirs = _held_client()
+    slots.ser_to_net.clients.append(client)
+
+    def serve() -> None:
+        # like serve_client: the slot is freed when recv() returns
+        client.socket.recv(1)
+        slots.semaphore.release()
+
+    threading.Thread(target=serve, daemon=True).start()
+    assert tcp_serial_redirect.take_slot(
+        slots.ser_to_net, slots.semaphore, ("new", 2), tcp_serial_redirect.TAKEOVER_NEWEST
+    )
+    assert slots.ser_to_net.takeovers == 1
+    theirs.settimeout(1)
+    assert theirs.recv(1) == b""
+    client.socket.close()
+    theirs.close()
+
+
+def test_take_slot_newest_not_freed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the new client is rejected instead of blocking the accept loop."""
+    monkeypatch.setattr(tcp_serial_redirect, "TAKEOVER_TIMEOUT", 0.1)
+    slots = _Slots(1)
+    slots.semaphore.acquire()
+    # a slot without client, e.g. the client is still being set up
+    assert not tcp_serial_redirect.take_slot(
+        slots.ser_to_net, slots.semaphore, ("new", 2), tcp_serial_redirect.TAKEOVER_NEWEST
+    )
+    assert slots.ser_to_net.takeovers == 0
+    assert slots.ser_to_net.rejects == 1
+
+
+def test_start_client_rejected() -> None:
+    """Test a rejected client is disconnected without being set up."""
+    slots = _Slots(1)
+    slots.semaphore.acquire()
+    ours, theirs = socket.socketpair()
+    args = types.SimpleNamespace(takeover=tcp_serial_redirect.TAKEOVER_REJECT)
+    tcp_serial_redirect.start_client(
+        ours, ("new", 2), slots.ser_to_net, None, slots.semaphore, args
+    )
+    assert slots.ser_to_net.rejects == 1
+    assert not slots.ser_to_net.clients
+    theirs.settimeout(1)
+    assert theirs.recv(1) == b""
+    theirs.close()
+
+
+def test_set_keepalive(socket_enabled) -> None:
+    """Test the keep-alive and user timeout options are set on the socket."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    args = types.SimpleNamespace(
+        keepalive_idle=7, keepalive_interval=2, keepalive_count=4, user_timeout=3000
+    )
+    tcp_serial_redirect.set_keepalive(sock, args)
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 7
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL) == 2
+    assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT) == 4
+    if hasattr(socket, "TCP_USER_TIMEOUT"):
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT) == 3000
+    sock.close()
+
+    # disabled
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    args.keepalive_idle = args.user_timeout = 0
+    tcp_serial_redirect.set_keepalive(sock, args)
+    assert not sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+    sock.close()
+
+
+def test_reopen_lost_port(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a lost port is opened again with the latest settings and gets the buffered data."""
+    protocol = _Protocol()
+    worker = tcp_serial_redirect.SerialReaderThread(
+        serial.serial_for_url("loop://", baudrate=115200),
+        lambda: protocol,
+        url="loop://",
+    )
+    serial_for_url = serial.serial_for_url
+
+    def reopen(url, *args, **kwargs):
+        ser = serial_for_url(url, *args, **kwargs)
+        open_port = ser.open
+
+        def open_changed() -> None:
+            # while the settings of the lost port are already copied
+            worker.configure_serial({"baudrate": 9600, "rts": False})
+            worker.write(b"during outage")
+            open_port()
+
+        ser.open = open_changed
+        return ser
+
+    monkeypatch.setattr(tcp_serial_redirect.serial, "serial_for_url", reopen)
+    worker.start()
+    try:
+        assert _wait_for(lambda: worker.online.is_set() and protocol.interrupted == 0)
+        lost = worker.serial
+
+        def read(size: int = 1) -> bytes:
+            raise serial.SerialException("device unplugged")
+
+        lost.read = read
+        lost.cancel_read()
+        assert _wait_for(lambda: protocol.resumed == 1)
+        assert protocol.interrupted == 1
+        assert worker.serial is not lost
+        assert worker.serial.baudrate == 9600
+        assert worker.serial.rts is False
+        assert _wait_for(lambda: protocol.received == b"during outage")
+
+        worker.write(b" and after")
+        assert _wait_for(lambda: protocol.received == b"during outage and after")
+    finally:
+        worker.stop()
+
+
+class _SpliceWorker(_SerialWorker):
+    """Serial worker with a file descriptor, for the splice path."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.fd = 1000
+        self.alive = True
+        self.online = threading.Event()
+        self.online.set()
+        self.write_lock = threading.Lock()
+        self.serial = self
+
+
+def test_splice_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test data already in the pipe is written and later data uses recv_into."""
+    splice = os.splice
+    serial_worker = _SpliceWorker()
+
+    def splice_to_serial(src: int, dst: int, count: int, *args) -> int:
+        if dst == serial_worker.fd:
+            raise OSError(errno.EINVAL, "Invalid argument")
+        return splice(src, dst, count, *args)
+
+    monkeypatch.setattr(os, "splice", splice_to_serial)
+    monkeypatch.setitem(tcp_serial_redirect.io_path, "net_to_serial", "splice")
+    ours, theirs = socket.socketpair()
+    client = tcp_serial_redirect.ClientConnection(
+        ours, ("test", 0), 65536, tcp_serial_redirect.SLOW_CLIENT_DROP_OLDEST
+    )
+    args = types.SimpleNamespace(
+        write_mode=tcp_serial_redirect.WRITE_MODE_IMMEDIATE,
+        low_latency=False,
+        recv_size=16,
+        coalesce_size=64,
+        coalesce_window=100,
+        develop=False,
+    )
+    theirs.sendall(b"first")
+    forwarder = threading.Thread(
+        target=tcp_serial_redirect.network_to_serial,
+        args=(client, serial_worker, args),
+        daemon=True,
+    )
+    forwarder.start()
+    assert _wait_for(lambda: serial_worker.writes)
+    theirs.sendall(b" second")
+    theirs.close()
+    forwarder.join(2)
+    client.close()
+
+    assert b"".join(serial_worker.writes) == b"first second"
+    assert tcp_serial_redirect.io_path["net_to_serial"] == "recv_into"
+
+
+def test_splice_stuck_serial_port(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a serial port that never gets writable does not keep the write lock."""
+    monkeypatch.setattr(tcp_serial_redirect, "BLOCK_TIMEOUT", 0.05)
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(write_fd, False)
+    # a full pipe takes no more data, like a tty with CTS held low
+    try:
+        while True:
+            os.write(write_fd, b"\0" * 65536)
+    except BlockingIOError:
+        pass
+    serial_worker = _SpliceWorker()
+    serial_worker.fd = write_fd
+    ours, theirs = socket.socketpair()
+    client = tcp_serial_redirect.ClientConnection(
+        ours, ("test", 0), 65536, tcp_serial_redirect.SLOW_CLIENT_DROP_OLDEST
+    )
+    theirs.sendall(b"stuck")
+    forwarder = threading.Thread(
+        target=tcp_serial_redirect.splice_network_to_serial,
+        args=(client, serial_worker, types.SimpleNamespace(low_latency=False)),
+        daemon=True,
+    )
+    forwarder.start()
+    time.sleep(0.2)
+    assert serial_worker.write_lock.acquire(timeout=1)
+    serial_worker.write_lock.release()
+
+    serial_worker.alive = False
+    assert _wait_for(lambda: serial_worker.writes == [b"stuck"])
+    theirs.close()
+    forwarder.join(2)
+    assert not forwarder.is_alive()
+    client.close()
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+class _FlowSerial:
+    """Serial port with flow control that keeps the signals to the device."""
+
+    def __init__(self, rtscts: bool = True, xonxoff: bool = False) -> None:
+        self.rtscts = rtscts
+        self.xonxoff = xonxoff
+        self.rts = True
+        self.cts = True
+        self.input_flow: list[bool] = []
+
+    def set_input_flow_control(self, enable: bool) -> None:
+        self.input_flow.append(enable)
+
+
+def _flow_control(ser: _FlowSerial) -> tcp_serial_redirect.FlowControl:
+    """Flow control with a high water mark of 100 and a low one of 20 bytes."""
+    online = threading.Event()
+    online.set()
+    serial_worker = types.SimpleNamespace(serial=ser, alive=True, online=online)
+    ser_to_net = types.SimpleNamespace(clients=[])
+    return tcp_serial_redirect.FlowControl(serial_worker, ser_to_net, 100, 20)
+
+
+def _queue(flow: tcp_serial_redirect.FlowControl, *queued: int) -> None:
+    """Clients with these queue lengths, then check."""
+    flow.ser_to_net.clients = [
+        types.SimpleNamespace(buffer=bytes(length)) for length in queued
+    ]
+    flow.check()
+
+
+def test_flow_control_rts() -> None:
+    """Test RTS is deasserted above the high water mark and asserted below the low one."""
+    ser = _FlowSerial()
+    flow = _flow_control(ser)
+    # the slowest client counts
+    _queue(flow, 10, 99)
+    assert not flow.paused
+    assert ser.rts
+
+    _queue(flow, 10, 100)
+    assert flow.paused
+    assert not flow.resumed.is_set()
+    assert not ser.rts
+    assert flow.pauses == 1
+
+    # between the marks nothing changes
+    _queue(flow, 50)
+    assert flow.paused
+    assert not ser.rts
+
+    _queue(flow, 20)
+    assert not flow.paused
+    assert flow.resumed.is_set()
+    assert ser.rts
+    assert flow.pause_time.count == 1
+
+    _queue(flow, 50)
+    assert not flow.paused
+    assert flow.pauses == 1
+
+
+def test_flow_control_xonxoff() -> None:
+    """Test XOFF and XON are sent with software flow control."""
+    ser = _FlowSerial(rtscts=False, xonxoff=True)
+    flow = _flow_control(ser)
+    _queue(flow, 200)
+    _queue(flow, 0)
+    assert ser.input_flow == [False, True]
+    assert ser.rts
+
+
+def test_flow_control_disabled() -> None:
+    """Test the device is not paused without flow control, and released when it is disabled."""
+    ser = _FlowSerial(rtscts=False)
+    flow = _flow_control(ser)
+    _queue(flow, 200)
+    assert not flow.paused
+
+    ser.rtscts = True
+    _queue(flow, 200)
+    assert flow.paused
+    # disabled by configure, released although the queue is still full
+    ser.rtscts = False
+    flow.check()
+    assert not flow.paused
+    assert ser.rts
+
+
+def test_flow_control_wait_for_cts() -> None:
+    """Test reading the clients waits while the device holds CTS low."""
+    ser = _FlowSerial()
+    flow = _flow_control(ser)
+    flow.wait_for_cts()
+    assert flow.cts_pauses == 0
+
+    ser.cts = False
+    threading.Timer(0.1, setattr, (ser, "cts", True)).start()
+    started = time.monotonic()
+    flow.wait_for_cts()
+    assert time.monotonic() - started >= 0.09
+    assert flow.cts_pauses == 1
+
+    # a lost port does not keep the clients waiting
+    ser.cts = False
+    flow.serial_worker.online.clear()
+    flow.wait_for_cts()
+    assert flow.cts_pauses == 2
+
+    # without RTS/CTS CTS is ignored
+    ser.rtscts = False
+    flow.wait_for_cts()
+    assert flow.cts_pauses == 2
+
+
+def test_metrics_port_is_local(socket_enabled) -> None:
+    """Test the metrics port only listens on the loopback interface by default."""
+    sock = tcp_serial_redirect.Listener._bind(
+        0, tcp_serial_redirect.DEFAULTS["metrics_bind"]
+    )
+    assert sock.getsockname()[0] == "127.0.0.1"
+    sock.close()
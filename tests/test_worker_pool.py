@@ -0,0 +1,179 @@
+"""Test distributing ports over the worker pool."""
+import asyncio
+import json
+import os
+import pathlib
+import signal
+import sys
+
+import pytest
+
+sys.path.insert(
+    0,
+    str(
+        pathlib.Path(__file__).parent.parent
+        / "custom_components"
+        / "network_serial_port"
+    ),
+)
+import worker_pool  # type: ignore  # noqa: E402
+
+
+class _Owner:
+    """Control connection that registered ports, keeps the events sent to it."""
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+
+    def is_closing(self) -> bool:
+        return False
+
+    def write(self, data: bytes) -> None:
+        self.events.append(json.loads(data))
+
+
+@pytest.fixture
+def supervisor(tmp_path: pathlib.Path, socket_enabled):
+    """A supervisor with two worker processes, the bridges listen on TCP."""
+    supervisor = worker_pool.Supervisor(str(tmp_path / "control.sock"), 2)
+    yield supervisor
+    for worker in supervisor._workers:
+        worker.conn.close()
+        worker.process.terminate()
+        worker.process.join(5)
+
+
+@pytest.fixture
+def ptys():
+    """Serial ports for the bridges."""
+    opened: list[int] = []
+
+    def open_pty() -> str:
+        controller, device = os.openpty()
+        opened.extend((controller, device))
+        return os.ttyname(device)
+
+    yield open_pty
+    for fd in opened:
+        os.close(fd)
+
+
+def _run(supervisor: worker_pool.Supervisor, test) -> None:
+    """Run a test coroutine with the worker events handled like in Supervisor.run."""
+
+    async def run() -> None:
+        loop = asyncio.get_running_loop()
+        for worker in supervisor._workers:
+            loop.add_reader(worker.conn.fileno(), supervisor._worker_event, worker)
+        try:
+            await test()
+        finally:
+            for worker in supervisor._workers:
+                loop.remove_reader(worker.conn.fileno())
+
+    asyncio.run(run())
+
+
+def _settings(url: str) -> dict:
+    return {"url": url, "localport": 0, "baudrate": 9600}
+
+
+def test_register_and_unregister(supervisor, ptys) -> None:
+    """Test ports are spread over the workers and removed again."""
+    owner = _Owner()
+
+    async def test() -> None:
+        await supervisor._register("first", _settings(ptys()), owner)
+        await supervisor._register("second", _settings(ptys()), owner)
+        assert [event["success"] for event in owner.events] == [True, True]
+        assert [worker.ports for worker in supervisor._workers] == [
+            {"first"},
+            {"second"},
+        ]
+
+        await supervisor._unregister("first")
+        assert list(supervisor._ports) == ["second"]
+        assert [worker.ports for worker in supervisor._workers] == [set(), {"second"}]
+
+    _run(supervisor, test)
+
+
+def test_register_failure(supervisor) -> None:
+    """Test a port that can not be opened is not kept."""
+    owner = _Owner()
+
+    async def test() -> None:
+        await supervisor._register("missing", _settings("/dev/does-not-exist"), owner)
+        assert owner.events[0]["success"] is False
+        assert not supervisor._ports
+        assert all(not worker.ports for worker in supervisor._workers)
+
+    _run(supervisor, test)
+
+
+def test_rebalance(supervisor, ptys) -> None:
+    """Test the port that evens out the load is moved to the idlest worker."""
+    owner = _Owner()
+    busiest, idlest = supervisor._workers
+
+    async def test() -> None:
+        for port_id, byte_rate in (("a", 30000), ("b", 20000), ("c", 5000)):
+            port = worker_pool._Port(port_id, _settings(ptys()), owner)
+            supervisor._ports[port_id] = port
+            assert (await supervisor._assign(port, busiest))["success"]
+            port.byte_rate = byte_rate
+
+        await supervisor._rebalance()
+        assert busiest.ports == {"b", "c"}
+        assert idlest.ports == {"a"}
+        assert supervisor._ports["a"].worker is idlest
+        # The statistics of the moved port count from 0 again
+        assert owner.events[-1] == {"event": "moved", "id": "a", "worker": 1}
+
+        # Balanced enough now, nothing moves
+        await supervisor._rebalance()
+        assert idlest.ports == {"a"}
+
+    _run(supervisor, test)
+
+
+def test_worker_timeout(supervisor, ptys, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a worker that does not respond is stopped and its ports are lost."""
+    monkeypatch.setattr(worker_pool, "ACK_TIMEOUT", 0.5)
+    owner = _Owner()
+    hanging, other = supervisor._workers
+
+    async def test() -> None:
+        await supervisor._register("first", _settings(ptys()), owner)
+        await supervisor._register("second", _settings(ptys()), owner)
+        await supervisor._register("third", _settings(ptys()), owner)
+        assert hanging.ports == {"first", "third"}
+
+        os.kill(hanging.process.pid, signal.SIGSTOP)
+        await supervisor._unregister("first")
+        assert supervisor._workers == [other]
+        assert not hanging.process.is_alive()
+        assert owner.events[-1] == {
+            "event": "serial_lost",
+            "id": "third",
+            "error": "Worker does not respond",
+        }
+        assert list(supervisor._ports) == ["second"]
+
+        # New ports go to the remaining worker
+        await supervisor._register("fourth", _settings(ptys()), owner)
+        assert other.ports == {"second", "fourth"}
+
+    _run(supervisor, test)
+
+
+def test_lock_control_socket(tmp_path: pathlib.Path) -> None:
+    """Test only one supervisor runs per control socket."""
+    path = str(tmp_path / "control.sock")
+    fd = worker_pool.lock_control_socket(path)
+    assert fd is not None
+    assert worker_pool.lock_control_socket(path) is None
+    os.close(fd)
+    fd = worker_pool.lock_control_socket(path)
+    assert fd is not None
+    os.close(fd)